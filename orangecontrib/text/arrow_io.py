@@ -0,0 +1,395 @@
+"""
+Conversion of Corpus to and from Apache Arrow tables, Parquet files and
+Arrow IPC (Feather) files.
+
+Variables are stored as columns: numeric variables as float64, discrete
+variables as dictionary-encoded strings and string variables as strings.
+Tokens and POS tags are stored as lists of dictionary-encoded strings, so
+they are written and read without creating a Python string per token.
+The domain (roles and types of variables), text features and other
+properties of the corpus are kept in the schema's metadata; tables without
+it (e.g. written by other tools) get a domain from Arrow types.
+
+pyarrow is an optional dependency, imported when a function is called.
+"""
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from Orange.data import (
+    ContinuousVariable,
+    DiscreteVariable,
+    Domain,
+    StringVariable,
+    TimeVariable,
+    Variable,
+)
+
+from orangecontrib.text.corpus import Corpus
+from orangecontrib.text.tokens import CompactTokens
+
+__all__ = ["corpus_to_arrow", "corpus_from_arrow", "write_parquet",
+           "read_parquet", "write_arrow_ipc", "read_arrow_ipc"]
+
+METADATA_KEY = b"orange3-text"
+TOKENS_COLUMN = "__tokens__"
+POS_TAGS_COLUMN = "__pos_tags__"
+PP_DOCUMENTS_COLUMN = "__pp_documents__"
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError as ex:
+        raise ImportError("Arrow and Parquet support requires pyarrow; "
+                          "install it with 'pip install pyarrow'") from ex
+    return pyarrow
+
+
+def _variable_type(var: Variable) -> str:
+    if var.is_discrete:
+        return "discrete"
+    if var.is_time:
+        return "time"
+    if var.is_continuous:
+        return "continuous"
+    return "string"
+
+
+def _variable_to_arrow(pa, var: Variable, values: np.ndarray):
+    if var.is_discrete:
+        values = values.astype(float)
+        missing = np.isnan(values)
+        indices = pa.array(np.where(missing, 0, values).astype(np.int32),
+                           mask=missing)
+        return pa.DictionaryArray.from_arrays(
+            indices, pa.array(list(var.values), pa.string()))
+    if var.is_primitive():
+        return pa.array(values.astype(float), pa.float64(), from_pandas=True)
+    return pa.array(values, pa.string(), from_pandas=True)
+
+
+def _tokens_to_arrow(pa, tokens):
+    if not isinstance(tokens, CompactTokens):
+        tokens = CompactTokens.from_lists(tokens)
+    start, end = tokens.offsets[0], tokens.offsets[-1]
+    words = pa.DictionaryArray.from_arrays(
+        pa.array(tokens.ids[start:end], pa.int32()),
+        pa.array(tokens.vocabulary.tolist(), pa.string()))
+    return pa.LargeListArray.from_arrays(
+        pa.array(tokens.offsets - start, pa.int64()), words)
+
+
+def corpus_to_arrow(corpus: Corpus):
+    """
+    Convert the corpus to a pyarrow.Table.
+
+    Parameters
+    ----------
+    corpus
+        Corpus to convert.
+
+    Returns
+    -------
+    pyarrow.Table with a column for each variable and, when the corpus is
+    preprocessed, for tokens, POS tags and preprocessed documents.
+    """
+    pa = _pyarrow()
+    domain = corpus.domain
+    names, columns, variables = [], [], []
+    for role, part in (("attribute", domain.attributes),
+                       ("class", domain.class_vars),
+                       ("meta", domain.metas)):
+        for var in part:
+            names.append(var.name)
+            columns.append(_variable_to_arrow(pa, var, corpus.get_column(var)))
+            description = {"name": var.name, "role": role,
+                           "type": _variable_type(var),
+                           "attributes": var.attributes}
+            if var.is_discrete:
+                description["values"] = list(var.values)
+            if var.is_time:
+                description["have_date"] = var.have_date
+                description["have_time"] = var.have_time
+            variables.append(description)
+
+    if corpus.has_tokens():
+        names.append(TOKENS_COLUMN)
+        columns.append(_tokens_to_arrow(pa, corpus.tokens))
+        if corpus.pos_tags is not None:
+            names.append(POS_TAGS_COLUMN)
+            columns.append(_tokens_to_arrow(pa, corpus.pos_tags))
+        documents = corpus._transformed_documents()
+        if documents is not None:
+            names.append(PP_DOCUMENTS_COLUMN)
+            columns.append(pa.array(documents, pa.string()))
+
+    info = {
+        "version": 1,
+        "variables": variables,
+        "text_features": [var.name for var in corpus.text_features],
+        "name": corpus.name,
+        "language": corpus.language,
+        "ngram_range": list(corpus.ngram_range),
+        "compact_tokens": corpus.compact_tokens,
+    }
+    metadata = {METADATA_KEY: json.dumps(info, default=str).encode("utf-8")}
+    return pa.table(columns, names=names, metadata=metadata)
+
+
+def _variable_from_arrow(pa, name: str, type_) -> Tuple[Variable, str]:
+    """ Variable and its role for a column without Orange's metadata """
+    types = pa.types
+    if types.is_dictionary(type_):
+        return DiscreteVariable(name), "attribute"
+    if types.is_timestamp(type_) or types.is_date(type_):
+        return TimeVariable(name, have_date=True,
+                            have_time=types.is_timestamp(type_)), "attribute"
+    if types.is_integer(type_) or types.is_floating(type_) \
+            or types.is_decimal(type_) or types.is_boolean(type_):
+        return ContinuousVariable(name), "attribute"
+    return StringVariable(name), "meta"
+
+
+def _variable_from_description(description: Dict) -> Tuple[Variable, str]:
+    name, type_ = description["name"], description["type"]
+    if type_ == "discrete":
+        var = DiscreteVariable(name, values=description["values"])
+    elif type_ == "time":
+        var = TimeVariable(name, have_date=description["have_date"],
+                           have_time=description["have_time"])
+    elif type_ == "continuous":
+        var = ContinuousVariable(name)
+    else:
+        var = StringVariable(name)
+    var.attributes.update(description.get("attributes", {}))
+    return var, description["role"]
+
+
+def _discrete_codes(pa, var: DiscreteVariable, column) -> np.ndarray:
+    """ Codes of values; each distinct value is looked up only once """
+    codes = []
+    for chunk in column.chunks:
+        if not pa.types.is_dictionary(chunk.type):
+            chunk = pa.compute.dictionary_encode(chunk.cast(pa.string()))
+        mapping = np.array([var.to_val(var.val_from_str_add(value))
+                            if value is not None else np.nan
+                            for value in chunk.dictionary.cast(pa.string()).to_pylist()]
+                           + [np.nan])
+        indices = chunk.indices.fill_null(len(mapping) - 1)
+        codes.append(mapping[indices.to_numpy(zero_copy_only=False)])
+    return np.concatenate(codes) if codes else np.empty(0)
+
+
+def _column_from_arrow(pa, var: Variable, column) -> np.ndarray:
+    if var.is_discrete:
+        return _discrete_codes(pa, var, column)
+    if var.is_time and (pa.types.is_timestamp(column.type)
+                        or pa.types.is_date(column.type)):
+        seconds = column.cast(pa.timestamp("us")).cast(pa.int64())
+        return seconds.to_numpy(zero_copy_only=False).astype(float) / 1e6
+    if var.is_primitive():
+        return column.cast(pa.float64()).to_numpy(zero_copy_only=False)
+    if not (pa.types.is_string(column.type) or pa.types.is_large_string(column.type)):
+        try:
+            column = column.cast(pa.string())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # nested values are kept as JSON
+            return np.array([json.dumps(value, default=str)
+                             for value in column.to_pylist()], dtype=object)
+    # conversion to Python strings is done by pyarrow, not per row in Python
+    return pa.compute.fill_null(column, "").to_numpy(zero_copy_only=False)
+
+
+def _tokens_from_arrow(pa, column) -> CompactTokens:
+    parts = []
+    # e.g. row groups without rows that match filters
+    for chunk in (chunk for chunk in column.chunks if len(chunk)):
+        offsets = chunk.offsets.to_numpy().astype(np.int64)
+        words = chunk.values.slice(offsets[0], offsets[-1] - offsets[0])
+        if not pa.types.is_dictionary(words.type):
+            words = pa.compute.dictionary_encode(words)
+        # ids are shared with Arrow's buffer when possible
+        ids = words.indices.to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+        vocabulary = np.empty(len(words.dictionary), dtype=object)
+        vocabulary[:] = words.dictionary.to_pylist()
+        parts.append(CompactTokens(ids, offsets - offsets[0], vocabulary))
+    if len(parts) == 1:
+        return parts[0]
+    return CompactTokens.concatenate(parts)
+
+
+def corpus_from_arrow(table, text_features: Optional[Sequence[str]] = None) -> Corpus:
+    """
+    Convert a pyarrow.Table to a corpus.
+
+    Parameters
+    ----------
+    table
+        A table, written with corpus_to_arrow or by other tools.
+    text_features
+        Names of columns used as text features; if None, text features
+        stored in the table's metadata are used, or the first string column.
+
+    Returns
+    -------
+    Corpus.
+    """
+    pa = _pyarrow()
+    metadata = table.schema.metadata or {}
+    info = json.loads(metadata[METADATA_KEY]) if METADATA_KEY in metadata else {}
+    columns = set(table.column_names)
+    if info:
+        variables = [_variable_from_description(d) for d in info["variables"]
+                     if d["name"] in columns]
+    else:
+        reserved = {TOKENS_COLUMN, POS_TAGS_COLUMN, PP_DOCUMENTS_COLUMN}
+        variables = [_variable_from_arrow(pa, field.name, field.type)
+                     for field in table.schema if field.name not in reserved]
+
+    roles: Dict[str, List[Variable]] = {"attribute": [], "class": [], "meta": []}
+    for var, role in variables:
+        roles[role].append(var)
+    domain = Domain(roles["attribute"], roles["class"], roles["meta"])
+
+    def array(part, dtype=float):
+        result = np.empty((table.num_rows, len(part)), dtype=dtype)
+        for j, var in enumerate(part):
+            result[:, j] = _column_from_arrow(pa, var, table.column(var.name))
+        return result
+
+    if text_features is None:
+        text_features = info.get("text_features")
+    if text_features is not None:
+        text_features = [domain[name] for name in text_features if name in domain]
+    corpus = Corpus.from_numpy(
+        domain,
+        array(domain.attributes),
+        array(domain.class_vars),
+        array(domain.metas, dtype=object),
+        text_features=text_features or None,
+        language=info.get("language"),
+    )
+    if info.get("name"):
+        corpus.name = info["name"]
+    corpus.ngram_range = tuple(info.get("ngram_range", (1, 1)))
+
+    if TOKENS_COLUMN in columns:
+        corpus.compact_tokens = True
+        corpus.store_tokens(_tokens_from_arrow(pa, table.column(TOKENS_COLUMN)))
+        if POS_TAGS_COLUMN in columns:
+            corpus.pos_tags = _tokens_from_arrow(pa, table.column(POS_TAGS_COLUMN))
+        if PP_DOCUMENTS_COLUMN in columns:
+            corpus.pp_documents = table.column(PP_DOCUMENTS_COLUMN).to_pylist()
+        corpus.compact_tokens = info.get("compact_tokens", True)
+    return corpus
+
+
+def write_parquet(corpus: Corpus, path: str, row_group_size: Optional[int] = None,
+                  compression: str = "snappy") -> None:
+    """
+    Write the corpus to a Parquet file.
+
+    Parameters
+    ----------
+    corpus
+        Corpus to write.
+    path
+        Path of the file.
+    row_group_size
+        Maximal number of documents in a row group; row groups can be read
+        separately with read_parquet.
+    compression
+        Compression codec.
+    """
+    _pyarrow()
+    import pyarrow.parquet as pq
+    pq.write_table(corpus_to_arrow(corpus), path,
+                   row_group_size=row_group_size, compression=compression)
+
+
+def read_parquet(path: str, columns: Optional[List[str]] = None,
+                 row_groups: Optional[List[int]] = None, filters=None,
+                 text_features: Optional[Sequence[str]] = None) -> Corpus:
+    """
+    Read a corpus from a Parquet file.
+
+    Parameters
+    ----------
+    path
+        Path of the file.
+    columns
+        Names of columns to read; all if None.
+    row_groups
+        Indices of row groups to read; all if None.
+    filters
+        Row filters (see pyarrow.parquet.read_table); cannot be combined
+        with row_groups.
+    text_features
+        Names of columns used as text features (see corpus_from_arrow).
+
+    Returns
+    -------
+    Corpus.
+    """
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+    if row_groups is not None:
+        if filters is not None:
+            raise ValueError("Filters and row groups cannot be combined")
+        # read_row_groups cannot combine nested columns (tokens) of several
+        # row groups, so they are read separately and kept as chunks
+        file = pq.ParquetFile(path)
+        tables = [file.read_row_group(i, columns=columns) for i in row_groups]
+        if not tables:
+            tables = [file.schema_arrow.empty_table()]
+            if columns is not None:
+                tables = [tables[0].select(columns)]
+        table = pa.concat_tables(tables)
+    else:
+        table = pq.read_table(path, columns=columns, filters=filters)
+    return corpus_from_arrow(table, text_features=text_features)
+
+
+def write_arrow_ipc(corpus: Corpus, path: str) -> None:
+    """
+    Write the corpus to an Arrow IPC (Feather version 2) file.
+
+    Parameters
+    ----------
+    corpus
+        Corpus to write.
+    path
+        Path of the file.
+    """
+    pa = _pyarrow()
+    table = corpus_to_arrow(corpus)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_arrow_ipc(path: str, memory_map: bool = True,
+                   text_features: Optional[Sequence[str]] = None) -> Corpus:
+    """
+    Read a corpus from an Arrow IPC (Feather version 2) file.
+
+    Parameters
+    ----------
+    path
+        Path of the file.
+    memory_map
+        Memory-map the file; ids of tokens then stay in the mapped file.
+    text_features
+        Names of columns used as text features (see corpus_from_arrow).
+
+    Returns
+    -------
+    Corpus.
+    """
+    pa = _pyarrow()
+    source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+    with source:
+        table = pa.ipc.open_file(source).read_all()
+        return corpus_from_arrow(table, text_features=text_features)
@@ -1,9 +1,10 @@
 import os
 from collections import Counter, defaultdict
+from contextlib import contextmanager
 from copy import copy
 from numbers import Integral
 from itertools import chain
-from typing import Union, Optional, List, Tuple, Dict
+from typing import Any, Union, Optional, List, Tuple, Dict, Callable
 from warnings import warn
 
 import nltk
@@ -19,10 +20,12 @@ from Orange.data import (
 )
 from Orange.preprocess.transformation import Identity
 from Orange.data.util import get_unique_names
+from Orange.util import dummy_callback
 from orangewidget.utils.signals import summarize, PartialSummary
 import scipy.sparse as sp
 
 from orangecontrib.text.language import ISO2LANG
+from orangecontrib.text.tokens import CompactTokens
 
 
 def get_sample_corpora_dir():
@@ -43,6 +46,69 @@ def _check_arrays(*arrays):
     return lengths.pop() if len(lengths) else 0
 
 
+def _column_from_documents(
+        var: Variable, getter: Callable, documents: List
+) -> Union[np.ndarray, List]:
+    """
+    Values of a variable obtained from documents by the getter. Strings of
+    a discrete variable are encoded once per distinct value (new values are
+    added to the variable in order of appearance); other columns of the
+    expected type are taken as they are. Columns with values of other types
+    are converted value by value.
+    """
+    values = [getter(doc) for doc in documents]
+    types = set(map(type, values))
+    if isinstance(var, DiscreteVariable) and types <= {str}:
+        distinct, first, inverse = np.unique(
+            np.array(values, dtype=object), return_index=True, return_inverse=True)
+        codes = np.empty(len(distinct))
+        for i in np.argsort(first, kind="stable"):
+            var.val_from_str_add(distinct[i])
+            codes[i] = var.to_val(distinct[i])
+        return codes[inverse.reshape(-1)]
+    if isinstance(var, StringVariable) and types <= {str}:
+        return values
+    if isinstance(var, ContinuousVariable) and types <= {float, int, bool}:
+        return np.array(values, dtype=float)
+
+    def to_val(val):
+        if isinstance(var, DiscreteVariable):
+            var.val_from_str_add(val)
+        return var.to_val(val)
+
+    return [to_val(val) for val in values]
+
+
+def columns_from_documents(
+        documents: List, columns: List[Tuple[Variable, Callable]], dtype=float
+) -> np.ndarray:
+    """
+    Build a 2d array with a column of values for each pair of variable and
+    getter (see :obj:`Corpus.from_documents`), one column at a time.
+    """
+    array = np.empty((len(documents), len(columns)), dtype=dtype)
+    for j, (var, getter) in enumerate(columns):
+        array[:, j] = _column_from_documents(var, getter, documents)
+    return array
+
+
+class _DocumentsCache:
+    """
+    Documents joined from text features (a tuple of variables). It is
+    replaced and never modified, so copies of a corpus can share it. It is
+    not pickled, to not store texts twice.
+    """
+    def __init__(self, features: Tuple = (), documents: Optional[List[str]] = None):
+        self.features = features
+        self.documents = documents
+
+    def get(self, features: Tuple) -> Optional[List[str]]:
+        return self.documents if self.features == features else None
+
+    def __reduce__(self):
+        return _DocumentsCache, ()
+
+
 class Corpus(Table):
     """Internal class for storing a corpus."""
     NGRAMS_SEPARATOR = " "
@@ -80,10 +146,20 @@ class Corpus(Table):
         self._tokens = None
         self.ngram_range = (1, 1)
         self._pos_tags = None
+        self._compact_tokens = False
         from orangecontrib.text.preprocess import PreprocessorList
         self.__used_preprocessor = PreprocessorList([])   # required for compute values
+        # titles, numbers of documents (when there is no title feature) or
+        # None when titles are not computed from title features yet
         self._titles: Optional[np.ndarray] = None
+        # source corpus and its rows whose titles are titles of this corpus,
+        # kept until titles are needed so they are unique in the source
+        self._titles_rows: Optional[Tuple["Corpus", Any]] = None
+        self._title_features: List[Variable] = []
         self._pp_documents = None  # preprocessed documents
+        self._documents_cache = _DocumentsCache()
+        # transformers not yet applied to preprocessed documents
+        self._pending_transforms = ()
 
         if text_features is None:
             self._infer_text_features()
@@ -159,6 +235,7 @@ class Corpus(Table):
                 # to invalidate tokens
                 self.text_features = feats
                 self._tokens = None  # invalidate tokens
+                self._documents_cache = _DocumentsCache()
         else:
             self._infer_text_features()
 
@@ -184,23 +261,47 @@ class Corpus(Table):
 
     def _set_unique_titles(self):
         """
-        Define self._titles variable as a list of titles (a title for each
-        document). It is used to have an unique title for each document. In
-        case when the document have the same title as the other document we
-        put a number beside.
+        Define titles of documents. It is used to have an unique title for
+        each document. In case when the document have the same title as the
+        other document we put a number beside. Titles are computed when
+        they are first needed; without title features, only numbers of
+        documents are kept until then.
         """
         if self.domain is None:
             return
-        attrs = [attr for attr in
-                 chain(self.domain.variables, self.domain.metas)
-                 if attr.attributes.get('title', False)]
+        self._titles_rows = None
+        self._title_features = [
+            attr for attr in chain(self.domain.variables, self.domain.metas)
+            if attr.attributes.get('title', False)]
+
+        if self._title_features:
+            self._titles = None
+        else:
+            self._titles = np.arange(1, len(self) + 1)
+
+    def _title_values(self) -> np.ndarray:
+        """ Titles or, without title features, numbers of documents """
+        if self._titles is None:
+            if not hasattr(self, "_title_features"):  # unpickled corpus
+                self._set_unique_titles()
+                return self._title_values()
+            if self._titles_rows is not None:
+                source, rows = self._titles_rows
+                self._titles = source._title_values()[rows]
+                self._titles_rows = None
+            else:
+                self._titles = np.array(self._unique_titles(
+                    self.documents_from_features(self._title_features)))
+        return self._titles
 
-        if attrs:
-            self._titles = np.array(self._unique_titles(
-                self.documents_from_features(attrs)))
+    def _take_titles(self, source: "Corpus", rows):
+        """ Use titles of source's rows; defer them when not computed yet """
+        if isinstance(rows, Integral):
+            rows = [rows]
+        if source._titles is not None:
+            self._titles, self._titles_rows = source._titles[rows], None
         else:
-            self._titles = np.array([
-                'Document {}'.format(i + 1) for i in range(len(self))])
+            self._titles, self._titles_rows = None, (source, rows)
 
     @staticmethod
     def _unique_titles(titles: List[str]) -> List[str]:
@@ -336,23 +437,72 @@ class Corpus(Table):
     @property
     def documents(self):
         """ Returns a list of strings representing documents — created
-        by joining selected text features. """
-        return self.documents_from_features(self.text_features)
+        by joining selected text features. The list is computed once for
+        the text features and must not be modified. """
+        features = tuple(self.text_features)
+        documents = self._documents_cache.get(features)
+        if documents is None:
+            documents = self.documents_from_features(self.text_features)
+            self._documents_cache = _DocumentsCache(features, documents)
+        return documents
+
+    @contextmanager
+    def unlocked(self, *parts):
+        with super().unlocked(*parts) as table:
+            try:
+                yield table
+            finally:
+                # texts may have been changed
+                self._documents_cache = _DocumentsCache()
+
+    @contextmanager
+    def unlocked_reference(self, *parts):
+        with super().unlocked_reference(*parts) as table:
+            try:
+                yield table
+            finally:
+                self._documents_cache = _DocumentsCache()
 
     @property
     def pp_documents(self):
         """ Preprocessed documents (transformed). """
+        if self._pending_transforms:
+            documents = self._pp_documents or self.documents
+            for transformer in self._pending_transforms:
+                with transformer._prepared():
+                    documents = transformer._transform_strings(
+                        documents, dummy_callback)
+            self._pp_documents = documents
+            self._pending_transforms = ()
         return self._pp_documents or self.documents
 
     @pp_documents.setter
     def pp_documents(self, documents):
         self._pp_documents = documents
+        self._pending_transforms = ()
+
+    def defer_transform(self, transformer) -> None:
+        """
+        Transform preprocessed documents with the transformer only when
+        they are needed. Transformers applied to a tokenized corpus use it
+        to not transform documents that are usually not used anymore.
+        """
+        self._pending_transforms += (transformer,)
+
+    def _transformed_documents(self) -> Optional[List[str]]:
+        """ Preprocessed documents or None if documents were not transformed """
+        if self._pending_transforms:
+            return self.pp_documents
+        return self._pp_documents
 
     @property
     def titles(self):
         """ Returns a list of titles. """
-        assert self._titles is not None
-        return self._titles
+        titles = self._title_values()
+        if titles.dtype.kind in "iu":
+            titles = np.array(['Document {}'.format(i) for i in titles])
+            self._titles = titles
+        return titles
 
     @property
     def language(self):
@@ -362,6 +512,20 @@ class Corpus(Table):
         super().__setstate__(state)
         if "language" not in self.attributes:
             self.attributes["language"] = None
+        if not hasattr(self, "_compact_tokens"):
+            self._compact_tokens = False
+        if not hasattr(self, "_pending_transforms"):
+            self._pending_transforms = ()
+        if not hasattr(self, "_documents_cache"):
+            self._documents_cache = _DocumentsCache()
+        if not hasattr(self, "_titles_rows"):
+            self._titles_rows = None
+
+    def __getstate__(self):
+        if self._titles_rows is not None:
+            # do not pickle the source corpus
+            self._title_values()
+        return super().__getstate__()
 
     def documents_from_features(self, feats):
         """
@@ -370,6 +534,16 @@ class Corpus(Table):
 
         Returns: a list of strings constructed by joining feats.
         """
+        if len(feats) == 1 and isinstance(feats[0], StringVariable) \
+                and feats[0] in self.domain.metas and not sp.issparse(self.metas):
+            # a single string column needs no joining
+            column = self.metas[:, self.domain.metas.index(feats[0])]
+            documents = column.tolist()
+            if set(map(type, documents)) <= {str}:
+                for i in np.flatnonzero(column == ""):
+                    documents[i] = StringVariable.str_val("")
+                return documents
+
         # create a Table where feats are in metas
         data = Table.from_table(Domain([], [], [i.name for i in feats],
                                        source=self.domain), self)
@@ -389,7 +563,43 @@ class Corpus(Table):
         tokens
             List of lists containing tokens.
         """
-        self._tokens = np.array(tokens, dtype=object)
+        if self._compact_tokens:
+            self._tokens = self.__to_compact(tokens)
+        else:
+            self._tokens = self.__from_compact(tokens)
+
+    @property
+    def compact_tokens(self) -> bool:
+        """
+        bool: Whether tokens and POS tags are stored as CompactTokens -
+        vocabulary indices in a flat array - instead of an array of lists.
+        Compact storage takes a fraction of memory for large corpora; tokens
+        and tags already present are converted when the value changes.
+        """
+        return self._compact_tokens
+
+    @compact_tokens.setter
+    def compact_tokens(self, compact: bool):
+        if compact == self._compact_tokens:
+            return
+        self._compact_tokens = compact
+        convert = self.__to_compact if compact else self.__from_compact
+        if self._tokens is not None:
+            self._tokens = convert(self._tokens)
+        if self._pos_tags is not None:
+            self._pos_tags = convert(self._pos_tags)
+
+    @staticmethod
+    def __to_compact(tokens) -> CompactTokens:
+        if isinstance(tokens, CompactTokens):
+            return tokens
+        return CompactTokens.from_lists(tokens)
+
+    @staticmethod
+    def __from_compact(tokens) -> np.ndarray:
+        if isinstance(tokens, CompactTokens):
+            tokens = tokens.tolist()
+        return np.array(tokens, dtype=object)
 
     @property
     def tokens(self):
@@ -422,10 +632,15 @@ class Corpus(Table):
         """
         if self._pos_tags is None:
             return None
+        if isinstance(self._pos_tags, CompactTokens):
+            return self._pos_tags
         return np.array(self._pos_tags, dtype=object)
 
     @pos_tags.setter
     def pos_tags(self, pos_tags):
+        if pos_tags is not None:
+            pos_tags = self.__to_compact(pos_tags) if self._compact_tokens \
+                else self.__from_compact(pos_tags)
         self._pos_tags = pos_tags
 
     def ngrams_iterator(self, join_with=NGRAMS_SEPARATOR, include_postags=False):
@@ -437,6 +652,9 @@ class Corpus(Table):
         else:
             data = self.tokens
 
+        if join_with is not None and isinstance(self._tokens, CompactTokens):
+            return self.__compact_ngrams(join_with, include_postags)
+
         if join_with is None:
             processor = lambda doc, n: nltk.ngrams(doc, n)
         elif include_postags:
@@ -449,12 +667,41 @@ class Corpus(Table):
                 for n in range(self.ngram_range[0], self.ngram_range[1]+1))))
                 for doc in data)
 
+    def __compact_ngrams(self, join_with, include_postags):
+        """
+        Ngrams of compact tokens; documents' tokens are joined into ngrams
+        element-wise on arrays of strings instead of by nltk's ngrams
+        """
+        tokens = self._tokens
+        words = tokens.vocabulary
+        if include_postags:
+            tags = self.pos_tags
+            words = words[tokens.ids] + "_" + tags.vocabulary[tags.ids]
+        else:
+            words = words[tokens.ids]
+        low, high = self.ngram_range
+        for s, e in zip(tokens.offsets[:-1], tokens.offsets[1:]):
+            doc = words[s:e]
+            ngrams = []
+            for n in range(low, high + 1):
+                if n > len(doc):
+                    break
+                grams = doc[:len(doc) - n + 1]
+                for i in range(1, n):
+                    grams = grams + join_with + doc[i:len(doc) - n + 1 + i]
+                ngrams.extend(grams.tolist())
+            yield ngrams
+
     def count_tokens(self) -> int:
         """Count number of all (non-unique) tokens in the corpus"""
+        if isinstance(self._tokens, CompactTokens):
+            return len(self._tokens.ids)
         return sum(map(len, self.tokens))
 
     def count_unique_tokens(self) -> int:
         """Count number of all (unique) tokens in the corpus"""
+        if isinstance(self._tokens, CompactTokens):
+            return self._tokens.count_unique()
         # it seems to be fast enough even datasets very large dataset, so I
         # would avoid caching to prevetnt potential problems connected to that
         return len({tk for lst in self.tokens for tk in lst})
@@ -470,12 +717,17 @@ class Corpus(Table):
         c._setup_corpus(text_features=copy(self.text_features))
         # since tokens are considered immutable copies are not needed
         c._tokens = self._tokens
+        c._compact_tokens = self._compact_tokens
         c.ngram_range = self.ngram_range
-        c.pos_tags = self.pos_tags
+        c._pos_tags = self._pos_tags
         c.name = self.name
         c.used_preprocessor = self.used_preprocessor
         c._titles = self._titles
+        c._titles_rows = self._titles_rows
+        c._title_features = self._title_features
         c._pp_documents = self._pp_documents
+        c._pending_transforms = self._pending_transforms
+        c._documents_cache = self._documents_cache
         return c
 
     @staticmethod
@@ -509,22 +761,9 @@ class Corpus(Table):
         for ind in title_indices:
             domain[ind].attributes['title'] = True
 
-        def to_val(attr, val):
-            if isinstance(attr, DiscreteVariable):
-                attr.val_from_str_add(val)
-            return attr.to_val(val)
-
-        if documents:
-            X = np.array([[to_val(attr, func(doc)) for attr, func in attributes]
-                          for doc in documents], dtype=np.float64)
-            Y = np.array([[to_val(attr, func(doc)) for attr, func in class_vars]
-                          for doc in documents], dtype=np.float64)
-            metas = np.array([[to_val(attr, func(doc)) for attr, func in metas]
-                              for doc in documents], dtype=object)
-        else:   # assure shapes match the number of columns
-            X = np.empty((0, len(attributes)))
-            Y = np.empty((0, len(class_vars)))
-            metas = np.empty((0, len(metas)))
+        X = columns_from_documents(documents, attributes)
+        Y = columns_from_documents(documents, class_vars)
+        metas = columns_from_documents(documents, metas, dtype=object)
 
         corpus = Corpus.from_numpy(
             domain=domain, X=X, Y=Y, metas=metas, text_features=[]
@@ -584,7 +823,7 @@ class Corpus(Table):
         c._setup_corpus()
         if hasattr(source, "_titles"):
             # covering case when from_table_rows called by from_table
-            c._titles = source._titles[row_indices]
+            c._take_titles(source, row_indices)
         return c
 
     @classmethod
@@ -605,6 +844,127 @@ class Corpus(Table):
             table.name = name
         return table
 
+    @classmethod
+    def iter_chunks(cls, path: str, chunk_size: int = 10000, **kwargs):
+        """
+        Read a large JSON lines, CSV or TSV file in chunks of documents; see
+        orangecontrib.text.streaming.iter_chunks for arguments.
+
+        Returns:
+            Iterator over corpora that share the domain.
+        """
+        from orangecontrib.text.streaming import iter_chunks
+        return iter_chunks(path, chunk_size=chunk_size, **kwargs)
+
+    @classmethod
+    def concatenate_chunks(cls, chunks) -> "Corpus":
+        """
+        Concatenate chunks from iter_chunks (possibly preprocessed) into a
+        single corpus.
+
+        Args:
+            chunks (Iterable[Corpus]): Corpora with equal domains.
+
+        Returns:
+            Corpus.
+        """
+        from orangecontrib.text.streaming import concatenate_chunks
+        return concatenate_chunks(chunks)
+
+    def save_snapshot(self, path: str) -> None:
+        """
+        Save the corpus to a binary snapshot file, which is opened with
+        open_snapshot without unpickling tokens and data.
+
+        Args:
+            path (str): Path of the file.
+        """
+        from orangecontrib.text.snapshot import save_snapshot
+        save_snapshot(self, path)
+
+    @classmethod
+    def open_snapshot(cls, path: str, mmap: bool = True) -> "Corpus":
+        """
+        Open a corpus saved with save_snapshot.
+
+        Args:
+            path (str): Path of the file.
+            mmap (bool): Memory-map arrays, tokens and POS tags instead of
+                reading them into memory.
+
+        Returns:
+            Corpus.
+        """
+        from orangecontrib.text.snapshot import open_snapshot
+        return open_snapshot(path, mmap=mmap)
+
+    def to_parquet(self, path: str, **kwargs) -> None:
+        """
+        Write the corpus (with tokens and POS tags) to a Parquet file; see
+        orangecontrib.text.arrow_io.write_parquet for arguments. Requires
+        pyarrow.
+
+        Args:
+            path (str): Path of the file.
+        """
+        from orangecontrib.text.arrow_io import write_parquet
+        write_parquet(self, path, **kwargs)
+
+    @classmethod
+    def from_parquet(cls, path: str, **kwargs) -> "Corpus":
+        """
+        Read a corpus from a Parquet file, possibly only some columns or row
+        groups; see orangecontrib.text.arrow_io.read_parquet for arguments.
+        Requires pyarrow.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            Corpus.
+        """
+        from orangecontrib.text.arrow_io import read_parquet
+        return read_parquet(path, **kwargs)
+
+    def to_arrow_ipc(self, path: str) -> None:
+        """
+        Write the corpus to an Arrow IPC (Feather) file. Requires pyarrow.
+
+        Args:
+            path (str): Path of the file.
+        """
+        from orangecontrib.text.arrow_io import write_arrow_ipc
+        write_arrow_ipc(self, path)
+
+    @classmethod
+    def from_arrow_ipc(cls, path: str, **kwargs) -> "Corpus":
+        """
+        Read a corpus from an Arrow IPC (Feather) file; see
+        orangecontrib.text.arrow_io.read_arrow_ipc for arguments. Requires
+        pyarrow.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            Corpus.
+        """
+        from orangecontrib.text.arrow_io import read_arrow_ipc
+        return read_arrow_ipc(path, **kwargs)
+
+    @staticmethod
+    def __take(documents: List[str], key) -> List[str]:
+        """ Documents of rows selected by key """
+        if key is Ellipsis:
+            return documents
+        if isinstance(key, Integral):
+            return [documents[key]]
+        if isinstance(key, slice):
+            return documents[key]
+        array = np.empty(len(documents), dtype=object)
+        array[:] = documents
+        return array[key].tolist()
+
     @staticmethod
     def retain_preprocessing(orig, new, key=...):
         """ Set preprocessing of 'new' object to match the 'orig' object. """
@@ -612,7 +972,20 @@ class Corpus(Table):
             if isinstance(key, tuple):  # get row selection
                 key = key[0]
 
-            if orig._tokens is not None:  # retain preprocessing
+            if isinstance(new, Corpus):
+                new._compact_tokens = orig._compact_tokens
+            if isinstance(orig._tokens, CompactTokens):
+                # compact tokens are immutable and indexing never copies strings
+                rows = [key] if isinstance(key, Integral) else key
+                if rows is Ellipsis:
+                    new._tokens, new._pos_tags = orig._tokens, orig._pos_tags
+                elif isinstance(rows, (list, np.ndarray, slice, range)):
+                    new._tokens = orig._tokens[rows]
+                    new._pos_tags = None if orig._pos_tags is None \
+                        else orig._pos_tags[rows]
+                else:
+                    raise TypeError('Indexing by type {} not supported.'.format(type(key)))
+            elif orig._tokens is not None:  # retain preprocessing
                 if isinstance(key, Integral):
                     new._tokens = np.array([orig._tokens[key]])
                     new.pos_tags = None if orig.pos_tags is None else np.array(
@@ -641,7 +1014,14 @@ class Corpus(Table):
                     if tf in set(new.domain.metas)
                 ]
 
-            new._titles = orig._titles[key]
+            if isinstance(new, Corpus) and orig._documents_cache.documents is not None:
+                new._documents_cache = _DocumentsCache(
+                    orig._documents_cache.features,
+                    Corpus.__take(orig._documents_cache.documents, key))
+            if isinstance(new, Corpus):
+                new._take_titles(orig, key)
+            else:
+                new._titles = orig._title_values()[key]
             new.ngram_range = orig.ngram_range
             new.used_preprocessor = orig.used_preprocessor
         else:  # orig is not Corpus
@@ -1,10 +1,10 @@
-from collections import defaultdict
 from typing import Optional, Callable
 import numpy as np
 from scipy.sparse import csr_matrix
 
 from Orange.data import Domain, ContinuousVariable, Table, StringVariable
 from orangecontrib.text import Corpus
+from orangecontrib.text.tokens import CompactTokens
 from orangecontrib.network import Network
 
 
@@ -17,12 +17,16 @@ class CorpusToNetwork:
     corpus: Corpus
         Corpus on which the operations are performed.
     """
+    # maximal number of document pairs in one block of the document matrix
+    BLOCK_PAIRS = 2 ** 24
 
     def __init__(self, corpus: Corpus) -> None:
         if not isinstance(corpus, Corpus):
             raise ValueError("Given parameter must be instance of Corpus.")
         self.corpus = corpus
         self.document_matrix = None
+        # threshold the document matrix was pruned with when computed
+        self.document_matrix_threshold = None
         self.word_matrix = None
         self.window_size = 0
         self.document_threshold = 0
@@ -31,6 +35,7 @@ class CorpusToNetwork:
         self.word_network = None
         self.document_network = None
         self.word2ind = None
+        self.ngram_ids = None
         self.word_freqs = None
         self.document_items = corpus.copy()
         self.word_items = None
@@ -113,7 +118,8 @@ class CorpusToNetwork:
                 return self.word_network
             if document_nodes:
                 self.document_threshold = threshold
-                if self.document_matrix is None:
+                if (self.document_matrix is None or
+                        threshold < self.document_matrix_threshold):
                     self._compute_document_matrix(progress_callback)  # generate adjacency matrix
                 self._generate_document_network(progress_callback)  # construct network
                 return self.document_network
@@ -133,97 +139,117 @@ class CorpusToNetwork:
             self._restore_params()
 
     def _compute_document_matrix(self, progress_callback):
-        self.document_matrix = np.zeros((len(self.corpus), len(self.corpus)))
-        num_ticks = (len(self.corpus) * (len(self.corpus) - 1)) // 2
-        ticks = iter(np.linspace(0., 90., num_ticks))
-        for i in range(len(self.corpus)):
-            for j in range(i + 1, len(self.corpus)):
-                w = set(self.ngram_list[i]).intersection(
-                    set(self.ngram_list[j]))
-                self.document_matrix[i][j] = len(w)
-                if progress_callback:
-                    progress_callback(next(ticks))
+        """
+        Compute the upper triangle of the matrix with numbers of ngrams that
+        pairs of documents share as a product of a binary document-ngram
+        matrix with its transpose. The product is computed in blocks of rows
+        and pairs below the current threshold are removed from each block,
+        so the dense matrix is never constructed.
+        """
+        n = len(self.corpus)
+        tokens = CompactTokens.from_lists(self.ngram_list)
+        occurrences = csr_matrix(
+            (np.ones(len(tokens.ids), dtype=np.int32),
+             (np.repeat(np.arange(n), tokens.lengths), tokens.ids)),
+            shape=(n, len(tokens.vocabulary))
+        )
+        occurrences.sum_duplicates()
+        occurrences.data[:] = 1
+
+        threshold = self.document_threshold
+        block_size = max(1, self.BLOCK_PAIRS // max(n, 1))
+        rows, cols, data = [], [], []
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+            # pairs of documents from the block and documents from start on
+            shared = (occurrences[start:end] @ occurrences[start:].T).tocoo()
+            keep = (shared.col > shared.row) & (shared.data >= threshold)
+            rows.append(shared.row[keep] + start)
+            cols.append(shared.col[keep] + start)
+            data.append(shared.data[keep])
+            if progress_callback:
+                progress_callback(90. * end / n)
+        if n:
+            rows, cols, data = (np.concatenate(a) for a in (rows, cols, data))
+        self.document_matrix = csr_matrix(
+            (np.asarray(data, dtype=np.float64), (rows, cols)), shape=(n, n)
+        )
+        self.document_matrix_threshold = threshold
 
     def _generate_document_network(self, progress_callback):
         if progress_callback:
             progress_callback(90.0)
         edges = self.document_matrix.copy()
-        edges[edges < self.document_threshold] = 0
+        edges.data[edges.data < self.document_threshold] = 0
+        edges.eliminate_zeros()
         self.document_network = Network(nodes=np.array(self.corpus.titles),
-                                        edges=csr_matrix(edges),
+                                        edges=edges,
                                         name='Document Network')
         if progress_callback:
             progress_callback(100.0)
 
     def _compute_word2ind(self, progress_callback):
-        self.word2ind = dict()
-        self.word_freqs = defaultdict(int)
-        self.num_ngrams = 0
-        i = 0
-        ticks = iter(np.linspace(0., 10., len(self.corpus)))
-        for ngrams in self.ngram_list:
-            self.num_ngrams += len(ngrams)
-            for ngram in ngrams:
-                self.word_freqs[ngram] += 1
-                if ngram not in self.word2ind:
-                    self.word2ind[ngram] = i
-                    i += 1
-            if progress_callback:
-                progress_callback(next(ticks))
-        self.word2ind = dict(sorted(self.word2ind.items(), key=lambda x: x[1]))
+        if progress_callback:
+            progress_callback(0.0)
+        # ngrams get indices in order of their first appearance
+        self.ngram_ids = CompactTokens.from_lists(self.ngram_list)
+        words = self.ngram_ids.vocabulary.tolist()
+        counts = np.bincount(self.ngram_ids.ids, minlength=len(words))
+        self.word2ind = dict(zip(words, range(len(words))))
+        self.word_freqs = dict(zip(words, counts.tolist()))
+        self.num_ngrams = len(self.ngram_ids.ids)
         if progress_callback:
             progress_callback(10.0)
 
     def _compute_word_matrix(self, progress_callback):
-        self.mask = np.full(len(self.word2ind), True)
-        ticks = iter(np.linspace(0., 90., self.num_ngrams))
-        self.word_matrix = defaultdict(int)  # data for sparse matrix
-        for ngrams in self.ngram_list:
-            for i in range(len(ngrams)):
-                # one window
-                if self.word_freqs[ngrams[i]] < self.freq_threshold:
-                    # ignore the ngram if frequency is not big enough
-                    self.mask[self.word2ind[ngrams[i]]] = False
-                    continue
-                left = 0 if i - self.window_size < 0 else i - self.window_size
-                right = ((len(ngrams) - 1)
-                         if i + self.window_size > len(ngrams) - 1
-                         else i + self.window_size)
-                for j in range(left, i):
-                    if ((self.word2ind[ngrams[j]], self.word2ind[ngrams[i]])
-                            in self.word_matrix):
-                        self.word_matrix[(self.word2ind[ngrams[j]],
-                                          self.word2ind[ngrams[i]])] += 1
-                    else:
-                        self.word_matrix[(self.word2ind[ngrams[i]],
-                                          self.word2ind[ngrams[j]])] += 1
-                for j in range(i + 1, right + 1):
-                    if ((self.word2ind[ngrams[j]], self.word2ind[ngrams[i]])
-                            in self.word_matrix):
-                        self.word_matrix[(self.word2ind[ngrams[j]],
-                                          self.word2ind[ngrams[i]])] += 1
-                    else:
-                        self.word_matrix[(self.word2ind[ngrams[i]],
-                                          self.word2ind[ngrams[j]])] += 1
-                if progress_callback:
-                    progress_callback(next(ticks))
+        """
+        Count co-occurrences of ngrams within windows. Instead of sliding a
+        window over each document, all ngrams are paired with ngrams at
+        distance d for each d up to window_size at once. Each pair of ngrams
+        is stored once, oriented as it was first encountered in the corpus.
+        """
+        ids, n_words = self.ngram_ids.ids, len(self.word2ind)
+        freqs = np.fromiter(self.word_freqs.values(), dtype=np.int64, count=n_words)
+        self.mask = freqs >= self.freq_threshold
+        docs = np.repeat(np.arange(len(self.ngram_ids)), self.ngram_ids.lengths)
+        frequent = self.mask[ids]
+
+        left, right, positions = [], [], []
+        for distance in range(1, self.window_size + 1):
+            pos = np.flatnonzero(
+                (docs[:-distance] == docs[distance:])
+                & frequent[:-distance] & frequent[distance:]
+            )
+            left.append(ids[pos])
+            right.append(ids[pos + distance])
+            positions.append(pos)
+            if progress_callback:
+                progress_callback(10. + 70. * distance / self.window_size)
+        left, right, positions = (np.concatenate(a).astype(np.int64)
+                                  for a in (left, right, positions))
+
+        # unordered pairs, the first occurrence of a pair sets its orientation
+        pairs = np.minimum(left, right) * n_words + np.maximum(left, right)
+        order = np.lexsort((positions, pairs))
+        pairs = pairs[order]
+        _, first, counts = np.unique(pairs, return_index=True, return_counts=True)
+        first = order[first]
+        self.word_matrix = csr_matrix(
+            (counts.astype(np.float64), (left[first], right[first])),
+            shape=(n_words, n_words)
+        )
+        if progress_callback:
+            progress_callback(90.0)
 
     def _generate_word_network(self, progress_callback):
         if progress_callback:
             progress_callback(90.0)
-        th = self.word_threshold
-        data = np.array([v / 2 for v in self.word_matrix.values() if (v / 2) >= th],
-                        dtype=np.float64)
-        row_ind = np.array([k[0] for k, v in self.word_matrix.items() if (v / 2) >= th],
-                           dtype=np.float64)
-        col_ind = np.array([k[1] for k, v in self.word_matrix.items() if (v / 2) >= th],
-                           dtype=np.float64)
-        s = len(self.word_freqs)
-        edges = csr_matrix((data, (row_ind, col_ind)), shape=(s, s))
-        ind2word = {v: k for k, v in self.word2ind.items()}
-        words = np.array([ind2word[ind] for ind in range(s)])
-        freqs = np.array([self.word_freqs[ind2word[ind]] for ind in range(s)],
-                         dtype=np.float64)
+        edges = self.word_matrix.copy()
+        edges.data[edges.data < self.word_threshold] = 0
+        edges.eliminate_zeros()
+        words = np.array(list(self.word2ind))
+        freqs = np.fromiter(self.word_freqs.values(), dtype=np.float64,
+                            count=len(self.word_freqs))
         network = Network(nodes=words,
                           edges=edges,
                           name='Word Network')
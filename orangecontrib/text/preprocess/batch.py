@@ -0,0 +1,145 @@
+""" Applying a regular expression to many strings with a single scan.
+
+Strings (documents or tokens) are joined with a separator that does not
+appear in texts, so that one regular expression scans many of them at once.
+Batches where the result could differ from processing strings one by one
+are processed by a fallback function instead.
+"""
+import re
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from Orange.util import dummy_callback
+
+__all__ = ['batch_findall', 'batch_sub']
+
+BATCH_SEPARATOR = "\n\x00\n"
+# the separator as a regular expression; valid also with re.VERBOSE
+_SEPARATOR_PATTERN = r"\n\x00\n"
+# number of strings joined into a single string
+BATCH_SIZE = 10000
+
+
+def _batchable(pattern: str, flags: int) -> bool:
+    """
+    Whether matches of the pattern within a string depend only on the
+    string and the characters of the separator around it. This excludes
+    lookarounds, inline flags, and anchors to the start or end of the
+    entire string; the check is conservative.
+    """
+    try:
+        re.compile(pattern, flags)
+    except re.error:
+        return False
+    if re.search(r"\(\?(?![:P])", pattern) \
+            or "\\A" in pattern or "\\Z" in pattern:
+        return False
+    # without MULTILINE, ^ and $ match only at the ends of the joined string;
+    # escaped characters and (starts of) character classes are literals
+    literals = re.sub(r"\\.|\[(?:\\.|[^\]])*\]", "", pattern)
+    return bool(flags & re.MULTILINE) or not ("^" in literals or "$" in literals)
+
+
+def _batches(strings: Sequence[str], callback: Callable, batch_size: int):
+    for start in range(0, len(strings), batch_size):
+        callback(start / len(strings))
+        batch = strings[start:start + batch_size]
+        yield batch, not any("\x00" in s for s in batch)
+    callback(1)
+
+
+def batch_findall(
+        pattern: str, flags: int, strings: Sequence[str],
+        fallback: Callable[[str], List[str]], callback: Callable = dummy_callback,
+        batch_size: int = BATCH_SIZE
+) -> List[List[str]]:
+    """
+    Non-empty matches of the pattern in each string, the same as
+    re.findall finds in strings one by one, but with a single scan over
+    batches of strings joined by BATCH_SEPARATOR. Batches where results could
+    differ, for instance because matches span separators, and patterns
+    with groups, for which findall returns groups, are processed by
+    fallback instead.
+    """
+    regex = None
+    if _batchable(pattern, flags):
+        try:
+            regex = re.compile(f"(?:{pattern})|{_SEPARATOR_PATTERN}", flags)
+        except re.error:
+            pass
+        if regex is not None and regex.groups:
+            regex = None
+    found = []
+    for batch, batchable in _batches(strings, callback, batch_size):
+        tokens = None
+        if regex is not None and batchable:
+            tokens = _split_matches(regex.findall(BATCH_SEPARATOR.join(batch)), len(batch))
+        found.extend(tokens if tokens is not None else map(fallback, batch))
+    return found
+
+
+def _split_matches(matches: List[str], n: int) -> Optional[List[List[str]]]:
+    """
+    Split matches in joined strings into n lists or return None if some
+    separators were not matched as a whole, that is, if matches spanned
+    them.
+    """
+    matches_ = np.empty(len(matches), dtype=object)
+    matches_[:] = matches
+    separators = matches_ == BATCH_SEPARATOR
+    if np.count_nonzero(separators) != n - 1:
+        return None
+    strings = np.cumsum(separators)
+    keep = ~separators & (matches_ != "")
+    matches_, strings = matches_[keep], strings[keep]
+    bounds = np.searchsorted(strings, np.arange(n + 1))
+    return [matches_[s:e].tolist() for s, e in zip(bounds[:-1], bounds[1:])]
+
+
+def _sub_batch(regex: re.Pattern, repl: str, batch: Sequence[str]) -> Optional[List[str]]:
+    """
+    Replace matches in the joined batch and split it, or return None if
+    some match was not within a single string, that is, if it touched a
+    separator.
+    """
+    spans = []
+    template = "\\" in repl
+
+    def replace(match):
+        spans.append(match.span())
+        return match.expand(repl) if template else repl
+
+    replaced = regex.sub(replace, BATCH_SEPARATOR.join(batch))
+    if spans:
+        lengths = np.fromiter(map(len, batch), dtype=np.int64, count=len(batch))
+        starts = np.zeros(len(batch), dtype=np.int64)
+        np.cumsum(lengths[:-1] + len(BATCH_SEPARATOR), out=starts[1:])
+        spans = np.array(spans, dtype=np.int64)
+        # a match belongs to the last string that starts before it
+        strings = np.searchsorted(starts, spans[:, 0], side="right") - 1
+        if np.any(spans[:, 1] > starts[strings] + lengths[strings]):
+            return None
+    return replaced.split(BATCH_SEPARATOR)
+
+
+def batch_sub(
+        pattern: str, flags: int, repl: str, strings: Sequence[str],
+        fallback: Callable[[str], str], callback: Callable = dummy_callback,
+        batch_size: int = BATCH_SIZE
+) -> List[str]:
+    """
+    Replace matches of the pattern in each string by repl, the same as
+    re.sub does it for strings one by one, but in batches of strings joined
+    by BATCH_SEPARATOR. Batches where a match touched a separator are
+    processed by fallback instead.
+    """
+    regex = None
+    if _batchable(pattern, flags) and "\x00" not in repl:
+        regex = re.compile(pattern, flags)
+    replaced = []
+    for batch, batchable in _batches(strings, callback, batch_size):
+        parts = None
+        if regex is not None and batchable:
+            parts = _sub_batch(regex, repl, batch)
+        replaced.extend(parts if parts is not None else map(fallback, batch))
+    return replaced
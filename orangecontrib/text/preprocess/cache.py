@@ -0,0 +1,589 @@
+""" Caches of preprocessing results.
+
+PreprocessingCache is a persistent on-disk cache of preprocessing results.
+The cache is keyed by a fingerprint of the corpus (texts, text features and
+preprocessing already applied) and parameters of preprocessors. Tokens, POS
+tags and transformed documents are stored in compact numpy archives and the
+least recently used entries are removed when the cache exceeds its size.
+
+NormalizationCache maps tokens to their normalized forms. Normalizers with
+the same configuration share a cache, which is bounded in size and can be
+backed by memory-mapped files that persist between runs.
+
+    >>> from orangecontrib.text import Corpus
+    >>> from orangecontrib.text.preprocess import PreprocessorList, \\
+    ...     PreprocessingCache, LowercaseTransformer, WordPunctTokenizer
+    >>> corpus = Corpus.from_file('book-excerpts')
+    >>> pp = PreprocessorList([LowercaseTransformer(), WordPunctTokenizer()],
+    ...                       cache=PreprocessingCache())
+    >>> corpus = pp(corpus)  # second call with same corpus loads from cache
+"""
+import bisect
+import hashlib
+import os
+import re
+import sys
+import time
+import warnings
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import List, Optional, Dict, Any, Iterable, Union, Iterator
+
+import numpy as np
+from Orange.misc import environ
+
+from orangecontrib.text import Corpus
+from orangecontrib.text.tokens import CompactTokens
+
+__all__ = ['PreprocessingCache', 'NormalizationCache']
+
+
+def _canonical(obj: Any, visited: set) -> str:
+    """
+    Deterministic string representation of preprocessor's parameters used
+    for cache key. Sets and dictionaries are sorted since their order
+    differs between processes.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return repr(obj)
+    if isinstance(obj, (list, tuple)):
+        items = ",".join(_canonical(o, visited) for o in obj)
+        return f"{type(obj).__name__}[{items}]"
+    if isinstance(obj, (set, frozenset)):
+        return "set[{}]".format(",".join(sorted(_canonical(o, visited) for o in obj)))
+    if isinstance(obj, dict):
+        items = sorted(
+            f"{_canonical(k, visited)}:{_canonical(v, visited)}"
+            for k, v in obj.items()
+        )
+        return "dict[{}]".format(",".join(items))
+    if isinstance(obj, np.ndarray):
+        return "array[{}]".format(_canonical(obj.tolist(), visited))
+    if isinstance(obj, re.Pattern):
+        return f"re[{obj.pattern!r},{obj.flags}]"
+    if id(obj) in visited:
+        return "<cycle>"
+    visited = visited | {id(obj)}
+    name = f"{type(obj).__module__}.{type(obj).__qualname__}"
+    if hasattr(obj, "__func__") and hasattr(obj, "__self__"):  # bound method
+        return "{}[{}.{},{}]".format(
+            name, obj.__func__.__module__, obj.__func__.__qualname__,
+            _canonical(obj.__self__, visited)
+        )
+    if callable(obj) and hasattr(obj, "__qualname__"):  # function or class
+        return f"{name}[{obj.__module__}.{obj.__qualname__}]"
+    state = obj.__getstate__() if hasattr(obj, "__getstate__") else None
+    if state is None and hasattr(obj, "__dict__"):
+        state = vars(obj)
+    if state is None:
+        # objects without state - repr may include the address, which only
+        # makes the key unique and causes a cache miss
+        return repr(obj)
+    if isinstance(state, dict):
+        fitted = getattr(obj, "fitted_attributes", ())
+        state = {k: v for k, v in state.items() if k not in fitted}
+    return f"{name}[{_canonical(state, visited)}]"
+
+
+def _update_with_lists(h, lists: Iterable[Iterable[str]]):
+    for lst in lists:
+        h.update("\x1f".join(lst).encode("utf-8", "surrogatepass"))
+        h.update(b"\x1e")
+
+
+def _encode_strings(strings: List[str]) -> Dict[str, np.ndarray]:
+    encoded = [s.encode("utf-8", "surrogatepass") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    return {"data": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "offsets": offsets}
+
+
+def _decode_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    buffer = data.tobytes()
+    return [buffer[s:e].decode("utf-8", "surrogatepass")
+            for s, e in zip(offsets[:-1], offsets[1:])]
+
+
+def _encode_lists(
+        name: str, lists: Union[List[List[str]], CompactTokens]
+) -> Dict[str, np.ndarray]:
+    """ Store lists of strings as ids to the vocabulary and documents' offsets """
+    if not isinstance(lists, CompactTokens):
+        lists = CompactTokens.from_lists(lists)
+    vocab = _encode_strings(lists.vocabulary.tolist())
+    return {f"{name}_ids": lists.ids, f"{name}_offsets": lists.offsets,
+            f"{name}_vocabulary": vocab["data"],
+            f"{name}_vocabulary_offsets": vocab["offsets"]}
+
+
+def _decode_lists(name: str, data: Dict[str, np.ndarray]) -> CompactTokens:
+    vocabulary = np.empty(len(data[f"{name}_vocabulary_offsets"]) - 1, dtype=object)
+    vocabulary[:] = _decode_strings(data[f"{name}_vocabulary"],
+                                    data[f"{name}_vocabulary_offsets"])
+    return CompactTokens(data[f"{name}_ids"], data[f"{name}_offsets"], vocabulary)
+
+
+class PreprocessingCache:
+    """
+    Cache of preprocessing results stored in Orange's cache directory.
+
+    Parameters
+    ----------
+    path
+        Directory with cache files; if None, the default location in
+        Orange's cache directory is used.
+    max_size
+        Maximal size of the cache in bytes. When exceeded the least recently
+        used results are removed.
+    """
+    # change when the format of stored results changes
+    VERSION = 1
+    EXTENSION = ".npz"
+
+    def __init__(self, path: Optional[str] = None, max_size: int = 2 ** 30):
+        if path is None:
+            path = os.path.join(environ.cache_dir(), "preprocesscache")
+        self.path = path
+        self.max_size = max_size
+
+    def key(self, corpus: Corpus, preprocessors: List) -> str:
+        """
+        Compute the key from corpus's texts, text features, preprocessing
+        already applied to the corpus and preprocessors' parameters.
+        """
+        h = hashlib.sha256()
+        h.update(f"v{self.VERSION}\x1d".encode())
+        h.update(_canonical([f.name for f in corpus.text_features], set()).encode())
+        h.update(_canonical(corpus.ngram_range, set()).encode())
+        _update_with_lists(h, ([d] for d in corpus.pp_documents))
+        if corpus.has_tokens():
+            h.update(b"\x1dtokens")
+            _update_with_lists(h, corpus.tokens)
+        if corpus.pos_tags is not None:
+            h.update(b"\x1dpos_tags")
+            _update_with_lists(h, corpus.pos_tags)
+        for pp in preprocessors:
+            h.update(b"\x1d")
+            h.update(_canonical(pp, set()).encode("utf-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + self.EXTENSION)
+
+    def get(self, corpus: Corpus, preprocessors: List,
+            key: Optional[str] = None) -> Optional[Corpus]:
+        """
+        Return the corpus with preprocessing results from the cache or None
+        when results for the corpus and preprocessors are not cached.
+        """
+        from orangecontrib.text.preprocess import BASE_TOKENIZER
+
+        file = self._file(key or self.key(corpus, preprocessors))
+        if not os.path.exists(file):
+            return None
+        try:
+            with np.load(file) as npz:
+                data = dict(npz)
+            os.utime(file)  # mark as recently used
+        except (OSError, ValueError, KeyError) as e:
+            warnings.warn(f"Could not read preprocessing cache: {e}", RuntimeWarning)
+            self._remove(file)
+            return None
+
+        ids = corpus.ids
+        corpus = corpus.copy()
+        corpus.ids = ids
+        for i in data["used_preprocessors"]:
+            corpus.used_preprocessor = preprocessors[i] if i >= 0 else BASE_TOKENIZER
+        corpus.ngram_range = tuple(data["ngram_range"])
+        if "documents_data" in data:
+            corpus.pp_documents = _decode_strings(
+                data["documents_data"], data["documents_offsets"])
+        if "tokens_ids" in data:
+            corpus.store_tokens(_decode_lists("tokens", data))
+        corpus.pos_tags = _decode_lists("pos_tags", data) \
+            if "pos_tags_ids" in data else None
+        return corpus
+
+    def store(self, corpus: Corpus, preprocessors: List, result: Corpus,
+              key: Optional[str] = None) -> None:
+        """
+        Store results of preprocessing the corpus with preprocessors and
+        remove the least recently used results when the cache is too large.
+        """
+        from orangecontrib.text.preprocess import BASE_TOKENIZER
+
+        # preprocessors appended to used_preprocessor: index of preprocessor
+        # or -1 for base tokenizer applied by tokenized preprocessors
+        n_used = len(corpus.used_preprocessor.preprocessors)
+        used = []
+        for pp in result.used_preprocessor.preprocessors[n_used:]:
+            index = next((i for i, p in enumerate(preprocessors) if p is pp), None)
+            if index is None and pp is not BASE_TOKENIZER:
+                return  # cannot reconstruct used preprocessors
+            used.append(-1 if index is None else index)
+
+        data = {"used_preprocessors": np.array(used, dtype=np.int32),
+                "ngram_range": np.array(result.ngram_range)}
+        documents = result._transformed_documents()
+        if documents is not None:
+            docs = _encode_strings(documents)
+            data["documents_data"] = docs["data"]
+            data["documents_offsets"] = docs["offsets"]
+        if result.has_tokens():
+            data.update(_encode_lists("tokens", result._tokens))
+        if result._pos_tags is not None:
+            data.update(_encode_lists("pos_tags", result._pos_tags))
+
+        file = self._file(key or self.key(corpus, preprocessors))
+        tmp_file = f"{file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp_file, "wb") as f:
+                np.savez(f, **data)
+            os.replace(tmp_file, file)
+        except OSError as e:
+            warnings.warn(f"Could not store preprocessing results to cache: {e}",
+                          RuntimeWarning)
+            self._remove(tmp_file)
+            return
+        self._evict()
+
+    def _evict(self):
+        """ Remove least recently used results until cache fits max_size """
+        try:
+            files = [os.path.join(self.path, f) for f in os.listdir(self.path)
+                     if f.endswith(self.EXTENSION)]
+            stats = sorted(((os.stat(f), f) for f in files),
+                           key=lambda x: x[0].st_mtime)
+        except OSError:
+            return
+        size = sum(st.st_size for st, _ in stats)
+        for st, f in stats:
+            if size <= self.max_size:
+                break
+            self._remove(f)
+            size -= st.st_size
+
+    def clear(self):
+        """ Remove all cached results """
+        if os.path.isdir(self.path):
+            for f in os.listdir(self.path):
+                if f.endswith(self.EXTENSION):
+                    self._remove(os.path.join(self.path, f))
+
+    @staticmethod
+    def _remove(file: str):
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+
+
+def _sizeof(obj: Any) -> int:
+    """ Approximate memory used by a cached key or value """
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        size += sum(map(sys.getsizeof, obj))
+    return size
+
+
+class _MappedStore:
+    """
+    Read-only mapping from strings to strings in a memory-mapped file.
+
+    The file is a single uint8 numpy array with the number of entries,
+    offsets of keys and values (int64) and then UTF-8 encoded keys sorted
+    by bytes followed by values. Lookups use binary search over the mapped
+    keys, so the file is never loaded entirely.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.__keys = self.__values = self.__key_offsets = None
+        self.__value_offsets = None
+        self.__n = 0
+        self.__open()
+
+    def __open(self):
+        try:
+            data = np.load(self.path, mmap_mode="r")
+            n = int(data[:8].view(np.int64)[0])
+            offsets = data[8:8 + 16 * (n + 1)].view(np.int64)
+            key_offsets, value_offsets = offsets[:n + 1], offsets[n + 1:]
+            start = 8 + 16 * (n + 1)
+            keys = data[start:start + key_offsets[-1]]
+            values = data[start + key_offsets[-1]:]
+        except FileNotFoundError:  # removed by another process
+            return
+        except (OSError, ValueError, IndexError) as e:
+            warnings.warn(f"Could not read normalization cache: {e}", RuntimeWarning)
+            return
+        self.__n = n
+        self.__keys, self.__key_offsets = keys, key_offsets
+        self.__values, self.__value_offsets = values, value_offsets
+
+    def __len__(self) -> int:
+        return self.__n
+
+    def __getitem__(self, i: int) -> bytes:
+        # keys as a sequence for bisect
+        return self.__keys[self.__key_offsets[i]:self.__key_offsets[i + 1]].tobytes()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.__n:
+            return None
+        encoded = key.encode("utf-8", "surrogatepass")
+        i = bisect.bisect_left(self, encoded)
+        if i == self.__n or self[i] != encoded:
+            return None
+        start, end = self.__value_offsets[i], self.__value_offsets[i + 1]
+        return self.__values[start:end].tobytes().decode("utf-8", "surrogatepass")
+
+    @staticmethod
+    def write(path: str, entries: Dict[str, str]):
+        """ Write entries to a new file """
+        encoded = sorted((k.encode("utf-8", "surrogatepass"),
+                          v.encode("utf-8", "surrogatepass"))
+                         for k, v in entries.items())
+        keys = [k for k, _ in encoded]
+        values = [v for _, v in encoded]
+        header = np.zeros(1 + 2 * (len(encoded) + 1), dtype=np.int64)
+        header[0] = len(encoded)
+        np.cumsum([len(k) for k in keys], out=header[2:len(encoded) + 2])
+        np.cumsum([len(v) for v in values], out=header[len(encoded) + 3:])
+        data = np.concatenate((header.view(np.uint8),
+                               np.frombuffer(b"".join(keys), dtype=np.uint8),
+                               np.frombuffer(b"".join(values), dtype=np.uint8)))
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                np.save(f, data)
+            os.replace(tmp_file, path)
+        except OSError:
+            PreprocessingCache._remove(tmp_file)
+            raise
+
+
+class _SegmentedStore:
+    """
+    Persistent mapping from strings to strings in a directory of segments,
+    each a :class:`_MappedStore`.
+
+    Writes append a new segment with new entries and with entries that were
+    read from older segments, so a write costs as much as the entries used
+    since the last one, not as the whole store. Lookups search segments
+    from the newest. The oldest segments are removed when there are more
+    than MAX_SEGMENTS or when they exceed MAX_SIZE bytes, so entries that
+    were not used recently are evicted.
+    """
+    MAX_SEGMENTS = 16
+    MAX_SIZE = 2 ** 28
+    EXTENSION = ".npy"
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__segments: List[_MappedStore] = []  # the newest first
+        self.__used = {}  # entries read from older segments
+        self.__open()
+
+    def __files(self) -> List[str]:
+        """ Files of segments, the newest first """
+        try:
+            names = [f for f in os.listdir(self.path) if f.endswith(self.EXTENSION)]
+        except OSError:
+            return []
+        # names start with the time of writing
+        return [os.path.join(self.path, f) for f in sorted(names, reverse=True)]
+
+    def __open(self):
+        self.__segments = [_MappedStore(f) for f in self.__files()]
+
+    def get(self, key: str) -> Optional[str]:
+        for i, segment in enumerate(self.__segments):
+            value = segment.get(key)
+            if value is not None:
+                if i:
+                    self.__used[key] = value
+                return value
+        return None
+
+    def update(self, entries: Dict[str, str]):
+        """ Append a segment with entries and entries used since last update """
+        entries = {**self.__used, **entries}
+        self.__used = {}
+        if not entries:
+            return
+        file = os.path.join(
+            self.path, f"{time.time_ns():020d}-{os.getpid()}{self.EXTENSION}")
+        # release mappings before removing old segments
+        self.__segments = []
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            _MappedStore.write(file, entries)
+        except OSError as e:
+            warnings.warn(f"Could not store normalization cache: {e}",
+                          RuntimeWarning)
+        self.__evict()
+        self.__open()
+
+    def __evict(self):
+        """ Remove the oldest segments until the store fits the limits """
+        size = 0
+        for i, file in enumerate(self.__files()):
+            try:
+                size += os.stat(file).st_size
+            except OSError:
+                continue
+            if i >= self.MAX_SEGMENTS or size > self.MAX_SIZE:
+                PreprocessingCache._remove(file)
+
+
+class NormalizationCache(MutableMapping):
+    """
+    Least recently used cache of normalized tokens.
+
+    Parameters
+    ----------
+    max_entries
+        Maximal number of entries kept in memory.
+    max_bytes
+        Maximal (approximate) memory used by keys and values.
+    path
+        Directory of the persistent store of memory-mapped segments; entries
+        that are not in memory are looked up in it and new entries are
+        written to it on flush. Only string values are stored.
+
+    Attributes
+    ----------
+    hits, misses
+        Numbers of successful and unsuccessful lookups with :meth:`get`.
+    """
+    MAX_ENTRIES = 1_000_000
+    MAX_BYTES = 2 ** 28
+
+    # caches shared by normalizers with the same configuration, the least
+    # recently used first; normalizers keep using caches that are dropped
+    # when there are more than MAX_SHARED or they use more than MAX_BYTES
+    MAX_SHARED = 16
+    _shared: "OrderedDict[str, NormalizationCache]" = OrderedDict()
+
+    def __init__(self, max_entries: int = MAX_ENTRIES,
+                 max_bytes: int = MAX_BYTES, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__store = None
+        self.__pending = {}  # entries not yet written to the store
+        if path is not None:
+            self.attach(path)
+
+    @classmethod
+    def shared(cls, key: str, persistent: bool = False) -> "NormalizationCache":
+        """
+        Return the cache shared by all normalizers with the given key. If
+        persistent, the cache is backed by a file in Orange's cache directory.
+        """
+        if key not in cls._shared:
+            cls._shared[key] = cls()
+        cls._shared.move_to_end(key)
+        cache = cls._shared[key]
+        if persistent and cache.path is None:
+            name = hashlib.sha256(key.encode("utf-8", "surrogatepass")).hexdigest()
+            cache.attach(os.path.join(
+                environ.cache_dir(), "normalizationcache", name))
+        while len(cls._shared) > 1 and (
+                len(cls._shared) > cls.MAX_SHARED
+                or sum(c.nbytes for c in cls._shared.values()) > cls.MAX_BYTES):
+            _, dropped = cls._shared.popitem(last=False)
+            dropped.flush()
+        return cache
+
+    @classmethod
+    def clear_shared(cls):
+        """ Forget all shared caches; files of persistent caches are kept """
+        cls._shared.clear()
+
+    @property
+    def path(self) -> Optional[str]:
+        return None if self.__store is None else self.__store.path
+
+    def attach(self, path: str):
+        """ Back the cache with a persistent store in a directory """
+        self.__store = _SegmentedStore(path)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.__entries.get(key)
+        if value is not None:
+            self.__entries.move_to_end(key)
+        elif self.__store is not None:
+            value = self.__store.get(key)
+            if value is not None:
+                self.__insert(key, value)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.__entries.get(key)
+        if value is None and self.__store is not None:
+            value = self.__store.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__entries or \
+            self.__store is not None and self.__store.get(key) is not None
+
+    def __setitem__(self, key: str, value: Any):
+        if key in self.__entries:
+            del self[key]
+        self.__insert(key, value)
+        if self.__store is not None and isinstance(value, str):
+            self.__pending[key] = value
+
+    def __insert(self, key: str, value: Any):
+        self.__entries[key] = value
+        self.__bytes += _sizeof(key) + _sizeof(value)
+        while self.__entries and (len(self.__entries) > self.max_entries
+                                  or self.__bytes > self.max_bytes):
+            old_key, old_value = self.__entries.popitem(last=False)
+            self.__bytes -= _sizeof(old_key) + _sizeof(old_value)
+
+    def __delitem__(self, key: str):
+        value = self.__entries.pop(key)
+        self.__bytes -= _sizeof(key) + _sizeof(value)
+        self.__pending.pop(key, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__entries)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def clear(self):
+        """ Remove entries from memory; the persistent store is kept """
+        self.__entries.clear()
+        self.__pending.clear()
+        self.__bytes = 0
+        self.hits = self.misses = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.__bytes
+
+    def flush(self):
+        """ Write new and recently read entries to the persistent store """
+        if self.__store is not None:
+            self.__store.update(self.__pending)
+            self.__pending = {}
@@ -1,10 +1,10 @@
+from contextlib import contextmanager, ExitStack
 from itertools import compress
-from typing import List, Callable, Optional, Set
+from typing import List, Callable, Optional, Set, Tuple
 import os
 import re
 
 import numpy as np
-from gensim import corpora
 from nltk.corpus import stopwords
 
 from Orange.data.io import detect_encoding
@@ -14,13 +14,20 @@ from orangecontrib.text import Corpus
 from orangecontrib.text.language import ISO2LANG, LANG2ISO
 from orangecontrib.text.misc import wait_nltk_data
 from orangecontrib.text.preprocess import TokenizedPreprocessor
+from orangecontrib.text.tokens import CompactTokens, DocumentFrequencies
 
 __all__ = ['BaseTokenFilter', 'StopwordsFilter', 'LexiconFilter',
            'RegexpFilter', 'FrequencyFilter', 'MostFrequentTokensFilter',
-           'PosTagFilter', 'NumbersFilter', 'WithNumbersFilter']
+           'PosTagFilter', 'NumbersFilter', 'WithNumbersFilter',
+           'CombinedTokenFilter']
 
 
 class BaseTokenFilter(TokenizedPreprocessor):
+    fusable = True
+    # whether the filter decides on each token by the token alone, so that
+    # it can be combined with other such filters into CombinedTokenFilter
+    combinable = True
+
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
         if callback is None:
             callback = dummy_callback
@@ -28,6 +35,8 @@ class BaseTokenFilter(TokenizedPreprocessor):
         return self._filter_tokens(corpus, wrap_callback(callback, start=0.2))
 
     def _filter_tokens(self, corpus: Corpus, callback: Callable) -> Corpus:
+        if isinstance(corpus.tokens, CompactTokens):
+            return self._filter_vocabulary(corpus, callback)
         callback(0, "Filtering...")
         filtered_tokens = []
         filtered_tags = []
@@ -40,11 +49,46 @@ class BaseTokenFilter(TokenizedPreprocessor):
         corpus.store_tokens(filtered_tokens)
         if filtered_tags:
             corpus.pos_tags = np.array(filtered_tags, dtype=object)
+        callback(1)
+        return corpus
+
+    def _filter_vocabulary(self, corpus: Corpus, callback: Callable) -> Corpus:
+        """
+        Check each distinct token once and remove tokens (and their POS
+        tags) that do not pass with a single mask over all tokens.
+        """
+        callback(0, "Filtering...")
+        tokens = corpus.tokens
+        if not isinstance(tokens, CompactTokens):
+            tokens = CompactTokens.from_lists(tokens)
+        keep_words = np.fromiter(map(self._check, tokens.vocabulary),
+                                 dtype=bool, count=len(tokens.vocabulary))
+        keep = keep_words[tokens.ids]
+        corpus.store_tokens(tokens.compress(keep, keep_words))
+        pos_tags = corpus.pos_tags
+        if pos_tags is not None:
+            if not isinstance(pos_tags, CompactTokens):
+                pos_tags = CompactTokens.from_lists(pos_tags)
+            corpus.pos_tags = pos_tags.compress(keep)
+        callback(1)
         return corpus
 
     def _preprocess(self, tokens: List) -> List:
         return [self._check(token) for token in tokens]
 
+    def _process_document(
+            self, document: str, tokens: Optional[List[str]],
+            pos_tags: Optional[List[str]]
+    ) -> Tuple[str, Optional[List[str]], Optional[List[str]]]:
+        if tokens is None:
+            from orangecontrib.text.preprocess import BASE_TOKENIZER
+            tokens = BASE_TOKENIZER._preprocess(document)
+        filter_map = self._preprocess(tokens)
+        tokens = list(compress(tokens, filter_map))
+        if pos_tags is not None:
+            pos_tags = list(compress(pos_tags, filter_map))
+        return document, tokens, pos_tags
+
     def _check(self, token: str) -> bool:
         raise NotImplementedError
 
@@ -161,10 +205,16 @@ class RegexpFilter(BaseTokenFilter):
         self.regex = None
 
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
+        with self._prepared():
+            return super().__call__(corpus, callback)
+
+    @contextmanager
+    def _prepared(self):
         self.regex = re.compile(self._pattern)
-        corpus = super().__call__(corpus, callback)
-        self.regex = None
-        return corpus
+        try:
+            yield
+        finally:
+            self.regex = None
 
     @staticmethod
     def validate_regexp(regexp):
@@ -202,9 +252,15 @@ class WithNumbersFilter(RegexpFilter):
 
 
 class FitDictionaryFilter(BaseTokenFilter):
+    # the filter is fitted on the entire corpus
+    document_local = False
+    fusable = False
+    combinable = False
+    fitted_attributes = ("_lexicon", "_frequencies", "_corpus_len")
+
     def __init__(self):
         self._lexicon = None
-        self._dictionary = None
+        self._frequencies = None
 
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
         if callback is None:
@@ -216,16 +272,31 @@ class FitDictionaryFilter(BaseTokenFilter):
         return self._filter_tokens(corpus, wrap_callback(callback, start=0.6))
 
     def _fit(self, corpus: Corpus):
-        raise NotImplemented
+        tokens = corpus.tokens
+        if not isinstance(tokens, CompactTokens):
+            tokens = CompactTokens.from_lists(tokens)
+        self._frequencies = tokens.document_frequencies()
+        keep = self._select(self._frequencies)
+        self._lexicon = set(self._frequencies.vocabulary[keep].tolist())
+
+    def _select(self, frequencies: DocumentFrequencies) -> np.ndarray:
+        """ Mask of vocabulary words that pass the filter """
+        raise NotImplementedError
 
     def _filter_tokens(self, corpus: Corpus, callback: Callable) -> Corpus:
         return super()._filter_tokens(corpus, callback)
 
     def _check(self, token):
         assert self._lexicon is not None
-        assert self._dictionary is not None
+        assert self._frequencies is not None
         return token in self._lexicon
 
+    def __setstate__(self, state):
+        # filters pickled with older versions kept gensim's Dictionary
+        state.pop("_dictionary", None)
+        state.setdefault("_frequencies", None)
+        self.__dict__.update(state)
+
 
 class FrequencyFilter(FitDictionaryFilter):
     """Remove tokens with document frequency outside this range;
@@ -240,9 +311,10 @@ class FrequencyFilter(FitDictionaryFilter):
 
     def _fit(self, corpus: Corpus):
         self._corpus_len = len(corpus)
-        self._dictionary = corpora.Dictionary(corpus.tokens)
-        self._dictionary.filter_extremes(self.min_df, self.max_df, None)
-        self._lexicon = set(self._dictionary.token2id.keys())
+        super()._fit(corpus)
+
+    def _select(self, frequencies: DocumentFrequencies) -> np.ndarray:
+        return frequencies.select(self.min_df, self.max_df)
 
     @property
     def max_df(self):
@@ -269,15 +341,14 @@ class MostFrequentTokensFilter(FitDictionaryFilter):
         super().__init__()
         self._keep_n = keep_n
 
-    def _fit(self, corpus: Corpus):
-        self._dictionary = corpora.Dictionary(corpus.tokens)
-        self._dictionary.filter_extremes(0, 1, self._keep_n)
-        self._lexicon = set(self._dictionary.token2id.keys())
+    def _select(self, frequencies: DocumentFrequencies) -> np.ndarray:
+        return frequencies.select(0, 1, self._keep_n)
 
 
 class PosTagFilter(BaseTokenFilter):
     """Keep selected POS tags."""
     name = 'POS tags'
+    combinable = False
 
     def __init__(self, tags=None):
         self._tags = set(i.strip().upper() for i in tags.split(","))
@@ -308,5 +379,62 @@ class PosTagFilter(BaseTokenFilter):
         corpus.pos_tags = filtered_tags
         return corpus
 
+    def _process_document(
+            self, document: str, tokens: Optional[List[str]],
+            pos_tags: Optional[List[str]]
+    ) -> Tuple[str, Optional[List[str]], Optional[List[str]]]:
+        if tokens is None:
+            from orangecontrib.text.preprocess import BASE_TOKENIZER
+            tokens = BASE_TOKENIZER._preprocess(document)
+        if pos_tags is None:
+            return document, tokens, pos_tags
+        keep = [tag in self._tags for tag in pos_tags]
+        return document, list(compress(tokens, keep)), list(compress(pos_tags, keep))
+
     def _check(self, token: str) -> bool:
         pass
+
+
+class CombinedTokenFilter(BaseTokenFilter):
+    """
+    Apply several combinable filters (e.g. stopwords, lexicon, regexp and
+    numbers filters) in a single pass: every distinct token is checked by
+    all filters once and tokens are removed with a single mask. The result,
+    including the corpus's used preprocessors, is the same as when applying
+    the filters one by one.
+    """
+    name = 'Combined filters'
+
+    def __init__(self, filters: List[BaseTokenFilter]):
+        assert all(f.combinable for f in filters)
+        self.filters = list(filters)
+
+    def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
+        from orangecontrib.text.preprocess import BASE_TOKENIZER
+
+        if callback is None:
+            callback = dummy_callback
+        ids = corpus.ids
+        corpus = corpus.copy()
+        corpus.ids = ids
+        # filters are recorded as if they were applied one by one
+        for i, f in enumerate(self.filters):
+            corpus.used_preprocessor = f
+            if i == 0 and not corpus.has_tokens():
+                corpus = BASE_TOKENIZER(corpus, wrap_callback(callback, end=0.2))
+        with self._prepared():
+            return self._filter_tokens(corpus, wrap_callback(callback, start=0.2))
+
+    @contextmanager
+    def _prepared(self):
+        with ExitStack() as stack:
+            for f in self.filters:
+                stack.enter_context(f._prepared())
+            yield
+
+    def _filter_tokens(self, corpus: Corpus, callback: Callable) -> Corpus:
+        # interning list tokens pays off when several filters check them
+        return self._filter_vocabulary(corpus, callback)
+
+    def _check(self, token: str) -> bool:
+        return all(f._check(token) for f in self.filters)
@@ -1,5 +1,10 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from math import ceil
 from typing import List, Callable, Dict, Tuple, Optional
 import os
+
 import ufal.udpipe as udpipe
 from lemmagen3 import Lemmatizer
 import serverfiles
@@ -13,47 +18,186 @@ from orangecontrib.text import Corpus
 from orangecontrib.text.language import LANG2ISO, ISO2LANG
 from orangecontrib.text.misc import wait_nltk_data
 from orangecontrib.text.preprocess import Preprocessor, TokenizedPreprocessor
+from orangecontrib.text.preprocess.cache import NormalizationCache, _canonical
+from orangecontrib.text.preprocess.preprocess import effective_n_jobs
+from orangecontrib.text.tokens import CompactTokens
 
 __all__ = ['BaseNormalizer', 'WordNetLemmatizer', 'PorterStemmer',
            'SnowballStemmer', 'UDPipeLemmatizer', 'LemmagenLemmatizer']
 
 
+def _normalize_batch(normalizer: "BaseNormalizer", words: List[str]) -> List[str]:
+    return [normalizer.normalizer(w) for w in words]
+
+
 class BaseNormalizer(TokenizedPreprocessor):
     """ A generic normalizer class.
     You should either overwrite `normalize` method or provide a custom
     normalizer.
+
+    Parameters
+    ----------
+    vocabulary_mode
+        If True, tokens are interned to ids, each distinct token is
+        normalized once and the ids are remapped to normalized tokens with
+        a single array indexing, instead of looking up every token.
+    n_jobs
+        Number of worker processes that normalize parts of the vocabulary in
+        vocabulary mode; -1 uses all CPUs.
     """
     normalizer = NotImplemented
-
-    def __init__(self):
-        # cache already normalized string to speedup normalization
-        self._normalization_cache = {}
+    fusable = True
+    # if True, normalized tokens are also stored in Orange's cache directory
+    # and reused in later runs
+    persistent_cache = False
+    # attributes that do not affect normalization and are thus not a part of
+    # the configuration by which normalizers share the cache
+    runtime_attributes = ("persistent_cache", "vocabulary_mode", "n_jobs")
+    # number of words (or documents) normalized in a batch
+    BATCH_SIZE = 10000
+
+    def __init__(self, vocabulary_mode: bool = False, n_jobs: int = 1):
+        # cache of already normalized strings, set on first use since it
+        # depends on the configuration of the normalizer
+        self.__cache = None
+        self.vocabulary_mode = vocabulary_mode
+        self.n_jobs = n_jobs
 
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
         if callback is None:
             callback = dummy_callback
+        with self._prepared():
+            return self._normalize_corpus(corpus, callback)
+
+    def _normalize_corpus(self, corpus: Corpus, callback: Callable) -> Corpus:
         corpus = super().__call__(corpus, wrap_callback(callback, end=0.2))
         callback(0.2, "Normalizing...")
+        if self.vocabulary_mode:
+            return self._store_tokens_by_vocabulary(
+                corpus, wrap_callback(callback, start=0.2))
         return self._store_tokens(corpus, wrap_callback(callback, start=0.2))
 
+    def _store_tokens_by_vocabulary(self, corpus: Corpus,
+                                    callback: Callable) -> Corpus:
+        """
+        Normalize the vocabulary of the corpus and remap tokens' ids to
+        normalized tokens.
+        """
+        tokens = corpus.tokens
+        if not isinstance(tokens, CompactTokens):
+            tokens = CompactTokens.from_lists(tokens)
+        words = self._normalize_vocabulary(tokens.vocabulary.tolist(), callback)
+        corpus.store_tokens(tokens.map_vocabulary(words))
+        return corpus
+
+    def _normalize_vocabulary(self, words: List[str],
+                              callback: Callable) -> List[str]:
+        """ Normalize distinct words, using the cache where possible """
+        cache = self._normalization_cache
+        normalized = [cache.get(w) for w in words]
+        missing = [i for i, w in enumerate(normalized) if w is None]
+        new = self._normalize_words([words[i] for i in missing], callback)
+        for i, w in zip(missing, new):
+            normalized[i] = cache[words[i]] = w
+        return normalized
+
+    def _normalize_words(self, words: List[str], callback: Callable) -> List[str]:
+        """ Normalize words that are not cached yet """
+        function = partial(_normalize_batch, self)
+        return self._map_batches(function, function, words, callback)
+
+    def _map_batches(self, function: Callable, worker_function: Callable,
+                     items: List, callback: Callable) -> List:
+        """
+        Apply function to batches of items and return concatenated results.
+        When n_jobs is larger than 1, batches are processed by (picklable)
+        worker_function in worker processes.
+        """
+        n_jobs = effective_n_jobs(self.n_jobs, len(items))
+        batch_size = self.BATCH_SIZE
+        if n_jobs > 1:
+            batch_size = min(batch_size, ceil(len(items) / n_jobs))
+        batches = [items[i:i + batch_size]
+                   for i in range(0, len(items), batch_size)]
+        results = []
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(worker_function, batch)
+                           for batch in batches]
+                for i, future in enumerate(futures):
+                    results.extend(future.result())
+                    callback((i + 1) / len(batches))
+        else:
+            for i, batch in enumerate(batches):
+                results.extend(function(batch))
+                callback((i + 1) / len(batches))
+        return results
+
+    @contextmanager
+    def _prepared(self):
+        try:
+            yield
+        finally:
+            # store entries computed so far also when interrupted
+            self._normalization_cache.flush()
+
+    @property
+    def _normalization_cache(self) -> NormalizationCache:
+        """
+        Cache shared by normalizers with the same configuration. Normalizers
+        with local functions (e.g. lambdas) get a cache of their own since
+        their configuration cannot be compared.
+        """
+        if self.__cache is None:
+            key = self._cache_key()
+            if "<locals>" in key or "<lambda>" in key:
+                self.__cache = NormalizationCache()
+            else:
+                self.__cache = NormalizationCache.shared(
+                    key, persistent=self.persistent_cache)
+        return self.__cache
+
+    def _reset_normalization_cache(self):
+        """ Find the cache for the (changed) configuration on next use """
+        self.__cache = None
+
+    def _cache_key(self) -> str:
+        state = {k: v for k, v in self.__getstate__().items()
+                 if k not in self.runtime_attributes}
+        cls = type(self)
+        return f"{cls.__module__}.{cls.__qualname__}[{_canonical(state, set())}]"
+
     def _preprocess(self, string: str) -> str:
         """ Normalizes token to canonical form. """
-        if string in self._normalization_cache:
-            return self._normalization_cache[string]
-        self._normalization_cache[string] = norm_string = self.normalizer(string)
+        norm_string = self._normalization_cache.get(string)
+        if norm_string is None:
+            self._normalization_cache[string] = norm_string = self.normalizer(string)
         return norm_string
 
+    def _process_document(
+            self, document: str, tokens: Optional[List[str]],
+            pos_tags: Optional[List[str]]
+    ) -> Tuple[str, Optional[List[str]], Optional[List[str]]]:
+        if tokens is None:
+            from orangecontrib.text.preprocess import BASE_TOKENIZER
+            tokens = BASE_TOKENIZER._preprocess(document)
+        return document, [self._preprocess(t) for t in tokens], pos_tags
+
     def __getstate__(self):
         d = self.__dict__.copy()
-        # since cache can be quite big, empty cache before pickling
-        d["_normalization_cache"] = {}
+        # the cache is not pickled; the unpickled normalizer finds the shared
+        # cache for its configuration
+        d["_BaseNormalizer__cache"] = None
         return d
 
     def __setstate__(self, state):
+        # old pickles store a per-instance _normalization_cache dictionary
+        state = {k: v for k, v in state.items() if k != "_normalization_cache"}
         self.__dict__.update(state)
-        # support old pickles (before caching was implemented) that are missing
-        # _normalization_cache
-        self._normalization_cache = {}
+        self.__cache = None
+        # support old pickles created before vocabulary mode
+        self.__dict__.setdefault("vocabulary_mode", False)
+        self.__dict__.setdefault("n_jobs", 1)
 
 
 class WordNetLemmatizer(BaseNormalizer):
@@ -61,8 +205,8 @@ class WordNetLemmatizer(BaseNormalizer):
     normalizer = stem.WordNetLemmatizer().lemmatize
 
     @wait_nltk_data
-    def __init__(self):
-        super().__init__()
+    def __init__(self, vocabulary_mode=False, n_jobs=1):
+        super().__init__(vocabulary_mode, n_jobs)
 
 
 class PorterStemmer(BaseNormalizer):
@@ -79,8 +223,8 @@ class SnowballStemmer(BaseNormalizer):
         if l != "porter"
     }
 
-    def __init__(self, language='en'):
-        super().__init__()
+    def __init__(self, language='en', vocabulary_mode=False, n_jobs=1):
+        super().__init__(vocabulary_mode, n_jobs)
         self.normalizer = stem.SnowballStemmer(ISO2LANG[language].lower()).stem
 
 
@@ -196,15 +340,107 @@ class UDPipeStopIteration(StopIteration):
     pass
 
 
+# models loaded in the current (worker) process, by model file
+_UDPIPE_MODELS = {}
+
+
+def _udpipe_model(path: str) -> udpipe.Model:
+    if path not in _UDPIPE_MODELS:
+        _UDPIPE_MODELS[path] = udpipe.Model.load(path)
+    return _UDPIPE_MODELS[path]
+
+
+def _udpipe_tag_token(model: udpipe.Model, token: str) -> str:
+    sentence = udpipe.Sentence()
+    sentence.addWord(token)
+    model.tag(sentence, model.DEFAULT)
+    return sentence.words[1].lemma
+
+
+def _udpipe_lemmatize_tokens(model: udpipe.Model, tokens: List[str]) -> List[str]:
+    """
+    Lemmatize tokens with a single call to UDPipe. Every token is a sentence
+    of its own, so lemmas are the same as when tagging tokens one by one.
+    """
+    # vertical format has one word per line and sentences separated by
+    # empty lines; tokens that cannot be written in it are tagged separately
+    batch = [t for t in tokens if t and not any(c in t for c in "\t\n\r")]
+    lemmas = {}
+    if batch:
+        pipeline = udpipe.Pipeline(model, "vertical", udpipe.Pipeline.DEFAULT,
+                                   udpipe.Pipeline.NONE, "conllu")
+        error = udpipe.ProcessingError()
+        output = pipeline.process("\n\n".join(batch) + "\n\n", error)
+        tagged = [line.split("\t")[2] for line in output.split("\n")
+                  if line and not line.startswith("#")]
+        if not error.occurred() and len(tagged) == len(batch):
+            # CoNLL-U writes empty lemmas as underscores
+            lemmas = {t: "" if lemma == "_" and t != "_" else lemma
+                      for t, lemma in zip(batch, tagged)}
+    return [lemmas[t] if t in lemmas else _udpipe_tag_token(model, t)
+            for t in tokens]
+
+
+def _udpipe_lemmatize_documents(model: udpipe.Model,
+                                documents: List[str]) -> List[List[str]]:
+    """ Tokenize and lemmatize documents with UDPipe's tokenizer """
+    result = []
+    for document in documents:
+        tokens = []
+        tokenizer = model.newTokenizer(model.DEFAULT)
+        tokenizer.setText(document)
+        error = udpipe.ProcessingError()
+        sentence = udpipe.Sentence()
+        while tokenizer.nextSentence(sentence, error):
+            model.tag(sentence, model.DEFAULT)
+            # 1: is used because words[0] is the root required by the dependency trees
+            tokens.extend([w.lemma for w in sentence.words[1:]])
+            sentence = udpipe.Sentence()
+        result.append(tokens)
+    return result
+
+
+def _udpipe_worker(path: str, lemmatize: Callable, items: List) -> List:
+    """ Apply lemmatize with the model loaded (once per process) from path """
+    return lemmatize(_udpipe_model(path), items)
+
+
 class UDPipeLemmatizer(BaseNormalizer):
+    """
+    Lemmatizer based on UDPipe models.
+
+    Parameters
+    ----------
+    language
+        ISO code of the language, with a model variant if there are more
+        models for the language (e.g. "cs_cac").
+    use_tokenizer
+        If True, documents are tokenized with UDPipe's tokenizer and tagged
+        sentence by sentence; otherwise each token is lemmatized separately.
+    vocabulary_mode
+        If True, distinct tokens are lemmatized in batches, each with a
+        single call to UDPipe; ignored when use_tokenizer is True.
+    n_jobs
+        Number of worker processes, each with its own model, that lemmatize
+        parts of the vocabulary (or documents when use_tokenizer is True);
+        -1 uses all CPUs.
+    persistent_cache
+        If True, lemmas of tokens are stored in Orange's cache directory,
+        separately for each model, and reused in later runs.
+    """
     name = 'UDPipe Lemmatizer'
 
-    def __init__(self, language="en", use_tokenizer=False):
-        super().__init__()
+    def __init__(self, language="en", use_tokenizer=False, n_jobs=1,
+                 persistent_cache=False, vocabulary_mode=False):
+        super().__init__(vocabulary_mode, n_jobs)
         self.__language = language
         self.__use_tokenizer = use_tokenizer
+        self.persistent_cache = persistent_cache
         self.models = UDPipeModels()
         self.__model = None
+        self.__model_path = None
+        # identity of the model file for which the cache was chosen
+        self.__cached_model = None
 
     @property
     def use_tokenizer(self):
@@ -216,38 +452,74 @@ class UDPipeLemmatizer(BaseNormalizer):
             else self.__normalize_token
 
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
+        if callback is None:
+            callback = dummy_callback
+        with self._prepared():
+            if self.__use_tokenizer:
+                corpus = Preprocessor.__call__(self, corpus)
+                callback(0, "Normalizing...")
+                if effective_n_jobs(self.n_jobs, len(corpus)) > 1:
+                    return self.__store_tokens_parallel(corpus, callback)
+                return self._store_tokens_from_documents(corpus, callback)
+            else:
+                return self._normalize_corpus(corpus, callback)
+
+    @contextmanager
+    def _prepared(self):
+        self.__model_path = self.__find_model()
+        if self.__cached_model not in (None, self.__model_identity()):
+            # the model file was updated since the cache was chosen
+            self._reset_normalization_cache()
+        self.__model = udpipe.Model.load(self.__model_path)
+        with super()._prepared():
+            yield
+
+    def __find_model(self) -> str:
         try:
-            self.__model = udpipe.Model.load(self.models[self.__language])
+            return self.models[self.__language]
         except StopIteration:
             raise UDPipeStopIteration
 
+    def __model_identity(self) -> str:
+        path = self.__model_path or self.__find_model()
+        stat = os.stat(path)
+        return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _cache_key(self) -> str:
+        # lemmas depend on the model file, which is updated with new releases
+        # of models for the same language
+        self.__cached_model = self.__model_identity()
+        return f"{super()._cache_key()}[{self.__cached_model}]"
+
+    def _normalize_words(self, words: List[str], callback: Callable) -> List[str]:
+        return self._map_batches(
+            partial(_udpipe_lemmatize_tokens, self.__model),
+            partial(_udpipe_worker, self.__model_path, _udpipe_lemmatize_tokens),
+            words, callback)
+
+    def __store_tokens_parallel(self, corpus: Corpus, callback: Callable) -> Corpus:
+        documents = list(corpus.pp_documents)
+        tokens = self._map_batches(
+            partial(_udpipe_lemmatize_documents, self.__model),
+            partial(_udpipe_worker, self.__model_path, _udpipe_lemmatize_documents),
+            documents, callback)
+        corpus.pos_tags = None
+        corpus.store_tokens(tokens)
+        return corpus
+
+    def _process_document(
+            self, document: str, tokens: Optional[List[str]],
+            pos_tags: Optional[List[str]]
+    ) -> Tuple[str, Optional[List[str]], Optional[List[str]]]:
         if self.__use_tokenizer:
-            corpus = Preprocessor.__call__(self, corpus)
-            if callback is None:
-                callback = dummy_callback
-            callback(0, "Normalizing...")
-            return self._store_tokens_from_documents(corpus, callback)
-        else:
-            return super().__call__(corpus, callback)
+            return document, self._preprocess(document), None
+        return super()._process_document(document, tokens, pos_tags)
 
     def __normalize_token(self, token: str) -> str:
-        sentence = udpipe.Sentence()
-        sentence.addWord(token)
-        self.__model.tag(sentence, self.__model.DEFAULT)
-        return sentence.words[1].lemma
+        return _udpipe_tag_token(self.__model, token)
 
     def __normalize_document(self, document: str) -> List[str]:
-        tokens = []
-        tokenizer = self.__model.newTokenizer(self.__model.DEFAULT)
-        tokenizer.setText(document)
-        error = udpipe.ProcessingError()
-        sentence = udpipe.Sentence()
-        while tokenizer.nextSentence(sentence, error):
-            self.__model.tag(sentence, self.__model.DEFAULT)
-            # 1: is used because words[0] is the root required by the dependency trees
-            tokens.extend([w.lemma for w in sentence.words[1:]])
-            sentence = udpipe.Sentence()
-        return tokens
+        return _udpipe_lemmatize_documents(self.__model, [document])[0]
 
     def __getstate__(self):
         """
@@ -258,6 +530,8 @@ class UDPipeLemmatizer(BaseNormalizer):
         state = super().__getstate__()
         # Remove the nonpicklable Model.
         state['_UDPipeLemmatizer__model'] = None
+        state['_UDPipeLemmatizer__model_path'] = None
+        state['_UDPipeLemmatizer__cached_model'] = None
         # models object together with serverfiles store absolute paths to models
         # on computers -- we will init it on when unpickling -- setstate
         state.pop('models')
@@ -271,6 +545,10 @@ class UDPipeLemmatizer(BaseNormalizer):
         Note: __model will be loaded on __call__
         """
         super().__setstate__(state)
+        # support old pickles without persistent cache
+        self.__dict__.setdefault("persistent_cache", False)
+        self.__dict__.setdefault("_UDPipeLemmatizer__model_path", None)
+        self.__dict__.setdefault("_UDPipeLemmatizer__cached_model", None)
         self.models = UDPipeModels()
 
 
@@ -278,8 +556,8 @@ class LemmagenLemmatizer(BaseNormalizer):
     name = 'Lemmagen Lemmatizer'
     supported_languages = set(Lemmatizer.list_supported_languages())
 
-    def __init__(self, language="en"):
-        super().__init__()
+    def __init__(self, language="en", vocabulary_mode=False, n_jobs=1):
+        super().__init__(vocabulary_mode, n_jobs)
         self.language = language  # used only for unpicking
         self.lemmatizer = Lemmatizer(language)
 
@@ -1,5 +1,11 @@
-from typing import Union, List, Callable
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager, ExitStack
+from itertools import chain
+from math import ceil
+from typing import Union, List, Callable, Tuple, Optional
 
+import numpy as np
 from Orange.util import dummy_callback, wrap_callback
 
 from orangecontrib.text import Corpus
@@ -10,6 +16,15 @@ __all__ = ['Preprocessor', 'TokenizedPreprocessor',
 
 class Preprocessor:
     name = NotImplemented
+    # whether the result for a document depends only on that document; such
+    # preprocessors can be applied to parts of a corpus independently
+    document_local = True
+    # whether the preprocessor implements _process_document and can be fused
+    # with neighbouring preprocessors into a single pass over documents
+    fusable = False
+    # attributes set when fitting the preprocessor on a corpus; they are not
+    # the preprocessor's parameters
+    fitted_attributes = ()
 
     def __call__(self, corpus: Corpus) -> Corpus:
         """
@@ -89,6 +104,31 @@ class Preprocessor:
         """
         raise NotImplementedError
 
+    @contextmanager
+    def _prepared(self):
+        """
+        Context in which _preprocess can be called. Override it to set up
+        a state that cannot be stored with the preprocessor (e.g. compiled
+        regular expressions that are not deepcopy-able).
+        """
+        yield
+
+    def _process_document(
+            self, document: str, tokens: Optional[List[str]],
+            pos_tags: Optional[List[str]]
+    ) -> Tuple[str, Optional[List[str]], Optional[List[str]]]:
+        """
+        Preprocess a single document and its tokens and POS tags, the same
+        way as __call__ would do it for the entire corpus. Implemented by
+        fusable preprocessors.
+
+        :param document: preprocessed document
+        :param tokens: document's tokens or None when corpus is not tokenized
+        :param pos_tags: tokens' POS tags or None when not tagged
+        :return: document, tokens and POS tags after preprocessing
+        """
+        raise NotImplementedError
+
 
 class TokenizedPreprocessor(Preprocessor):
     def __call__(self, corpus: Corpus, callback: Callable) -> Corpus:
@@ -113,11 +153,74 @@ class NGrams(TokenizedPreprocessor):
         return corpus
 
 
+def _preprocess_shard(preprocessors: List, corpus: Corpus, fused: bool) -> Tuple:
+    """
+    Apply preprocessors to a part of the corpus. It is run in a worker process
+    so it only returns the preprocessing results and not the entire corpus.
+    """
+    corpus = PreprocessorList(preprocessors, fused=fused)(corpus)
+    tokens = None
+    if corpus.has_tokens():
+        tokens = [list(t) for t in corpus.tokens]
+    pos_tags = corpus.pos_tags
+    if pos_tags is not None:
+        pos_tags = [list(t) for t in pos_tags]
+    return tokens, pos_tags, corpus._transformed_documents(), corpus.ngram_range
+
+
+def effective_n_jobs(n_jobs: Optional[int], n_items: int) -> int:
+    """
+    Number of worker processes for n_items items: None and 0 mean one
+    process and negative values count back from the number of CPUs, so
+    -1 uses all of them.
+    """
+    if n_jobs is None or n_jobs == 0:
+        n_jobs = 1
+    elif n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return min(n_jobs, n_items)
+
+
 class PreprocessorList:
-    """ Store a list of preprocessors and on call apply them to the corpus. """
+    """ Store a list of preprocessors and on call apply them to the corpus.
+
+    Parameters
+    ----------
+    preprocessors
+        Preprocessors applied in the given order.
+    n_jobs
+        Number of worker processes. When larger than 1 (or -1 for all CPUs)
+        the corpus is split into parts which are preprocessed in parallel.
+        Preprocessors that are not document-local (e.g. document frequency
+        filters) are applied afterwards on the entire corpus.
+    fused
+        If True, consecutive transformers, tokenizers, normalizers and token
+        filters are applied in a single pass over documents, without an
+        intermediate corpus and token list for each of them. The result is
+        the same as when applying them one by one.
+    cache
+        PreprocessingCache with results of previous calls. When the corpus
+        was already preprocessed with the same preprocessors, the results
+        are loaded from the cache instead of preprocessing again.
+    """
+    # number of corpus parts per worker; more parts give a finer progress
+    # and faster response to interruption
+    SHARDS_PER_JOB = 4
 
-    def __init__(self, preprocessors: List):
+    def __init__(self, preprocessors: List, n_jobs: int = 1,
+                 fused: bool = False, cache: Optional["PreprocessingCache"] = None):
         self.preprocessors = preprocessors
+        self.n_jobs = n_jobs
+        self.fused = fused
+        self.cache = cache
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # support old pickles created before parallel and fused execution
+        # and caching were implemented
+        self.__dict__.setdefault("n_jobs", 1)
+        self.__dict__.setdefault("fused", False)
+        self.__dict__.setdefault("cache", None)
 
     def __call__(self, corpus: Corpus, callback: Callable = None) \
             -> Corpus:
@@ -131,10 +234,155 @@ class PreprocessorList:
         """
         if callback is None:
             callback = dummy_callback
-        n_pps = len(list(self.preprocessors))
-        for i, pp in enumerate(self.preprocessors):
-            start = i / n_pps
-            cb = wrap_callback(callback, start=start, end=start + 1 / n_pps)
-            corpus = pp(corpus, cb)
+        preprocessors = list(self.preprocessors)
+        if self.cache is not None:
+            key = self.cache.key(corpus, preprocessors)
+            cached = self.cache.get(corpus, preprocessors, key)
+            if cached is not None:
+                callback(1)
+                return cached
+            result = self._call(corpus, preprocessors, callback)
+            self.cache.store(corpus, preprocessors, result, key)
+            return result
+        return self._call(corpus, preprocessors, callback)
+
+    def _call(self, corpus: Corpus, preprocessors: List,
+              callback: Callable) -> Corpus:
+        n_pps = len(preprocessors)
+        n_jobs = effective_n_jobs(self.n_jobs, len(corpus))
+        n_local = 0
+        if n_jobs > 1:
+            while n_local < n_pps and preprocessors[n_local].document_local:
+                n_local += 1
+        if n_local > 0:
+            corpus = self._parallel_call(
+                corpus, preprocessors[:n_local], n_jobs, self.fused,
+                wrap_callback(callback, end=n_local / n_pps)
+            )
+        i = n_local
+        while i < n_pps:
+            n_steps = 1
+            # consecutive token filters are combined into a single pass
+            # over tokens, even when not fused
+            attr = "fusable" if self.fused else "combinable"
+            while i + n_steps < n_pps \
+                    and getattr(preprocessors[i], attr, False) \
+                    and getattr(preprocessors[i + n_steps], attr, False):
+                n_steps += 1
+            start, end = i / n_pps, (i + n_steps) / n_pps
+            cb = wrap_callback(callback, start=start, end=end)
+            if n_steps > 1 and self.fused:
+                corpus = self._fused_call(corpus, preprocessors[i:i + n_steps], cb)
+            elif n_steps > 1:
+                from orangecontrib.text.preprocess import CombinedTokenFilter
+                corpus = CombinedTokenFilter(preprocessors[i:i + n_steps])(corpus, cb)
+            else:
+                corpus = preprocessors[i](corpus, cb)
+            i += n_steps
         callback(1)
         return corpus
+
+    @staticmethod
+    def _record_used(corpus: Corpus, preprocessors: List) -> bool:
+        """
+        Record preprocessors as used on the corpus, the same as when they are
+        applied one by one, and return whether the corpus is tokenized after
+        them.
+        """
+        from orangecontrib.text.preprocess import BaseTransformer, \
+            BASE_TOKENIZER, TokenizedPreprocessor
+
+        has_tokens = corpus.has_tokens()
+        for pp in preprocessors:
+            corpus.used_preprocessor = pp
+            if isinstance(pp, TokenizedPreprocessor) and not has_tokens:
+                # normalizers and filters tokenize the corpus when not tokenized
+                corpus.used_preprocessor = BASE_TOKENIZER
+            has_tokens |= not isinstance(pp, BaseTransformer)
+        return has_tokens
+
+    @staticmethod
+    def _fused_call(corpus: Corpus, preprocessors: List,
+                    callback: Callable) -> Corpus:
+        """
+        Apply fusable preprocessors in a single pass over documents; each
+        document is passed through all preprocessors before the next one is
+        processed and tokens are stored only once at the end.
+        """
+        from orangecontrib.text.preprocess import BaseTransformer
+
+        ids = corpus.ids
+        corpus = corpus.copy()
+        corpus.ids = ids
+        has_tokens = PreprocessorList._record_used(corpus, preprocessors)
+        transforms_documents = any(
+            isinstance(pp, BaseTransformer) for pp in preprocessors)
+
+        callback(0, "Preprocessing...")
+        documents = corpus.pp_documents
+        tokens = corpus.tokens if corpus.has_tokens() else None
+        pos_tags = corpus.pos_tags
+        n = len(documents)
+        new_docs, new_tokens, new_tags = [], [], []
+        with ExitStack() as stack:
+            for pp in preprocessors:
+                stack.enter_context(pp._prepared())
+            for i, doc in enumerate(documents):
+                callback(i / n)
+                toks = None if tokens is None else tokens[i]
+                tags = None if pos_tags is None else pos_tags[i]
+                for pp in preprocessors:
+                    doc, toks, tags = pp._process_document(doc, toks, tags)
+                new_docs.append(doc)
+                new_tokens.append(toks)
+                new_tags.append(tags)
+
+        if transforms_documents:
+            corpus.pp_documents = new_docs
+        if has_tokens:
+            corpus.store_tokens(new_tokens)
+            corpus.pos_tags = None if not n or new_tags[0] is None \
+                else np.array(new_tags, dtype=object)
+        return corpus
+
+    @staticmethod
+    def _parallel_call(corpus: Corpus, preprocessors: List, n_jobs: int,
+                       fused: bool, callback: Callable) -> Corpus:
+        """
+        Split the corpus into parts by documents, apply the preprocessors to
+        each part in a worker process, and merge results in the original
+        order. The callback is called when a part is finished; when it raises
+        (on interruption) parts that have not started yet are cancelled.
+        """
+        n = len(corpus)
+        shard_size = ceil(n / (n_jobs * PreprocessorList.SHARDS_PER_JOB))
+        bounds = [(s, min(s + shard_size, n)) for s in range(0, n, shard_size)]
+        results = [None] * len(bounds)
+        executor = ProcessPoolExecutor(max_workers=n_jobs)
+        try:
+            futures = {
+                executor.submit(
+                    _preprocess_shard, preprocessors, corpus[s:e], fused
+                ): i
+                for i, (s, e) in enumerate(bounds)
+            }
+            callback(0, "Preprocessing...")
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                callback(done / len(bounds))
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        tokens, pos_tags, pp_documents, ngram_range = zip(*results)
+        ids = corpus.ids
+        corpus = corpus.copy()
+        corpus.ids = ids
+        PreprocessorList._record_used(corpus, preprocessors)
+        corpus.ngram_range = ngram_range[0]
+        if pp_documents[0] is not None:
+            corpus.pp_documents = list(chain.from_iterable(pp_documents))
+        if tokens[0] is not None:
+            corpus.store_tokens(list(chain.from_iterable(tokens)))
+        corpus.pos_tags = None if pos_tags[0] is None else \
+            np.array(list(chain.from_iterable(pos_tags)), dtype=object)
+        return corpus
@@ -1,4 +1,5 @@
-from typing import List, Callable
+from contextlib import contextmanager
+from typing import List, Callable, Optional, Tuple
 import re
 from nltk import tokenize
 
@@ -7,6 +8,7 @@ from Orange.util import wrap_callback, dummy_callback
 from orangecontrib.text import Corpus
 from orangecontrib.text.misc import wait_nltk_data
 from orangecontrib.text.preprocess import Preprocessor
+from orangecontrib.text.preprocess.batch import batch_findall
 
 __all__ = ['BaseTokenizer', 'WordPunctTokenizer', 'PunktSentenceTokenizer',
            'RegexpTokenizer', 'WhitespaceTokenizer', 'TweetTokenizer',
@@ -15,6 +17,7 @@ __all__ = ['BaseTokenizer', 'WordPunctTokenizer', 'PunktSentenceTokenizer',
 
 class BaseTokenizer(Preprocessor):
     tokenizer = NotImplemented
+    fusable = True
 
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
         corpus = super().__call__(corpus)
@@ -24,7 +27,13 @@ class BaseTokenizer(Preprocessor):
         return self._store_tokens_from_documents(corpus, callback)
 
     def _preprocess(self, string: str) -> List[str]:
-        return list(filter(lambda x: x != '', self.tokenizer.tokenize(string)))
+        return [token for token in self.tokenizer.tokenize(string) if token != '']
+
+    def _process_document(
+            self, document: str, tokens: Optional[List[str]],
+            pos_tags: Optional[List[str]]
+    ) -> Tuple[str, Optional[List[str]], Optional[List[str]]]:
+        return document, self._preprocess(document), None
 
 
 class WordPunctTokenizer(BaseTokenizer):
@@ -53,6 +62,8 @@ class RegexpTokenizer(BaseTokenizer):
     """ Split by regular expression, default keeps only words. """
     tokenizer_cls = tokenize.RegexpTokenizer
     name = 'Regexp'
+    # flags with which nltk's RegexpTokenizer compiles the pattern
+    flags = re.UNICODE | re.MULTILINE | re.DOTALL
 
     def __init__(self, pattern=r'\w+'):
         super().__init__()
@@ -60,22 +71,34 @@ class RegexpTokenizer(BaseTokenizer):
         self.__pattern = pattern
 
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
+        with self._prepared():
+            return super().__call__(corpus, callback)
+
+    @contextmanager
+    def _prepared(self):
         # Compiled Regexes are NOT deepcopy-able and hence to make Corpus deepcopy-able
         # we cannot store then (due to Corpus also storing used_preprocessor for BoW compute values).
         # To bypass the problem regex is compiled before every __call__ and discarded right after.
         self.tokenizer = self.tokenizer_cls(self.__pattern)
-        corpus = Preprocessor.__call__(self, corpus)
-        if callback is None:
-            callback = dummy_callback
-        callback(0, "Tokenizing...")
-        corpus = self._store_tokens_from_documents(corpus, callback)
-        self.tokenizer = None
-        return corpus
+        try:
+            yield
+        finally:
+            self.tokenizer = None
 
     def _preprocess(self, string: str) -> List[str]:
         assert self.tokenizer is not None
         return super()._preprocess(string)
 
+    def _store_tokens_from_documents(self, corpus: Corpus,
+                                     callback: Callable) -> Corpus:
+        # scan many documents at once instead of calling the tokenizer
+        # for each document
+        tokens = batch_findall(self.__pattern, self.flags, corpus.pp_documents,
+                               self._preprocess, callback)
+        corpus.pos_tags = None
+        corpus.store_tokens(tokens)
+        return corpus
+
     @staticmethod
     def validate_regexp(regexp: str) -> bool:
         try:
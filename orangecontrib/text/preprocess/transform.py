@@ -1,27 +1,73 @@
-from typing import Callable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from itertools import chain, islice
+from math import ceil
+from typing import Callable, List, Optional, Tuple
 import re
 
 from bs4 import BeautifulSoup
 from sklearn.feature_extraction.text import strip_accents_unicode
 
-from Orange.util import wrap_callback, dummy_callback
+from Orange.util import dummy_callback
 
 from orangecontrib.text import Corpus
 from orangecontrib.text.preprocess import Preprocessor
+from orangecontrib.text.preprocess.batch import batch_sub
+from orangecontrib.text.preprocess.preprocess import effective_n_jobs
+from orangecontrib.text.tokens import CompactTokens
 
 __all__ = ['BaseTransformer', 'HtmlTransformer', 'LowercaseTransformer',
            'StripAccentsTransformer', 'UrlRemover', 'BASE_TRANSFORMER']
 
 
 class BaseTransformer(Preprocessor):
+    fusable = True
+
     def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
         corpus = super().__call__(corpus)
         if callback is None:
             callback = dummy_callback
         callback(0, "Transforming...")
-        corpus = self._store_documents(corpus, wrap_callback(callback, end=0.5))
-        return self._store_tokens(corpus, wrap_callback(callback, start=0.5)) \
-            if corpus.has_tokens() else corpus
+        if corpus.has_tokens():
+            # documents are transformed later, only if they are used again
+            corpus.defer_transform(self)
+            return self._store_tokens(corpus, callback)
+        return self._store_documents(corpus, callback)
+
+    def _store_documents(self, corpus: Corpus, callback: Callable) -> Corpus:
+        corpus.pp_documents = self._transform_strings(corpus.pp_documents, callback)
+        return corpus
+
+    def _store_tokens(self, corpus: Corpus, callback: Callable) -> Corpus:
+        tokens = corpus.tokens
+        if isinstance(tokens, CompactTokens):
+            # each distinct token is transformed once
+            corpus.store_tokens(tokens.map_vocabulary(
+                self._transform_strings(tokens.vocabulary, callback)))
+        else:
+            words = iter(self._transform_strings(list(chain(*tokens)), callback))
+            corpus.store_tokens([list(islice(words, len(t))) for t in tokens])
+        return corpus
+
+    def _transform_strings(self, strings, callback: Callable) -> List[str]:
+        """
+        Transform a list of documents or tokens. Override to transform
+        them together instead of one by one.
+        """
+        transformed, n = [], len(strings)
+        for i, string in enumerate(strings):
+            callback(i / n)
+            transformed.append(self._preprocess(string))
+        return transformed
+
+    def _process_document(
+            self, document: str, tokens: Optional[List[str]],
+            pos_tags: Optional[List[str]]
+    ) -> Tuple[str, Optional[List[str]], Optional[List[str]]]:
+        if tokens is not None:
+            tokens = [self._preprocess(t) for t in tokens]
+        return self._preprocess(document), tokens, pos_tags
 
 
 class LowercaseTransformer(BaseTransformer):
@@ -40,28 +86,127 @@ class StripAccentsTransformer(BaseTransformer):
         return strip_accents_unicode(string)
 
 
+class _TagStripper(HTMLParser):
+    """
+    Collect text between tags while parsing, without building a tree. For
+    documents with only tags and text this gives the same text as
+    BeautifulSoup's getText; parsing is marked as failed on anything else:
+    entities, comments, declarations and elements whose content is not
+    parsed as html.
+    """
+    RAW_ELEMENTS = {"script", "style", "template", "textarea", "title", "xmp",
+                    "iframe", "noembed", "noframes", "noscript", "plaintext"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.parts = []
+        self.failed = False
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.RAW_ELEMENTS:
+            self.failed = True
+
+    def _fail(self, *_):
+        self.failed = True
+
+    handle_entityref = handle_charref = handle_comment = handle_decl = \
+        handle_pi = unknown_decl = _fail
+
+
+def _strip_html(string: str) -> str:
+    if "<" not in string and "&" not in string:
+        return string
+    if "&" not in string:
+        parser = _TagStripper()
+        try:
+            parser.feed(string)
+            parser.close()
+        except Exception:  # pylint: disable=broad-except
+            parser.failed = True
+        if not parser.failed:
+            return "".join(parser.parts)
+    return BeautifulSoup(string, 'html.parser').getText()
+
+
+def _strip_html_batch(strings: List[str]) -> List[str]:
+    return [_strip_html(string) for string in strings]
+
+
 class HtmlTransformer(BaseTransformer):
-    """ Removes all html tags from string. """
+    """
+    Removes all html tags from string.
+
+    Strings without markup are kept as they are, and strings with only tags
+    and text are stripped by a streaming parser; BeautifulSoup parses only
+    the rest (e.g. strings with entities).
+
+    Parameters
+    ----------
+    n_jobs
+        Number of worker processes that strip parts of large corpora;
+        -1 uses all CPUs.
+    """
     name = "Parse html"
+    # number of strings stripped by a worker at once
+    BATCH_SIZE = 1000
+    # default for transformers pickled before parallel stripping was
+    # introduced; their pickles have no state
+    n_jobs = 1
+
+    def __init__(self, n_jobs: int = 1):
+        super().__init__()
+        self.n_jobs = n_jobs
 
     def _preprocess(self, string: str) -> str:
-        return BeautifulSoup(string, 'html.parser').getText()
+        return _strip_html(string)
+
+    def _transform_strings(self, strings, callback: Callable) -> List[str]:
+        strings = list(strings)
+        n_batches = ceil(len(strings) / self.BATCH_SIZE)
+        n_jobs = effective_n_jobs(self.n_jobs, n_batches)
+        if n_jobs <= 1:
+            return super()._transform_strings(strings, callback)
+        stripped = []
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_strip_html_batch, strings[i:i + self.BATCH_SIZE])
+                       for i in range(0, len(strings), self.BATCH_SIZE)]
+            for i, future in enumerate(futures):
+                stripped.extend(future.result())
+                callback((i + 1) / n_batches)
+        return stripped
 
 
 class UrlRemover(BaseTransformer):
     """ Removes hyperlinks. """
     name = "Remove urls"
     urlfinder = None
+    pattern = r"((https?):((//)|(\\\\))+([\w\d:#@%/;$()~_?\+-=\\\.&](#!)?)*)"
 
-    def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
-        self.urlfinder = re.compile(r"((https?):((//)|(\\\\))+([\w\d:#@%/;$()~_?\+-=\\\.&](#!)?)*)")
-        corpus = super().__call__(corpus, callback)
+    def __init__(self):
+        super().__init__()
         self.urlfinder = None
-        return corpus
+
+    def __call__(self, corpus: Corpus, callback: Callable = None) -> Corpus:
+        with self._prepared():
+            return super().__call__(corpus, callback)
+
+    @contextmanager
+    def _prepared(self):
+        self.urlfinder = re.compile(self.pattern)
+        try:
+            yield
+        finally:
+            self.urlfinder = None
 
     def _preprocess(self, string: str) -> str:
         assert self.urlfinder is not None
         return self.urlfinder.sub('', string)
 
+    def _transform_strings(self, strings, callback: Callable) -> List[str]:
+        return batch_sub(self.pattern, 0, '', strings, self._preprocess, callback)
+
 
 BASE_TRANSFORMER = LowercaseTransformer()
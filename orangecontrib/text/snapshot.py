@@ -0,0 +1,278 @@
+"""
+Binary snapshot of a Corpus that opens without unpickling its data.
+
+A snapshot is a single file: a magic string, the length of a pickled header
+and the header itself, followed by raw arrays, each aligned to ALIGNMENT
+bytes. The header holds the domain, used preprocessor and other metadata
+together with the position, dtype and shape of each array. Arrays are
+memory-mapped on open, so pages are read from disk only when used.
+
+Tokens and POS tags are stored as vocabulary indices with offsets of
+documents (see CompactTokens), sparse matrices as their CSR arrays and
+string columns as a UTF-8 buffer with offsets of values.
+"""
+import os
+import pickle
+import struct
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from orangecontrib.text.corpus import Corpus
+from orangecontrib.text.tokens import CompactTokens
+
+__all__ = ["save_snapshot", "open_snapshot", "is_snapshot", "SNAPSHOT_EXTENSION"]
+
+MAGIC = b"ORANGE-TEXT-CORPUS-SNAPSHOT\x00"
+VERSION = 1
+ALIGNMENT = 64
+SNAPSHOT_EXTENSION = ".corpus"
+_LENGTH = struct.Struct("<Q")
+
+
+def _aligned(position: int) -> int:
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+def is_snapshot(path: str) -> bool:
+    """ Tell whether the file at path is a corpus snapshot """
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class _Writer:
+    """ Collect arrays and their descriptions for the header """
+
+    def __init__(self):
+        self.arrays: List[np.ndarray] = []
+        self.layout: Dict[str, Tuple[int, str, Tuple[int, ...]]] = {}
+        self.size = 0
+
+    def array(self, name: str, array: np.ndarray) -> str:
+        array = np.ascontiguousarray(array)
+        assert array.dtype != object
+        self.layout[name] = (self.size, array.dtype.str, array.shape)
+        self.arrays.append(array)
+        self.size = _aligned(self.size + array.nbytes)
+        return name
+
+    def strings(self, name: str, values) -> Tuple:
+        """
+        Store strings as UTF-8 buffer with offsets; values that are not
+        strings (e.g. missing values) are kept in the header.
+        """
+        others = {}
+        encoded = []
+        for i, value in enumerate(values):
+            if isinstance(value, str):
+                encoded.append(value.encode("utf-8", "surrogatepass"))
+            else:
+                others[i] = value
+                encoded.append(b"")
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64,
+                              count=len(encoded)), out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return ("strings", self.array(name + ".data", data),
+                self.array(name + ".offsets", offsets), others)
+
+    def matrix(self, name: str, matrix) -> Tuple:
+        if sp.issparse(matrix):
+            matrix = sp.csr_matrix(matrix)
+            return ("csr", matrix.shape,
+                    self.array(name + ".data", matrix.data),
+                    self.array(name + ".indices", matrix.indices),
+                    self.array(name + ".indptr", matrix.indptr))
+        return ("dense", self.array(name, np.asarray(matrix)))
+
+    def tokens(self, name: str, tokens) -> Optional[Tuple]:
+        if tokens is None:
+            return None
+        if not isinstance(tokens, CompactTokens):
+            tokens = CompactTokens.from_lists(tokens)
+        return ("tokens", self.array(name + ".ids", tokens.ids),
+                self.array(name + ".offsets", tokens.offsets),
+                self.strings(name + ".vocabulary", tokens.vocabulary))
+
+    def write(self, f: BinaryIO, header: Dict):
+        header["arrays"] = self.layout
+        header = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header)))
+        f.write(header)
+        start = _aligned(f.tell())
+        for array, (offset, _, _) in zip(self.arrays, self.layout.values()):
+            f.write(b"\x00" * (start + offset - f.tell()))
+            f.write(array.tobytes())
+
+
+def save_snapshot(corpus: Corpus, path: str) -> None:
+    """
+    Save the corpus to a snapshot file at path.
+
+    Parameters
+    ----------
+    corpus
+        Corpus to save.
+    path
+        Path of the file.
+    """
+    writer = _Writer()
+    domain = corpus.domain
+    if sp.issparse(corpus.metas):
+        metas = writer.matrix("metas", corpus.metas)
+    else:
+        metas = ("columns", [
+            writer.strings(f"metas.{i}", corpus.metas[:, i]) if var.is_string
+            else ("dense", writer.array(f"metas.{i}",
+                                        corpus.metas[:, i].astype(float)))
+            for i, var in enumerate(domain.metas)])
+
+    # titles that are not computed yet are computed again after opening
+    titles = corpus._titles
+    if titles is not None:
+        titles = writer.strings("titles", titles.tolist()) \
+            if titles.dtype.kind in "OU" else ("dense", writer.array("titles", titles))
+
+    documents = corpus._transformed_documents()
+    header = {
+        "version": VERSION,
+        "domain": domain,
+        "name": corpus.name,
+        "attributes": corpus.attributes,
+        "text_features": corpus.text_features,
+        "ngram_range": corpus.ngram_range,
+        "used_preprocessor": corpus.used_preprocessor,
+        "compact_tokens": corpus.compact_tokens,
+        "X": writer.matrix("X", corpus.X),
+        "Y": writer.matrix("Y", corpus._Y),
+        "metas": metas,
+        "W": writer.array("W", corpus.W),
+        "ids": writer.array("ids", corpus.ids),
+        "tokens": writer.tokens("tokens", corpus._tokens),
+        "pos_tags": writer.tokens("pos_tags", corpus._pos_tags),
+        "pp_documents": None if documents is None
+                        else writer.strings("pp_documents", documents),
+        "titles": titles,
+    }
+    with open(path, "wb") as f:
+        writer.write(f, header)
+
+
+class _Reader:
+    def __init__(self, path: str, start: int, layout: Dict, mmap: bool):
+        self.path = path
+        self.start = start
+        self.layout = layout
+        self.mmap = mmap
+
+    def array(self, name: str) -> np.ndarray:
+        offset, dtype, shape = self.layout[name]
+        offset += self.start
+        if not np.prod(shape):  # an empty file region cannot be mapped
+            return np.empty(shape, dtype=dtype)
+        if self.mmap:
+            # copy-on-write: changes of arrays are not written to the file
+            return np.memmap(self.path, dtype=dtype, mode="c", offset=offset,
+                             shape=shape)
+        count = int(np.prod(shape))
+        return np.fromfile(self.path, dtype=dtype, count=count,
+                           offset=offset).reshape(shape)
+
+    def strings(self, description: Tuple) -> List:
+        _, data, offsets, others = description
+        data = self.array(data).tobytes()
+        offsets = self.array(offsets).tolist()
+        values = [data[s:e].decode("utf-8", "surrogatepass")
+                  for s, e in zip(offsets[:-1], offsets[1:])]
+        for i, value in others.items():
+            values[i] = value
+        return values
+
+    def matrix(self, description: Tuple):
+        if description[0] == "csr":
+            _, shape, data, indices, indptr = description
+            return sp.csr_matrix(
+                (self.array(data), self.array(indices), self.array(indptr)),
+                shape=shape, copy=False)
+        return self.array(description[1])
+
+    def tokens(self, description: Optional[Tuple]) -> Optional[CompactTokens]:
+        if description is None:
+            return None
+        _, ids, offsets, vocabulary = description
+        words = self.strings(vocabulary)
+        vocabulary = np.empty(len(words), dtype=object)
+        vocabulary[:] = words
+        return CompactTokens(self.array(ids), self.array(offsets), vocabulary)
+
+
+def open_snapshot(path: str, mmap: bool = True) -> Corpus:
+    """
+    Open a corpus saved with save_snapshot.
+
+    Parameters
+    ----------
+    path
+        Path of the file.
+    mmap
+        If True, numeric arrays, tokens and POS tags are memory-mapped
+        (changes to them are not written back to the file); otherwise they
+        are read into memory.
+
+    Returns
+    -------
+    Corpus from the snapshot.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{os.path.basename(path)} is not a corpus snapshot")
+        (length,) = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = pickle.loads(f.read(length))
+    if header["version"] > VERSION:
+        raise ValueError("Snapshot was saved by a newer version of the add-on")
+    reader = _Reader(path, _aligned(len(MAGIC) + _LENGTH.size + length),
+                     header["arrays"], mmap)
+
+    domain = header["domain"]
+    n_rows = len(reader.array(header["ids"]))
+    metas = header["metas"]
+    if metas[0] == "columns":
+        columns = metas[1]
+        metas = np.empty((n_rows, len(columns)), dtype=object)
+        for i, column in enumerate(columns):
+            metas[:, i] = reader.strings(column) if column[0] == "strings" \
+                else reader.array(column[1])
+    else:
+        metas = reader.matrix(metas)
+
+    W = reader.array(header["W"])
+    corpus = Corpus.from_numpy(
+        domain,
+        reader.matrix(header["X"]),
+        reader.matrix(header["Y"]),
+        metas,
+        W if W.size else None,
+        attributes=header["attributes"],
+        ids=reader.array(header["ids"]),
+        text_features=header["text_features"],
+    )
+    corpus.name = header["name"]
+    corpus.ngram_range = header["ngram_range"]
+    corpus.used_preprocessor = header["used_preprocessor"]
+    corpus.compact_tokens = True
+    corpus._tokens = reader.tokens(header["tokens"])
+    corpus._pos_tags = reader.tokens(header["pos_tags"])
+    # lists of tokens are created only when corpus was not compact
+    corpus.compact_tokens = header["compact_tokens"]
+    if header["pp_documents"] is not None:
+        corpus.pp_documents = reader.strings(header["pp_documents"])
+    titles = header["titles"]
+    if titles is not None:
+        corpus._titles = np.array(reader.strings(titles)) \
+            if titles[0] == "strings" else reader.array(titles[1])
+    return corpus
@@ -0,0 +1,220 @@
+"""
+Reading large text dumps (JSON lines, CSV or TSV) in chunks of documents.
+
+Types of columns are guessed from the first chunk and all chunks share the
+same domain. Values of discrete variables are added to variables as they
+appear, so codes of earlier chunks remain valid.
+"""
+import csv
+import json
+import os
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+import numpy as np
+import scipy.sparse as sp
+from Orange.data import (
+    ContinuousVariable,
+    DiscreteVariable,
+    Domain,
+    StringVariable,
+    TimeVariable,
+    Variable,
+)
+from Orange.data.io_util import guess_data_type
+
+from orangecontrib.text.corpus import Corpus, columns_from_documents
+from orangecontrib.text.tokens import CompactTokens
+
+__all__ = ["iter_chunks", "concatenate_chunks", "CHUNK_SIZE"]
+
+CHUNK_SIZE = 10000
+
+
+def _read_jsonl(f: TextIO) -> Iterator[Dict]:
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _csv_reader(delimiter: str) -> Callable[[TextIO], Iterator[Dict]]:
+    def read(f: TextIO) -> Iterator[Dict]:
+        return csv.DictReader(f, delimiter=delimiter)
+    return read
+
+
+READERS = {
+    ".jsonl": _read_jsonl,
+    ".ndjson": _read_jsonl,
+    ".csv": _csv_reader(","),
+    ".tsv": _csv_reader("\t"),
+}
+
+
+def _to_str(value) -> Optional[str]:
+    """ Value as a string; nested JSON values are kept as JSON """
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _guess_variable(name: str, values: List[Optional[str]]) -> Variable:
+    values = ["" if v is None else v for v in values]
+    valuemap, _, coltype = guess_data_type(values)
+    if coltype is DiscreteVariable:
+        return DiscreteVariable(name, values=valuemap)
+    if coltype in (ContinuousVariable, TimeVariable):
+        return coltype(name)
+    return StringVariable(name)
+
+
+def _getter(var: Variable) -> Callable[[Dict], object]:
+    name = var.name
+    if isinstance(var, StringVariable):
+        return lambda row: _to_str(row.get(name)) or ""
+    if isinstance(var, DiscreteVariable):
+        return lambda row: _to_str(row.get(name))
+    return lambda row: row.get(name)
+
+
+def _guess_domain(rows: List[Dict]) -> Domain:
+    # csv stores values of surplus fields under None
+    names = list(dict.fromkeys(
+        name for row in rows for name in row if name is not None))
+    variables = [_guess_variable(name, [_to_str(row.get(name)) for row in rows])
+                 for name in names]
+    return Domain([var for var in variables if var.is_primitive()],
+                  metas=[var for var in variables if not var.is_primitive()])
+
+
+def iter_chunks(
+        path: str,
+        chunk_size: int = CHUNK_SIZE,
+        text_features: Optional[List[str]] = None,
+        language: Optional[str] = None,
+        encoding: str = "utf-8",
+) -> Iterator[Corpus]:
+    """
+    Read a JSON lines (.jsonl, .ndjson), CSV or TSV file in chunks, without
+    loading the whole file.
+
+    Columns are keys of JSON objects (or the header row of CSV and TSV) that
+    appear in the first chunk; string columns become metas and other
+    columns attributes. A value of a numeric column that is not a number
+    raises ValueError.
+
+    Parameters
+    ----------
+    path
+        Path of the file.
+    chunk_size
+        Number of documents in a chunk.
+    text_features
+        Names of columns used as text features; the first string column
+        if None.
+    language
+        Language of documents.
+    encoding
+        Encoding of the file.
+
+    Returns
+    -------
+    Iterator over corpora with chunk_size documents (or fewer in the last
+    chunk), which share the domain.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported file type '{extension}'; "
+                         f"supported types are {', '.join(READERS)}")
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, encoding=encoding, newline="") as f:
+        rows = READERS[extension](f)
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        domain = _guess_domain(chunk)
+        attributes = [(var, _getter(var)) for var in domain.attributes]
+        metas = [(var, _getter(var)) for var in domain.metas]
+        if text_features is not None:
+            text_features = [domain[feature] for feature in text_features]
+        while chunk:
+            corpus = Corpus.from_numpy(
+                domain,
+                columns_from_documents(chunk, attributes),
+                metas=columns_from_documents(chunk, metas, dtype=object),
+                text_features=text_features,
+                language=language,
+            )
+            corpus.name = name
+            text_features = corpus.text_features
+            yield corpus
+            chunk = list(islice(rows, chunk_size))
+
+
+def _concatenate_tokens(chunks: List[Corpus], attr: str, compact: bool):
+    tokens = [getattr(chunk, attr) for chunk in chunks]
+    if any(t is None for t in tokens):
+        return None
+    if compact:
+        return CompactTokens.concatenate(
+            t if isinstance(t, CompactTokens) else CompactTokens.from_lists(t)
+            for t in tokens)
+    array = np.empty(sum(map(len, tokens)), dtype=object)
+    array[:] = [list(doc) for t in tokens for doc in t]
+    return array
+
+
+def _vstack(matrices: List):
+    if any(sp.issparse(m) for m in matrices):
+        return sp.vstack(matrices, format="csr")
+    if matrices[0].ndim == 1:
+        # Y of a table with a single class variable
+        return np.concatenate(matrices)
+    return np.vstack(matrices)
+
+
+def concatenate_chunks(chunks: Iterable[Corpus]) -> Corpus:
+    """
+    Concatenate chunks from iter_chunks, or corpora obtained from them by
+    transformations that keep the same domain (e.g. preprocessing), into a
+    single corpus. Tokens and POS tags are kept when all chunks have them.
+
+    Parameters
+    ----------
+    chunks
+        Corpora with equal domains.
+
+    Returns
+    -------
+    Corpus with documents of all chunks.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        raise ValueError("No chunks to concatenate")
+    first = chunks[0]
+    if any(chunk.domain != first.domain for chunk in chunks):
+        raise ValueError("Chunks must have the same domain")
+
+    W = np.concatenate([chunk.W for chunk in chunks])
+    corpus = Corpus.from_numpy(
+        first.domain,
+        _vstack([chunk.X for chunk in chunks]),
+        _vstack([chunk._Y for chunk in chunks]),
+        _vstack([chunk.metas for chunk in chunks]),
+        W if W.size else None,
+        attributes=first.attributes,
+        ids=np.concatenate([chunk.ids for chunk in chunks]),
+        text_features=first.text_features,
+    )
+    corpus.name = first.name
+    corpus.ngram_range = first.ngram_range
+    corpus.used_preprocessor = first.used_preprocessor
+    corpus.compact_tokens = first.compact_tokens
+    compact = first.compact_tokens
+    corpus._tokens = _concatenate_tokens(chunks, "_tokens", compact)
+    if corpus._tokens is not None:
+        corpus._pos_tags = _concatenate_tokens(chunks, "_pos_tags", compact)
+        documents = [chunk._transformed_documents() for chunk in chunks]
+        if all(docs is not None for docs in documents):
+            corpus.pp_documents = [doc for docs in documents for doc in docs]
+    return corpus
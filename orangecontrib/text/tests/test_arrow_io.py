@@ -0,0 +1,146 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+from Orange.data import ContinuousVariable, DiscreteVariable, StringVariable, \
+    TimeVariable
+
+from orangecontrib.text import Corpus
+from orangecontrib.text.preprocess import (
+    LowercaseTransformer,
+    PreprocessorList,
+    RegexpTokenizer,
+)
+from orangecontrib.text.tokens import CompactTokens
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from orangecontrib.text.arrow_io import corpus_from_arrow, corpus_to_arrow
+    SKIP = False
+except ImportError:
+    SKIP = True
+
+
+@unittest.skipIf(SKIP, "pyarrow is not installed.")
+class TestArrowIO(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.corpus = Corpus.from_file("book-excerpts")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def assert_same(self, corpus, read):
+        self.assertEqual(corpus.domain, read.domain)
+        self.assertEqual(corpus.name, read.name)
+        self.assertEqual(corpus.language, read.language)
+        self.assertEqual(corpus.text_features, read.text_features)
+        self.assertEqual(corpus.documents, read.documents)
+        assert_array_equal(corpus.X, read.X)
+        assert_array_equal(corpus.Y, read.Y)
+        assert_array_equal(corpus.metas, read.metas)
+
+    def test_parquet_round_trip(self):
+        path = self.path("corpus.parquet")
+        self.corpus.to_parquet(path)
+        self.assert_same(self.corpus, Corpus.from_parquet(path))
+
+    def test_arrow_ipc_round_trip(self):
+        path = self.path("corpus.arrow")
+        self.corpus.to_arrow_ipc(path)
+        self.assert_same(self.corpus, Corpus.from_arrow_ipc(path))
+        self.assert_same(self.corpus, Corpus.from_arrow_ipc(path, memory_map=False))
+
+    def test_tokens(self):
+        corpus = Corpus.from_file("deerwester")
+        corpus.compact_tokens = True
+        corpus = PreprocessorList([LowercaseTransformer(), RegexpTokenizer()])(corpus)
+        table = corpus_to_arrow(corpus)
+        self.assertTrue(pa.types.is_dictionary(table.schema.field("__tokens__").type.value_type))
+
+        path = self.path("corpus.parquet")
+        corpus.to_parquet(path)
+        read = Corpus.from_parquet(path)
+        self.assertIsInstance(read.tokens, CompactTokens)
+        self.assertEqual(read.tokens.tolist(), corpus.tokens.tolist())
+        self.assertEqual(read.pp_documents, corpus.pp_documents)
+
+        corpus.compact_tokens = False
+        corpus.to_arrow_ipc(self.path("corpus.arrow"))
+        read = Corpus.from_arrow_ipc(self.path("corpus.arrow"))
+        self.assertFalse(read.compact_tokens)
+        self.assertEqual(list(map(list, read.tokens)), list(map(list, corpus.tokens)))
+
+    def test_row_groups_and_columns(self):
+        path = self.path("corpus.parquet")
+        self.corpus.to_parquet(path, row_group_size=50)
+        read = Corpus.from_parquet(path, row_groups=[1])
+        self.assertEqual(read.documents, self.corpus.documents[50:100])
+
+        read = Corpus.from_parquet(path, columns=["Text", "Category"])
+        self.assertEqual([v.name for v in read.domain.metas], ["Text"])
+        self.assertEqual(read.documents, self.corpus.documents)
+
+        read = Corpus.from_parquet(path, row_groups=[0, 2])
+        self.assertEqual(read.documents, self.corpus.documents[:50]
+                         + self.corpus.documents[100:])
+
+        read = Corpus.from_parquet(path, filters=[("Category", "=", "adult")])
+        self.assertEqual(len(read), np.sum(self.corpus.get_column("Category") == 0))
+
+    def test_row_groups_with_tokens(self):
+        corpus = PreprocessorList([LowercaseTransformer(), RegexpTokenizer()])(self.corpus)
+        path = self.path("corpus.parquet")
+        # row groups 3, 4 and 6 contain no children's books
+        corpus.to_parquet(path, row_group_size=20)
+        tokens = corpus.tokens.tolist()
+
+        read = Corpus.from_parquet(path, row_groups=[0, 1, 5])
+        self.assertEqual(read.tokens.tolist(), tokens[:40] + tokens[100:120])
+
+        read = Corpus.from_parquet(path, filters=[("Category", "==", "children")])
+        mask = corpus.get_column("Category") == 1
+        self.assertEqual(read.tokens.tolist(),
+                         [t for t, m in zip(tokens, mask) if m])
+
+        read = Corpus.from_parquet(path, row_groups=[])
+        self.assertEqual(len(read), 0)
+        self.assertEqual(read.tokens.tolist(), [])
+
+        with self.assertRaises(ValueError):
+            Corpus.from_parquet(path, row_groups=[0], filters=[("Category", "=", "adult")])
+
+    def test_foreign_table(self):
+        table = pa.table({
+            "text": ["First doc", None, "third"],
+            "topic": pa.array(["a", "b", None]).dictionary_encode(),
+            "score": pa.array([1, None, 3], pa.int64()),
+            "date": pa.array([0, 86400 * 10 ** 6, None], pa.timestamp("us")),
+            "words": pa.array([["first", "doc"], [], ["third"]]),
+        })
+        path = self.path("foreign.parquet")
+        pq.write_table(table, path)
+        corpus = Corpus.from_parquet(path)
+        domain = corpus.domain
+        self.assertIsInstance(domain["text"], StringVariable)
+        self.assertIsInstance(domain["topic"], DiscreteVariable)
+        self.assertIsInstance(domain["score"], ContinuousVariable)
+        self.assertIsInstance(domain["date"], TimeVariable)
+        self.assertEqual(corpus.text_features, [domain["text"]])
+        self.assertEqual(corpus.documents, ["First doc", "?", "third"])
+        np.testing.assert_equal(corpus.get_column("topic"), [0, 1, np.nan])
+        np.testing.assert_equal(corpus.get_column("score"), [1, np.nan, 3])
+        np.testing.assert_equal(corpus.get_column("date"), [0, 86400, np.nan])
+        self.assertEqual(corpus.get_column("words")[0], '["first", "doc"]')
+
+        corpus = corpus_from_arrow(table, text_features=["text", "topic"])
+        self.assertEqual(corpus.documents[0], "First doc a")
+
+
+if __name__ == "__main__":
+    unittest.main()
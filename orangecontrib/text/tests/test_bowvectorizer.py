@@ -1,11 +1,15 @@
+import pickle
 import unittest
+from itertools import cycle, product
 from unittest.mock import MagicMock, call
 
 import numpy as np
+from gensim import corpora, matutils, models
 from Orange.data import Domain, StringVariable
 
 from orangecontrib.text import preprocess
 from orangecontrib.text.corpus import Corpus
+from orangecontrib.text.tokens import CompactTokens
 from orangecontrib.text.vectorization import BowVectorizer
 
 
@@ -237,6 +241,98 @@ class BowVectorizationTest(unittest.TestCase):
         idfs_test = self.test_counts * np.log(n / document_appearance)
         self.assert_bow_same(bow_test, idfs_test, self.terms)
 
+    def test_same_as_gensim(self):
+        """ Weights and dictionary match gensim's Dictionary and TfidfModel """
+        corpus = Corpus.from_file("book-excerpts")
+        corpus = preprocess.RegexpTokenizer(r"\w+")(corpus)
+        corpus = preprocess.NGrams(ngrams_range=(1, 2))(corpus)
+        train, test = corpus[:10], corpus[10:15]
+        train_docs = list(train.ngrams_iterator(" ", include_postags=True))
+        test_docs = list(test.ngrams_iterator(" ", include_postags=True))
+        dic = corpora.Dictionary(train_docs, prune_at=None)
+        combinations = product(BowVectorizer.wlocals, BowVectorizer.wglobals)
+        for (wlocal, wglobal), norm in zip(combinations, cycle(BowVectorizer.norms)):
+            vect = BowVectorizer(norm=norm, wlocal=wlocal, wglobal=wglobal)
+            model = models.TfidfModel(
+                dictionary=dic, normalize=False, wlocal=vect.wlocals[wlocal],
+                wglobal=vect.wglobals[wglobal]
+            )
+            for docs, data in ((train_docs, train), (test_docs, test)):
+                expected = matutils.corpus2csc(
+                    model[[dic.doc2bow(doc) for doc in docs]],
+                    dtype=float, num_terms=len(dic)
+                ).T
+                if vect.norms[norm]:
+                    expected = vect.norms[norm](expected)
+                bow = vect.transform(data, source_dict=dic)
+                X = bow.X[:, np.argsort(np.argsort([dic[i] for i in range(len(dic))]))]
+                X.sort_indices()
+                self.assertEqual(X.nnz, expected.nnz)
+                np.testing.assert_array_equal(X.indptr, expected.indptr)
+                np.testing.assert_array_equal(X.indices, expected.indices)
+                np.testing.assert_array_equal(X.data, expected.data)
+
+        bow = BowVectorizer().transform(train)
+        dictionary = bow.domain.attributes[0].compute_value.compute_shared.kwargs[
+            "source_dict"]
+        self.assertEqual(dictionary.token2id, dic.token2id)
+        self.assertEqual(dictionary.dfs, dic.dfs)
+        self.assertEqual(dictionary.cfs, dic.cfs)
+        self.assertEqual((dictionary.num_docs, dictionary.num_pos, dictionary.num_nnz),
+                         (dic.num_docs, dic.num_pos, dic.num_nnz))
+
+    def test_compact_tokens(self):
+        corpus = Corpus.from_file("deerwester")
+        bow = BowVectorizer(wglobal=BowVectorizer.IDF).transform(corpus)
+        corpus.compact_tokens = True
+        compact_bow = BowVectorizer(wglobal=BowVectorizer.IDF).transform(corpus)
+        self.assertIsInstance(compact_bow.tokens, CompactTokens)
+        self.assertEqual([a.name for a in bow.domain.attributes],
+                         [a.name for a in compact_bow.domain.attributes])
+        self.assertEqual((bow.X != compact_bow.X).nnz, 0)
+
+    def test_chunks(self):
+        corpus = Corpus.from_file("book-excerpts")[:12]
+        corpus = preprocess.RegexpTokenizer(r"\w+")(corpus)
+        corpus.ngram_range = (1, 2)
+        for wglobal, norm in ((BowVectorizer.NONE, BowVectorizer.NONE),
+                              (BowVectorizer.IDF, BowVectorizer.L2)):
+            expected = BowVectorizer(norm=norm, wglobal=wglobal).transform(corpus)
+            for chunk_size in (1, 5, 100):
+                vect = BowVectorizer(norm=norm, wglobal=wglobal, chunk_size=chunk_size)
+                bow = vect.transform(corpus)
+                self.assertEqual([a.name for a in bow.domain.attributes],
+                                 [a.name for a in expected.domain.attributes])
+                np.testing.assert_array_equal(bow.X.toarray(), expected.X.toarray())
+                self.assertFalse(bow.compact_tokens)
+                self.assertEqual([list(t) for t in bow.tokens],
+                                 [list(t) for t in expected.tokens])
+
+                computed = Corpus.from_table(bow.domain, corpus[3:8])
+                np.testing.assert_array_equal(computed.X.toarray(),
+                                              bow.X[3:8].toarray())
+
+        compact = corpus.copy()
+        compact.compact_tokens = True
+        bow = BowVectorizer(chunk_size=5).transform(compact)
+        self.assertIsInstance(bow.tokens, CompactTokens)
+        self.assertEqual(bow.tokens.tolist(), [list(t) for t in expected.tokens])
+
+        dictionary = expected.domain.attributes[0].compute_value.compute_shared.kwargs[
+            "source_dict"]
+        bow = BowVectorizer(chunk_size=5).transform(corpus)
+        chunked = bow.domain.attributes[0].compute_value.compute_shared.kwargs[
+            "source_dict"]
+        self.assertEqual(chunked.token2id, dictionary.token2id)
+        self.assertEqual(chunked.dfs, dictionary.dfs)
+        self.assertEqual(chunked.cfs, dictionary.cfs)
+
+    def test_chunks_unpickle(self):
+        vect = BowVectorizer()
+        del vect.chunk_size
+        vect = pickle.loads(pickle.dumps(vect))
+        self.assertIsNone(vect.chunk_size)
+
     def test_callback(self):
         vect = BowVectorizer()
         corpus = Corpus.from_file("deerwester")
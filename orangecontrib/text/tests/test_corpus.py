@@ -2,6 +2,7 @@ import os
 import pickle
 import unittest
 
+import nltk
 import numpy as np
 from numpy.testing import assert_array_equal
 from Orange.data import (
@@ -10,6 +11,7 @@ from Orange.data import (
     Domain,
     StringVariable,
     Table,
+    TimeVariable,
     dataset_dirs,
 )
 from orangewidget.utils.signals import summarize
@@ -22,7 +24,8 @@ from orangecontrib.text.preprocess import (
     RegexpTokenizer,
     StopwordsFilter,
 )
-from orangecontrib.text.tag import AveragedPerceptronTagger
+from orangecontrib.text.tag import AveragedPerceptronTagger, POSTagger
+from orangecontrib.text.tokens import CompactTokens
 
 
 class CorpusTests(unittest.TestCase):
@@ -273,6 +276,40 @@ class CorpusTests(unittest.TestCase):
         self.assertEqual(len(types), 1)
         self.assertIn(str, types)
 
+    def test_documents_cached(self):
+        c = Corpus.from_file('book-excerpts')
+        docs = c.documents
+        self.assertIs(c.documents, docs)
+        self.assertIs(c.copy().documents, docs)
+        self.assertEqual(c[2:5].documents, docs[2:5])
+        self.assertEqual(c[[4, 1]].documents, [docs[4], docs[1]])
+        self.assertEqual(c[3, :].documents, [docs[3]])
+        self.assertEqual(len(c[-1, :]), 1)
+        self.assertEqual(c[-1, :].documents, [docs[-1]])
+        self.assertEqual(pickle.loads(pickle.dumps(c)).documents, docs)
+
+        with c.unlocked(c.metas):
+            c.metas[0, 0] = "changed"
+        self.assertEqual(c.documents[0], "changed")
+        self.assertEqual(c.documents[1:], docs[1:])
+
+        c.set_text_features([c.domain.class_var])
+        self.assertEqual(c.documents, c.documents_from_features([c.domain.class_var]))
+
+    def test_documents_single_feature(self):
+        c = Corpus.from_file('deerwester')
+        with c.unlocked(c.metas):
+            c.metas[1, 0] = ""
+        docs = c.documents
+        self.assertEqual(docs[1], "?")
+        self.assertEqual(
+            docs,
+            [c.domain.metas[0].str_val(v) for v in c.metas[:, 0]])
+
+        with c.unlocked(c.metas):
+            c.metas[2, 0] = None
+        self.assertEqual(c.documents[2], c.domain.metas[0].str_val(None))
+
     def test_pp_documents(self):
         c = Corpus.from_file('book-excerpts')
         self.assertEqual(c.documents, c.pp_documents)
@@ -350,6 +387,33 @@ class CorpusTests(unittest.TestCase):
         for title, i in zip(c_sample.titles, range(11, 14)):
             self.assertEqual(f"children ({i})", title)
 
+    def test_titles_lazy(self):
+        c = Corpus.from_file('book-excerpts')
+        self.assertNotEqual(c._titles.dtype.kind, "U")
+        c_sample = c[[5, 2]]
+        self.assertEqual(list(c_sample.titles), ["Document 6", "Document 3"])
+        self.assertEqual(c.titles[-1], f"Document {len(c)}")
+        self.assertEqual(list(c.copy().titles), list(c.titles))
+
+        c.set_title_variable(c.domain[0])
+        self.assertIsNone(c._titles)
+        self.assertEqual(c.titles[10], "children (11)")
+        c = pickle.loads(pickle.dumps(c))
+        self.assertEqual(c[60:62].titles.tolist(), ["adult (11)", "adult (12)"])
+
+    def test_titles_lazy_subset(self):
+        c = Corpus.from_file('book-excerpts')
+        c.set_title_variable(c.domain[0])
+        c_sample = c[60:62][[1]]
+        self.assertIsNone(c._titles)
+        self.assertEqual(c_sample.titles.tolist(), ["adult (12)"])
+        self.assertEqual(c[61, :].titles.tolist(), ["adult (12)"])
+
+        c_sample = c[[10]]
+        data = pickle.dumps(c_sample)
+        self.assertLess(len(data), len(pickle.dumps(c)))
+        self.assertEqual(pickle.loads(data).titles.tolist(), ["children (11)"])
+
     def test_documents_from_features(self):
         c = Corpus.from_file('book-excerpts')
         docs = c.documents_from_features([c.domain.class_var])
@@ -558,6 +622,31 @@ class CorpusTests(unittest.TestCase):
         self.assertEqual([engine_dv.repr_val(v) for v in c.X[:, 0]],
                          [d['engine'] for d in documents])
 
+    def test_from_documents_columns(self):
+        documents = [{"kind": "b", "n": 1, "date": "2020-01-02", "text": "x"},
+                     {"kind": "a", "n": 2.5, "date": "2020-01-03", "text": "y"},
+                     {"kind": "b", "n": None, "date": "2020-01-02", "text": None},
+                     {"kind": "c", "n": "3", "date": "2020-01-04", "text": ""}]
+        kind = DiscreteVariable("kind", values=("c",))
+        attrs = [(kind, lambda doc: doc["kind"]),
+                 (ContinuousVariable("n"), lambda doc: doc["n"])]
+        class_vars = [(DiscreteVariable("class"), lambda doc: doc["n"] is None)]
+        metas = [(TimeVariable("date", have_date=True), lambda doc: doc["date"]),
+                 (StringVariable("text"), lambda doc: doc["text"])]
+        c = Corpus.from_documents(documents, "test", attrs, class_vars, metas)
+
+        self.assertEqual(kind.values, ("c", "b", "a"))
+        assert_array_equal(c.X, [[1, 1], [2, 2.5], [1, np.nan], [0, 3]])
+        self.assertEqual(c.domain.class_var.values, ("False", "True"))
+        assert_array_equal(c.Y, [0, 0, 1, 0])
+        self.assertEqual([c.domain.metas[0].str_val(v) for v in c.metas[:, 0]],
+                         [d["date"] for d in documents])
+        self.assertEqual(list(c.metas[:, 1]), ["x", "y", "", ""])
+
+        c = Corpus.from_documents([], "empty", attrs, class_vars, metas)
+        self.assertEqual(c.X.shape, (0, 2))
+        self.assertEqual(c.metas.shape, (0, 2))
+
     def test_corpus_remove_text_features(self):
         """
         Remove those text features which do not have a column in metas.
@@ -708,6 +797,125 @@ class CorpusTests(unittest.TestCase):
         self.assertEqual(2, corpus[:1].count_unique_tokens())
 
 
+class CompactTokensTests(unittest.TestCase):
+    def setUp(self):
+        self.pos_tagger = POSTagger(
+            nltk.RegexpTagger([(r"^\d+$", "CD"), (r".*s$", "NNS"), (r".*", "NN")])
+        )
+
+    def test_from_lists(self):
+        lists = [["a", "b", "a"], [], ["c"], ["b", "c"]]
+        tokens = CompactTokens.from_lists(lists)
+        self.assertEqual(len(tokens), 4)
+        self.assertEqual(tokens.ids.dtype, np.int32)
+        assert_array_equal(tokens.offsets, [0, 3, 3, 4, 6])
+        assert_array_equal(tokens.vocabulary, ["a", "b", "c"])
+        self.assertEqual(tokens.tolist(), lists)
+        self.assertEqual(tokens[-1], ["b", "c"])
+        self.assertEqual(tokens[[3, 0]].tolist(), [["b", "c"], ["a", "b", "a"]])
+        self.assertEqual(tokens[::2].tolist(), [["a", "b", "a"], ["c"]])
+        self.assertEqual(tokens[1:3].tolist(), [[], ["c"]])
+        self.assertEqual(tokens[3:1].tolist(), [])
+        self.assertEqual(tokens[1:3].count_unique(), 1)
+        with self.assertRaises(IndexError):
+            tokens[4]
+
+        tokens = CompactTokens.from_lists([["c", "d"]], vocabulary=["d", "e"])
+        assert_array_equal(tokens.vocabulary, ["d", "e", "c"])
+        assert_array_equal(tokens.ids, [2, 0])
+
+    def test_compress(self):
+        tokens = CompactTokens.from_lists([["a", "b", "a"], [], ["c", "a"]])
+        compressed = tokens.compress(np.array([True, False, True, True, False]))
+        self.assertEqual(compressed.tolist(), [["a", "a"], [], ["c"]])
+        self.assertIs(compressed.vocabulary, tokens.vocabulary)
+
+    def test_document_frequencies(self):
+        tokens = CompactTokens.from_lists([["b", "a", "b"], [], ["c", "a"], ["d"]])
+        tokens = tokens.compress(np.array([True] * 5 + [False]))
+        frequencies = tokens.document_frequencies()
+        self.assertIs(tokens.document_frequencies(), frequencies)
+        assert_array_equal(frequencies.vocabulary, ["b", "a", "c", "d"])
+        assert_array_equal(frequencies.dfs, [1, 2, 1, 0])
+        assert_array_equal(frequencies.cfs, [2, 2, 1, 0])
+        assert_array_equal(frequencies.term_ids, [1, 0, 2, -1])
+        assert_array_equal(frequencies.select(2), [False, True, False, False])
+        assert_array_equal(frequencies.select(0, .25), [True, False, True, False])
+        assert_array_equal(frequencies.select(0, 1, 2), [True, True, False, False])
+
+        words = np.array([True, False, True, True])
+        compressed = tokens.compress(words[tokens.ids], words)
+        restricted = compressed.document_frequencies()
+        self.assertIsNot(restricted, frequencies)
+        assert_array_equal(restricted.dfs, [1, 0, 1, 0])
+        assert_array_equal(restricted.term_ids, [0, -1, 1, -1])
+
+        tokens = pickle.loads(pickle.dumps(tokens))
+        self.assertIsNot(tokens.document_frequencies(), frequencies)
+
+    def test_map_vocabulary(self):
+        tokens = CompactTokens.from_lists([["ab", "b", "ac"], [], ["b"]])
+        mapped = tokens.map_vocabulary(["a", "b", "a"])
+        assert_array_equal(mapped.vocabulary, ["a", "b"])
+        self.assertEqual(mapped.tolist(), [["a", "b", "a"], [], ["b"]])
+        self.assertIs(mapped.offsets, tokens.offsets)
+
+    def test_compact_tokens(self):
+        corpus = Corpus.from_file("deerwester")
+        corpus = RegexpTokenizer()(LowercaseTransformer()(corpus))
+        corpus = self.pos_tagger(corpus)
+        compact = corpus.copy()
+        compact.compact_tokens = True
+        self.assertIsInstance(compact.tokens, CompactTokens)
+        self.assertIsInstance(compact.pos_tags, CompactTokens)
+        self.assertEqual(compact.tokens.tolist(), [list(t) for t in corpus.tokens])
+        self.assertEqual(compact.pos_tags.tolist(), [list(t) for t in corpus.pos_tags])
+        self.assertEqual(compact.count_tokens(), corpus.count_tokens())
+        self.assertEqual(compact.count_unique_tokens(), corpus.count_unique_tokens())
+
+        # copies share arrays
+        copied = compact.copy()
+        self.assertTrue(copied.compact_tokens)
+        self.assertIs(copied.tokens, compact.tokens)
+
+        # subsets
+        for key in (slice(2, 5), [4, 0, 4], np.arange(9) % 2 == 0, ...):
+            subset, expected = compact[key], corpus[key]
+            self.assertTrue(subset.compact_tokens)
+            self.assertEqual(subset.tokens.tolist(), [list(t) for t in expected.tokens])
+            self.assertEqual(subset.pos_tags.tolist(),
+                             [list(t) for t in expected.pos_tags])
+            self.assertEqual(subset.count_unique_tokens(),
+                             expected.count_unique_tokens())
+        self.assertTrue(np.shares_memory(compact[2:5].tokens.ids, compact.tokens.ids))
+
+        # ngrams
+        for ngram_range in ((1, 1), (1, 3), (2, 2), (10, 11)):
+            compact.ngram_range = corpus.ngram_range = ngram_range
+            self.assertEqual(list(compact.ngrams), list(corpus.ngrams))
+            self.assertEqual(list(compact.ngrams_iterator(include_postags=True)),
+                             list(corpus.ngrams_iterator(include_postags=True)))
+            self.assertEqual(list(compact.ngrams_iterator(join_with=None)),
+                             list(corpus.ngrams_iterator(join_with=None)))
+
+        # preprocessing keeps the storage
+        compact = preprocess.FrequencyFilter(min_df=2)(compact)
+        self.assertIsInstance(compact.tokens, CompactTokens)
+        expected = preprocess.FrequencyFilter(min_df=2)(corpus)
+        self.assertEqual(compact.tokens.tolist(), [list(t) for t in expected.tokens])
+
+        compact.compact_tokens = False
+        self.assertIsInstance(compact.tokens, np.ndarray)
+        self.assertIsInstance(compact.pos_tags, np.ndarray)
+
+    def test_compact_tokens_pickle(self):
+        corpus = RegexpTokenizer()(Corpus.from_file("deerwester"))
+        corpus.compact_tokens = True
+        unpickled = pickle.loads(pickle.dumps(corpus))
+        self.assertTrue(unpickled.compact_tokens)
+        self.assertEqual(unpickled.tokens.tolist(), corpus.tokens.tolist())
+
+
 class TestCorpusSummaries(unittest.TestCase):
     def test_corpus_not_preprocessed(self):
         """Check if details part of the summary is formatted correctly"""
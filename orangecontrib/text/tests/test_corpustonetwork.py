@@ -1,6 +1,9 @@
 import unittest
+from itertools import combinations
 
+import numpy as np
 from Orange.data import Table
+from scipy.sparse import issparse
 
 from orangecontrib.text import Corpus
 try:
@@ -86,6 +89,44 @@ class CorpusToNetworkTest(unittest.TestCase):
                       freq_threshold=1)
         self.assertIs(result1, result2)
 
+    def test_document_matrix(self):
+        corpus = Corpus.from_file('book-excerpts')[:30]
+        c2n = CorpusToNetwork(corpus)
+        c2n.BLOCK_PAIRS = 70  # multiple blocks with 2 documents
+        ngrams = [set(doc) for doc in c2n.ngram_list]
+        shared = np.array([[len(a & b) for b in ngrams] for a in ngrams])
+        shared = np.triu(shared, k=1)
+        for threshold in (60, 1, 120, 90):
+            result = c2n(document_nodes=True, threshold=threshold)
+            edges = result.edges[0].edges
+            self.assertTrue(issparse(edges))
+            np.testing.assert_array_equal(
+                edges.toarray(), np.where(shared >= threshold, shared, 0))
+        self.assertEqual(c2n.document_matrix_threshold, 1)
+
+    def test_word_matrix(self):
+        corpus = Corpus.from_file('deerwester')
+        c2n = CorpusToNetwork(corpus)
+        for window_size, threshold, freq_threshold in ((1, 1, 1), (3, 1, 2),
+                                                       (2, 2, 1)):
+            result = c2n(document_nodes=False, window_size=window_size,
+                         threshold=threshold, freq_threshold=freq_threshold)
+            words = list(result.nodes)
+            index = {w: i for i, w in enumerate(words)}
+            expected = np.zeros((len(words), len(words)))
+            for doc in c2n.ngram_list:
+                for i, j in combinations(range(len(doc)), 2):
+                    if j - i <= window_size and doc[i] in index and doc[j] in index:
+                        expected[index[doc[i]], index[doc[j]]] += 1
+            expected = np.triu(expected + expected.T) - np.diag(np.diag(expected))
+            expected[expected < threshold] = 0
+
+            edges = result.edges[0].edges.toarray()
+            edges = np.triu(edges + edges.T) - np.diag(np.diag(edges))
+            np.testing.assert_array_equal(edges, expected)
+            for word in words:
+                self.assertGreaterEqual(c2n.word_freqs[word], freq_threshold)
+
     def test_empty(self):
         corpus = Corpus.from_file('deerwester')[:0]
         c2n = CorpusToNetwork(corpus)
@@ -0,0 +1,76 @@
+import pickle
+import unittest
+from unittest.mock import MagicMock, call
+
+import numpy as np
+
+from orangecontrib.text.corpus import Corpus
+from orangecontrib.text.vectorization import BowVectorizer, HashingVectorizer
+
+
+class TestHashingVectorizer(unittest.TestCase):
+    def setUp(self):
+        self.corpus = Corpus.from_file('deerwester')
+
+    def test_transform(self):
+        vect = HashingVectorizer(n_features=64)
+        result = vect.transform(self.corpus)
+        self.assertIsInstance(result, Corpus)
+        self.assertEqual(len(result), len(self.corpus))
+        self.assertEqual(result.X.shape, (len(self.corpus), 64))
+        self.assertTrue(result.has_tokens())
+
+        # with enough columns counts sum to number of tokens
+        counts = result.X.sum(axis=1).A.ravel()
+        np.testing.assert_array_equal(counts, [len(t) for t in result.tokens])
+
+    def test_same_as_bow_without_collisions(self):
+        n_features = 2 ** 16
+        for wglobal, norm in ((BowVectorizer.NONE, BowVectorizer.NONE),
+                              (BowVectorizer.IDF, BowVectorizer.L2),
+                              (BowVectorizer.SMOOTH, BowVectorizer.L1)):
+            bow = BowVectorizer(norm=norm, wglobal=wglobal).transform(self.corpus)
+            hashed = HashingVectorizer(n_features, norm=norm, wglobal=wglobal)\
+                .transform(self.corpus)
+            # deerwester has no collisions in 2 ** 16 columns
+            columns = hashed.X.getnnz(axis=0) > 0
+            self.assertEqual(columns.sum(), len(bow.domain.attributes))
+            bow_columns = np.sort(bow.X.toarray(), axis=1)
+            hashed_columns = np.sort(hashed.X[:, columns].toarray(), axis=1)
+            np.testing.assert_array_almost_equal(bow_columns, hashed_columns)
+
+    def test_compute_values(self):
+        vect = HashingVectorizer(n_features=128, wglobal=BowVectorizer.IDF)
+        train, test = self.corpus[:5], self.corpus[5:]
+        hashed = vect.transform(train)
+        shared = {a.compute_value.compute_shared for a in hashed.domain.attributes}
+        self.assertEqual(len(shared), 1)
+
+        computed1 = Corpus.from_table(hashed.domain, test)
+        computed2 = Corpus.from_table(hashed.domain, test[1:])
+        self.assertEqual(hashed.domain, computed1.domain)
+        self.assertEqual((computed1.X[1:] != computed2.X).nnz, 0)
+        self.assertEqual((Corpus.from_table(hashed.domain, train).X != hashed.X).nnz, 0)
+
+        domain = pickle.loads(pickle.dumps(hashed.domain))
+        computed = Corpus.from_table(domain, test)
+        self.assertEqual((computed1.X != computed.X).nnz, 0)
+
+    def test_empty_corpus(self):
+        corpus = self.corpus[:0]
+        out = HashingVectorizer().transform(corpus)
+        self.assertEqual(len(out), 0)
+
+    def test_report(self):
+        vect = HashingVectorizer()
+        self.assertGreater(len(vect.report()), 0)
+
+    def test_callback(self):
+        vect = HashingVectorizer(n_features=64)
+        callback = MagicMock()
+        vect.transform(self.corpus, callback=callback)
+        callback.assert_has_calls([call(0.3), call(0.6), call(0.9), call(1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
 import pickle
+import re
 import shutil
+import sys
 import tempfile
 import unittest
 import os.path
@@ -8,6 +10,7 @@ import itertools
 from unittest.mock import patch, Mock
 
 import nltk
+from bs4 import BeautifulSoup
 from gensim import corpora
 from lemmagen3 import Lemmatizer
 from requests.exceptions import ConnectionError
@@ -17,10 +20,15 @@ from orangecontrib.text import preprocess, tag
 from orangecontrib.text.corpus import Corpus
 from orangecontrib.text.preprocess import (
     BASE_TOKENIZER,
+    NormalizationCache,
     PreprocessorList,
     StopwordsFilter,
 )
-from orangecontrib.text.preprocess.normalize import UDPipeModels
+from orangecontrib.text.preprocess.batch import batch_findall, batch_sub
+from orangecontrib.text.preprocess.cache import _SegmentedStore
+from orangecontrib.text.preprocess.normalize import UDPipeModels, \
+    _udpipe_lemmatize_tokens
+from orangecontrib.text.tokens import CompactTokens
 
 
 SF_LIST = "orangecontrib.text.preprocess.normalize.serverfiles.ServerFiles.listfiles"
@@ -160,6 +168,152 @@ class PreprocessTests(unittest.TestCase):
         self.assertEqual(corpus.pos_tags[0], ["JJ", "NN", "NN"])
 
 
+class PreprocessorListTests(unittest.TestCase):
+    def setUp(self):
+        self.corpus = Corpus.from_file("book-excerpts")
+        self.pp_list = [preprocess.LowercaseTransformer(),
+                        preprocess.UrlRemover(),
+                        preprocess.RegexpTokenizer(r"\w+"),
+                        preprocess.PorterStemmer(),
+                        preprocess.FrequencyFilter(min_df=2)]
+
+    def test_parallel(self):
+        corpus1 = PreprocessorList(self.pp_list)(self.corpus)
+        corpus2 = PreprocessorList(self.pp_list, n_jobs=2)(self.corpus)
+        self.assertEqual(len(corpus1.tokens), len(corpus2.tokens))
+        for tokens1, tokens2 in zip(corpus1.tokens, corpus2.tokens):
+            self.assertListEqual(list(tokens1), list(tokens2))
+        self.assertListEqual(corpus1.pp_documents, corpus2.pp_documents)
+        self.assertEqual(len(corpus2.used_preprocessor.preprocessors), 5)
+        np.testing.assert_array_equal(corpus2.ids, self.corpus.ids)
+
+    def test_parallel_without_tokens(self):
+        pp_list = [preprocess.LowercaseTransformer()]
+        corpus = PreprocessorList(pp_list, n_jobs=2)(self.corpus)
+        self.assertFalse(corpus.has_tokens())
+        self.assertListEqual(corpus.pp_documents,
+                             [d.lower() for d in self.corpus.documents])
+
+    def test_parallel_used_preprocessor(self):
+        # normalizer tokenizes the corpus with the default tokenizer
+        pp_list = [preprocess.LowercaseTransformer(),
+                   preprocess.PorterStemmer(),
+                   preprocess.FrequencyFilter(min_df=2)]
+        corpus1 = PreprocessorList(pp_list)(self.corpus)
+        corpus2 = PreprocessorList(pp_list, n_jobs=2)(self.corpus)
+        self.assertListEqual(corpus1.used_preprocessor.preprocessors,
+                             corpus2.used_preprocessor.preprocessors)
+        self.assertIs(corpus2.used_preprocessor.preprocessors[2],
+                      preprocess.BASE_TOKENIZER)
+
+    def test_parallel_callback(self):
+        callback = Mock()
+        PreprocessorList(self.pp_list, n_jobs=2)(self.corpus, callback)
+        callback.assert_called_with(1)
+
+        callback = Mock(side_effect=Exception)
+        with self.assertRaises(Exception):
+            PreprocessorList(self.pp_list, n_jobs=2)(self.corpus, callback)
+
+    def test_fused(self):
+        pp_lists = [
+            self.pp_list,
+            [preprocess.LowercaseTransformer(),
+             preprocess.SnowballStemmer(),
+             preprocess.RegexpFilter()],
+            [preprocess.WordPunctTokenizer(),
+             preprocess.StripAccentsTransformer(),
+             preprocess.NumbersFilter(),
+             preprocess.NGrams((1, 2)),
+             preprocess.WithNumbersFilter()],
+        ]
+        for pp_list in pp_lists:
+            corpus1 = PreprocessorList(pp_list)(self.corpus)
+            corpus2 = PreprocessorList(pp_list, fused=True)(self.corpus)
+            for tokens1, tokens2 in zip(corpus1.tokens, corpus2.tokens):
+                self.assertListEqual(list(tokens1), list(tokens2))
+            self.assertListEqual(corpus1.pp_documents, corpus2.pp_documents)
+            self.assertEqual(corpus1.ngram_range, corpus2.ngram_range)
+            self.assertListEqual(
+                [type(pp) for pp in corpus1.used_preprocessor.preprocessors],
+                [type(pp) for pp in corpus2.used_preprocessor.preprocessors]
+            )
+
+    def test_fused_pos_tags(self):
+        tagger = tag.POSTagger(nltk.RegexpTagger([(r".*s$", "NNS"), (r".*", "NN")]))
+        pp_list = [preprocess.WordPunctTokenizer(),
+                   tagger,
+                   preprocess.LowercaseTransformer(),
+                   preprocess.RegexpFilter("^h"),
+                   preprocess.PosTagFilter("NNS"),
+                   preprocess.PorterStemmer()]
+        corpus1 = PreprocessorList(pp_list)(self.corpus)
+        corpus2 = PreprocessorList(pp_list, fused=True)(self.corpus)
+        for tags1, tags2 in zip(corpus1.pos_tags, corpus2.pos_tags):
+            self.assertListEqual(list(tags1), list(tags2))
+        for tokens1, tokens2 in zip(corpus1.tokens, corpus2.tokens):
+            self.assertListEqual(list(tokens1), list(tokens2))
+
+    def test_fused_without_tokens(self):
+        pp_list = [preprocess.LowercaseTransformer(), preprocess.UrlRemover()]
+        corpus = PreprocessorList(pp_list, fused=True)(self.corpus)
+        self.assertFalse(corpus.has_tokens())
+        self.assertListEqual(corpus.pp_documents,
+                             [d.lower() for d in self.corpus.documents])
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = preprocess.PreprocessingCache(path)
+            corpus1 = PreprocessorList(self.pp_list, cache=cache)(self.corpus)
+            self.assertEqual(len(os.listdir(path)), 1)
+
+            with patch.object(PreprocessorList, "_call") as call:
+                corpus2 = PreprocessorList(self.pp_list, cache=cache)(self.corpus)
+                call.assert_not_called()
+            for tokens1, tokens2 in zip(corpus1.tokens, corpus2.tokens):
+                self.assertListEqual(list(tokens1), list(tokens2))
+            self.assertListEqual(corpus1.pp_documents, corpus2.pp_documents)
+            self.assertListEqual(corpus1.used_preprocessor.preprocessors,
+                                 corpus2.used_preprocessor.preprocessors)
+
+            # different parameters - results are not cached yet
+            pp_list = self.pp_list[:-1] + [preprocess.FrequencyFilter(min_df=3)]
+            PreprocessorList(pp_list, cache=cache)(self.corpus)
+            self.assertEqual(len(os.listdir(path)), 2)
+
+    def test_cache_key(self):
+        cache = preprocess.PreprocessingCache()
+        key = cache.key(self.corpus, self.pp_list)
+        PreprocessorList(self.pp_list)(self.corpus)  # fits FrequencyFilter
+        self.assertEqual(key, cache.key(self.corpus, self.pp_list))
+        self.assertNotEqual(key, cache.key(self.corpus[:10], self.pp_list))
+        pp_list = [preprocess.SnowballStemmer("de")]
+        self.assertNotEqual(cache.key(self.corpus, pp_list),
+                            cache.key(self.corpus, [preprocess.SnowballStemmer("en")]))
+
+    def test_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as path:
+            cache = preprocess.PreprocessingCache(path)
+            PreprocessorList(self.pp_list, cache=cache)(self.corpus)
+            size = os.path.getsize(os.path.join(path, os.listdir(path)[0]))
+            cache.max_size = size
+            PreprocessorList(self.pp_list, cache=cache)(self.corpus[:10])
+            # the least recently used result is removed
+            self.assertEqual(len(os.listdir(path)), 1)
+            self.assertIsNotNone(cache.get(self.corpus[:10], self.pp_list))
+            self.assertIsNone(cache.get(self.corpus, self.pp_list))
+
+    def test_unpickle_old(self):
+        pp = PreprocessorList(self.pp_list)
+        del pp.__dict__["n_jobs"]
+        del pp.__dict__["fused"]
+        del pp.__dict__["cache"]
+        pp = pickle.loads(pickle.dumps(pp))
+        self.assertEqual(pp.n_jobs, 1)
+        self.assertFalse(pp.fused)
+        self.assertIsNone(pp.cache)
+
+
 class TransformationTests(unittest.TestCase):
     def setUp(self):
         class ReverseStringTransformer(preprocess.BaseTransformer):
@@ -193,6 +347,29 @@ class TransformationTests(unittest.TestCase):
         self.assertEqual(corpus.documents[0], text)
         self.assertEqual(len(corpus.used_preprocessor.preprocessors), 2)
 
+    def test_documents_transformed_lazily(self):
+        corpus = preprocess.WordPunctTokenizer()(self.corpus)
+        with patch.object(self.transformer, "_preprocess",
+                          wraps=self.transformer._preprocess) as transform:
+            corpus = self.transformer(corpus)
+            self.assertEqual(transform.call_count, corpus.count_tokens())
+            self.assertIsNone(corpus._pp_documents)
+
+            copied = corpus.copy()
+            self.assertEqual(corpus.pp_documents[0],
+                             'snoitacilppa retupmoc cba bal rof ecafretni enihcam namuH')
+            self.assertEqual(transform.call_count,
+                             corpus.count_tokens() + len(corpus))
+        self.assertEqual(copied.pp_documents, corpus.pp_documents)
+
+        corpus = preprocess.WordPunctTokenizer()(self.corpus)
+        corpus = preprocess.UrlRemover()(preprocess.LowercaseTransformer()(corpus))
+        corpus = pickle.loads(pickle.dumps(corpus))
+        self.assertEqual(len(corpus._pending_transforms), 2)
+        self.assertEqual(corpus.pp_documents[0],
+                         'human machine interface for lab abc computer applications')
+        self.assertEqual(corpus.tokens[0][0], 'human')
+
     def test_str(self):
         self.assertIn('reverse', str(self.transformer))
 
@@ -211,6 +388,42 @@ class TransformationTests(unittest.TestCase):
         self.assertEqual(transformer._preprocess('<p>abra<b>cadabra</b><p>'),
                          'abracadabra')
 
+    def test_html_fast_path(self):
+        transformer = preprocess.HtmlTransformer()
+        for html in ('plain text', '', '<p>abra<b>cadabra</b><p>', 'a < b > c',
+                     '<div class="x">one<br/>two</div>\n<ul><li>three', 'x</b>y<a',
+                     'fish &amp; chips', '&#169; &foo; &', '<!-- note -->text',
+                     '<!DOCTYPE html><p>a</p>', '<script>var a = "<b>";</script>b',
+                     '<style>p {}</style>c', '<?xml version="1.0"?><a>d</a>',
+                     '</ x>e', '<![CDATA[f]]>'):
+            self.assertEqual(transformer._preprocess(html),
+                             BeautifulSoup(html, 'html.parser').getText(), html)
+
+        with patch("orangecontrib.text.preprocess.transform.BeautifulSoup") as soup:
+            self.assertEqual(transformer._preprocess('plain'), 'plain')
+            self.assertEqual(transformer._preprocess('<i>a</i>b'), 'ab')
+            soup.assert_not_called()
+
+    def test_html_parallel(self):
+        with self.corpus.unlocked():
+            self.corpus.metas[:, 0] = [f"<p>doc <b>{i}</b></p>"
+                                       for i in range(len(self.corpus))]
+        tokenized = preprocess.WordPunctTokenizer()(self.corpus)
+        transformer = preprocess.HtmlTransformer(n_jobs=2)
+        with patch.object(preprocess.HtmlTransformer, "BATCH_SIZE", 4):
+            corpus = transformer(tokenized)
+        self.assertEqual(corpus.pp_documents,
+                         [f"doc {i}" for i in range(len(self.corpus))])
+        expected = preprocess.HtmlTransformer()(tokenized)
+        self.assertEqual([list(t) for t in corpus.tokens],
+                         [list(t) for t in expected.tokens])
+
+        transformer = pickle.loads(pickle.dumps(transformer))
+        self.assertEqual(transformer.n_jobs, 2)
+        del transformer.__dict__["n_jobs"]
+        transformer = pickle.loads(pickle.dumps(transformer))
+        self.assertEqual(transformer.n_jobs, 1)
+
     def test_url_remover(self):
         remover = preprocess.UrlRemover()
         with self.corpus.unlocked():
@@ -221,6 +434,23 @@ class TransformationTests(unittest.TestCase):
                              ['some link to ', 'some link to google.com'])
         self.assertEqual(len(corpus.used_preprocessor.preprocessors), 1)
 
+    def test_url_remover_batched(self):
+        remover = preprocess.UrlRemover()
+        with self.corpus.unlocked():
+            self.corpus.metas[0, 0] = 'link https://google.com/a?b=1\nand http://x.org'
+            self.corpus.metas[1, 0] = 'https://biolab.si'
+        with patch.object(preprocess.UrlRemover, "_preprocess") as per_document:
+            corpus = remover(self.corpus)
+            per_document.assert_not_called()
+        self.assertEqual(corpus.pp_documents[:2], ['link \nand ', ''])
+
+        corpus = preprocess.WhitespaceTokenizer()(self.corpus)
+        for compact in (False, True):
+            corpus.compact_tokens = compact
+            tokens = remover(corpus).tokens
+            self.assertEqual(list(tokens[0]), ['link', '', 'and', ''])
+            self.assertEqual(list(tokens[1]), [''])
+
     def test_can_deepcopy(self):
         transformer = preprocess.UrlRemover()
         copied = copy.deepcopy(transformer)
@@ -238,6 +468,7 @@ class TokenNormalizerTests(unittest.TestCase):
     def setUp(self):
         self.stemmer = nltk.PorterStemmer().stem
         self.corpus = Corpus.from_file('deerwester')
+        NormalizationCache.clear_shared()
 
     def test_str(self):
         stemmer = preprocess.PorterStemmer()
@@ -381,9 +612,234 @@ class TokenNormalizerTests(unittest.TestCase):
         self.assertEqual(normalizer._normalization_cache["esu"], "būti")
         self.assertEqual(40, len(normalizer._normalization_cache))
 
-        # cache should not be pickled
+        # cache is not pickled, but unpickled normalizer shares it
         loaded_normalizer = pickle.loads(pickle.dumps(normalizer))
-        self.assertEqual(0, len(loaded_normalizer._normalization_cache))
+        self.assertIs(normalizer._normalization_cache,
+                      loaded_normalizer._normalization_cache)
+
+    def test_shared_cache(self):
+        normalizer = preprocess.SnowballStemmer("fr")
+        normalizer(self.corpus)
+        cache = normalizer._normalization_cache
+        self.assertGreater(cache.misses, 0)
+        n_tokens = sum(map(len, normalizer(self.corpus).tokens))
+        self.assertEqual(cache.hits + cache.misses, 2 * n_tokens)
+
+        self.assertIs(preprocess.SnowballStemmer("fr")._normalization_cache, cache)
+        self.assertIs(copy.deepcopy(normalizer)._normalization_cache, cache)
+        self.assertIsNot(preprocess.SnowballStemmer("de")._normalization_cache,
+                         cache)
+        self.assertIsNot(preprocess.PorterStemmer()._normalization_cache, cache)
+
+        stemmer = preprocess.BaseNormalizer()
+        stemmer.normalizer = lambda x: x[:-1]
+        other = preprocess.BaseNormalizer()
+        other.normalizer = lambda x: x[1:]
+        self.assertIsNot(stemmer._normalization_cache, other._normalization_cache)
+
+    def test_flush_when_interrupted(self):
+        normalizer = preprocess.PorterStemmer()
+        cache = normalizer._normalization_cache
+        with patch.object(cache, "flush") as flush, \
+                patch.object(normalizer, "_normalize_corpus",
+                             side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                normalizer(self.corpus)
+            flush.assert_called_once()
+
+    def test_vocabulary_mode(self):
+        for normalizer in (preprocess.PorterStemmer, preprocess.SnowballStemmer,
+                           preprocess.LemmagenLemmatizer):
+            expected = normalizer()(self.corpus)
+            corpus = normalizer(vocabulary_mode=True)(self.corpus)
+            self.assertEqual(list(map(list, corpus.tokens)),
+                             list(map(list, expected.tokens)))
+
+            NormalizationCache.clear_shared()
+            compact = self.corpus.copy()
+            compact.compact_tokens = True
+            corpus = normalizer(vocabulary_mode=True, n_jobs=2)(compact)
+            self.assertEqual(corpus.tokens.tolist(),
+                             list(map(list, expected.tokens)))
+            self.assertEqual(corpus.tokens.count_unique(),
+                             len(corpus.tokens.vocabulary))
+
+    def test_vocabulary_mode_pos_tags(self):
+        corpus = tag.AveragedPerceptronTagger()(self.corpus)
+        normalized = preprocess.PorterStemmer(vocabulary_mode=True)(corpus)
+        self.assertEqual(list(map(list, normalized.pos_tags)),
+                         list(map(list, corpus.pos_tags)))
+
+    def test_udpipe_batch(self):
+        normalizer = preprocess.UDPipeLemmatizer("lt")
+        # "_" is written as the lemma in CoNLL-U and tokens with tabs or
+        # newlines cannot be written in vertical format
+        tokens = ["esu", "namas", "a\tb", "", "esu", "_", "a_b", "x\ny", "c\rd", " "]
+        tokens += [t for doc in preprocess.BASE_TOKENIZER(self.corpus).tokens for t in doc]
+        with normalizer._prepared():
+            expected = [normalizer.normalizer(t) for t in tokens]
+            model = normalizer._UDPipeLemmatizer__model
+            self.assertListEqual(_udpipe_lemmatize_tokens(model, tokens), expected)
+
+    def test_udpipe_cache_model_file(self):
+        with tempfile.TemporaryDirectory() as path:
+            model = os.path.join(path, "lithuanian.udpipe")
+            with open(model, "wb") as f:
+                f.write(b"model")
+            with patch.object(UDPipeModels, "__getitem__", return_value=model):
+                cache = preprocess.UDPipeLemmatizer("lt")._normalization_cache
+                self.assertIs(preprocess.UDPipeLemmatizer("lt")._normalization_cache,
+                              cache)
+                # an updated model must not use lemmas of the old one
+                with open(model, "wb") as f:
+                    f.write(b"updated model")
+                self.assertIsNot(preprocess.UDPipeLemmatizer("lt")._normalization_cache,
+                                 cache)
+
+    def test_udpipe_vocabulary_mode(self):
+        with self.corpus.unlocked():
+            self.corpus.metas[0, 0] = "Ant kalno dega namas"
+        expected = preprocess.UDPipeLemmatizer("lt")(self.corpus)
+        self.assertNotIsInstance(expected.tokens, CompactTokens)
+
+        NormalizationCache.clear_shared()
+        normalizer = preprocess.UDPipeLemmatizer("lt", vocabulary_mode=True)
+        corpus = normalizer(self.corpus)
+        self.assertListEqual(list(map(list, corpus.tokens)),
+                             list(map(list, expected.tokens)))
+
+    def test_udpipe_n_jobs(self):
+        with self.corpus.unlocked():
+            self.corpus.metas[0, 0] = "Ant kalno dega namas"
+        for use_tokenizer in (False, True):
+            expected = preprocess.UDPipeLemmatizer("lt", use_tokenizer)(self.corpus)
+            normalizer = preprocess.UDPipeLemmatizer("lt", use_tokenizer, n_jobs=2,
+                                                     vocabulary_mode=True)
+            corpus = normalizer(self.corpus)
+            self.assertListEqual(list(map(list, corpus.tokens)),
+                                 list(map(list, expected.tokens)))
+
+    def test_udpipe_persistent_cache(self):
+        with self.corpus.unlocked():
+            self.corpus.metas[0, 0] = "esu"
+        with tempfile.TemporaryDirectory() as path, \
+                patch("orangecontrib.text.preprocess.cache.environ.cache_dir",
+                      return_value=path):
+            normalizer = preprocess.UDPipeLemmatizer("lt", persistent_cache=True)
+            normalizer(self.corpus)
+            files = os.listdir(os.path.join(path, "normalizationcache"))
+            self.assertEqual(len(files), 1)
+
+            NormalizationCache.clear_shared()
+            normalizer = preprocess.UDPipeLemmatizer("lt", persistent_cache=True)
+            cache = normalizer._normalization_cache
+            self.assertEqual(0, len(cache))
+            self.assertEqual(cache.get("esu"), "būti")
+            self.assertEqual(cache.hits, 1)
+
+
+class NormalizationCacheTests(unittest.TestCase):
+    def test_lru(self):
+        cache = NormalizationCache(max_entries=2)
+        cache["a"] = "A"
+        cache["b"] = "B"
+        self.assertEqual(cache.get("a"), "A")
+        cache["c"] = "C"
+        self.assertEqual(set(cache), {"a", "c"})
+
+        cache = NormalizationCache(max_bytes=3 * sys.getsizeof("aa"))
+        cache["a"] = "A"
+        cache["b"] = "B"
+        self.assertEqual(list(cache), ["b"])
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+
+    def test_counters(self):
+        cache = NormalizationCache()
+        self.assertIsNone(cache.get("a"))
+        cache["a"] = "A"
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertAlmostEqual(cache.hit_rate, 2 / 3)
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as path:
+            store = os.path.join(path, "cache")
+            cache = NormalizationCache(path=store)
+            cache["čaj"] = "čaj"
+            cache["b"] = "B"
+            cache["list"] = ["not", "stored"]
+            cache.flush()
+            cache["a"] = "A"
+            cache.flush()
+            cache.flush()
+            # each flush appends only new entries
+            self.assertEqual(len(os.listdir(store)), 2)
+
+            cache = NormalizationCache(max_entries=1, path=store)
+            self.assertEqual(len(cache), 0)
+            self.assertEqual(cache.get("a"), "A")
+            self.assertEqual(cache.get("b"), "B")
+            self.assertEqual(cache.get("čaj"), "čaj")
+            self.assertIsNone(cache.get("list"))
+            self.assertIsNone(cache.get("c"))
+            self.assertEqual(len(cache), 1)
+            self.assertEqual((cache.hits, cache.misses), (3, 2))
+
+    def test_persistent_eviction(self):
+        with tempfile.TemporaryDirectory() as path, \
+                patch.object(_SegmentedStore, "MAX_SEGMENTS", 2):
+            store = os.path.join(path, "cache")
+            cache = NormalizationCache(path=store)
+            for key in "abc":
+                cache[key] = key.upper()
+                cache.flush()
+            self.assertEqual(len(os.listdir(store)), 2)
+
+            cache = NormalizationCache(path=store)
+            self.assertIsNone(cache.get("a"))
+            # entries read from older segments are written again
+            self.assertEqual(cache.get("b"), "B")
+            cache.flush()
+            cache["d"] = "D"
+            cache.flush()
+            cache = NormalizationCache(path=store)
+            self.assertEqual(cache.get("b"), "B")
+            self.assertIsNone(cache.get("c"))
+
+        with tempfile.TemporaryDirectory() as path, \
+                patch.object(_SegmentedStore, "MAX_SIZE", 300):
+            store = os.path.join(path, "cache")
+            cache = NormalizationCache(path=store)
+            for i in range(5):
+                cache[str(i)] = "x" * 50
+                cache.flush()
+            size = sum(os.path.getsize(os.path.join(store, f))
+                       for f in os.listdir(store))
+            self.assertLessEqual(size, 300)
+            self.assertEqual(cache.get("4"), "x" * 50)
+
+    def test_shared_bounded(self):
+        NormalizationCache.clear_shared()
+        with patch.object(NormalizationCache, "MAX_SHARED", 2):
+            first = NormalizationCache.shared("a")
+            NormalizationCache.shared("b")
+            self.assertIs(NormalizationCache.shared("a"), first)
+            NormalizationCache.shared("c")
+            self.assertIs(NormalizationCache.shared("a"), first)
+            self.assertEqual(list(NormalizationCache._shared), ["c", "a"])
+        NormalizationCache.clear_shared()
+
+        with patch.object(NormalizationCache, "MAX_BYTES", 1000):
+            first = NormalizationCache.shared("a")
+            first["key"] = "x" * 600
+            NormalizationCache.shared("b")["key"] = "x" * 600
+            self.assertEqual(list(NormalizationCache._shared), ["a", "b"])
+            NormalizationCache.shared("c")
+            self.assertEqual(list(NormalizationCache._shared), ["b", "c"])
+        NormalizationCache.clear_shared()
 
 
 class TokenNormalizerNotPatched(unittest.TestCase):
@@ -567,6 +1023,28 @@ class FilteringTests(unittest.TestCase):
         self.assertFrequencyRange(corpus, 5, size)
         self.assertEqual(len(corpus.used_preprocessor.preprocessors), 2)
 
+    def test_frequency_filters_match_gensim(self):
+        # filters tokenize the corpus with the base tokenizer
+        tokens = preprocess.BASE_TOKENIZER(self.corpus).tokens
+        for ff, args in ((preprocess.FrequencyFilter(min_df=2, max_df=.5), (2, .5, None)),
+                         (preprocess.FrequencyFilter(max_df=3), (0, 3 / 9, None)),
+                         (preprocess.MostFrequentTokensFilter(keep_n=7), (0, 1, 7))):
+            dictionary = corpora.Dictionary(tokens)
+            dictionary.filter_extremes(*args)
+            processed = ff(self.corpus)
+            self.assertEqual(set(dictionary.token2id), ff._lexicon)
+            self.assertEqual(
+                [[t for t in doc if t in dictionary.token2id] for doc in tokens],
+                [list(doc) for doc in processed.tokens])
+
+    def test_frequency_filter_pickle(self):
+        ff = preprocess.FrequencyFilter(min_df=2)
+        ff(self.corpus)
+        ff.__dict__["_dictionary"] = ff.__dict__.pop("_frequencies")
+        ff = pickle.loads(pickle.dumps(ff))
+        self.assertNotIn("_dictionary", ff.__dict__)
+        self.assertIsNone(ff._frequencies)
+
     def assertFrequencyRange(self, corpus, min_fr, max_fr):
         dictionary = corpora.Dictionary(corpus.tokens)
         self.assertTrue(all(min_fr <= fr <= max_fr
@@ -632,6 +1110,63 @@ class FilteringTests(unittest.TestCase):
         self.assertEqual(len(filtered.pos_tags[0]), 5)
         self.assertEqual(len(filtered.tokens[0]), 5)
 
+    def test_combined_filter(self):
+        corpus = tag.AveragedPerceptronTagger()(
+            preprocess.WordPunctTokenizer()(self.corpus))
+        filters = [preprocess.StopwordsFilter("en"), preprocess.RegexpFilter("^h"),
+                   preprocess.NumbersFilter(), preprocess.WithNumbersFilter()]
+        expected = corpus
+        for f in filters:
+            expected = f(expected)
+
+        combined = preprocess.CombinedTokenFilter(filters)(corpus)
+        self.assertEqual(list(map(list, combined.tokens)),
+                         list(map(list, expected.tokens)))
+        self.assertEqual(list(map(list, combined.pos_tags)),
+                         list(map(list, expected.pos_tags)))
+        self.assertEqual(combined.used_preprocessor.preprocessors,
+                         expected.used_preprocessor.preprocessors)
+        self.assertIsNone(filters[1].regex)
+
+        # untokenized corpus is tokenized after the first filter
+        combined = preprocess.CombinedTokenFilter(filters)(self.corpus)
+        preprocessors = combined.used_preprocessor.preprocessors
+        self.assertIs(preprocessors[0], filters[0])
+        self.assertIs(preprocessors[1], BASE_TOKENIZER)
+        self.assertEqual(preprocessors[2:], filters[1:])
+
+    def test_filter_keeps_token_storage(self):
+        corpus = preprocess.WordPunctTokenizer()(self.corpus)
+        compact = corpus.copy()
+        compact.compact_tokens = True
+        for f in (preprocess.RegexpFilter("^h"), preprocess.NumbersFilter()):
+            with patch.object(CompactTokens, "from_lists") as from_lists:
+                filtered = f(corpus)
+                from_lists.assert_not_called()
+            self.assertNotIsInstance(filtered.tokens, CompactTokens)
+            filtered_compact = f(compact)
+            self.assertIsInstance(filtered_compact.tokens, CompactTokens)
+            self.assertEqual(list(map(list, filtered.tokens)),
+                             list(map(list, filtered_compact.tokens)))
+
+    def test_filters_combined_in_preprocessor_list(self):
+        filters = [preprocess.StopwordsFilter("en"), preprocess.NumbersFilter(),
+                   preprocess.FrequencyFilter(min_df=2),
+                   preprocess.LexiconFilter(), preprocess.RegexpFilter("^h")]
+        expected = self.corpus
+        for f in filters:
+            expected = f(expected)
+        with patch.object(preprocess.CombinedTokenFilter, "__call__",
+                          autospec=True,
+                          side_effect=preprocess.CombinedTokenFilter.__call__) \
+                as combined:
+            corpus = PreprocessorList(filters)(self.corpus)
+        self.assertEqual(combined.call_count, 2)
+        self.assertEqual(list(map(list, corpus.tokens)),
+                         list(map(list, expected.tokens)))
+        self.assertEqual(corpus.used_preprocessor.preprocessors,
+                         expected.used_preprocessor.preprocessors)
+
     def test_can_deepcopy(self):
         copied = copy.deepcopy(self.regexp)
         with self.corpus.unlocked():
@@ -702,6 +1237,45 @@ class TokenizerTests(unittest.TestCase):
         tokenizer = preprocess.RegexpTokenizer(pattern=r'\w')
         pickle.loads(pickle.dumps(tokenizer))
 
+    def test_batched_regexp_tokenizer(self):
+        corpus = Corpus.from_file('book-excerpts')
+        for pattern in (r'\w+', r'\S+', r'[^h ]*', r'.+', r'^\w+', r'(\w)\w', r'\w+(?= )'):
+            tokenizer = preprocess.RegexpTokenizer(pattern=pattern)
+            tokenizer.tokenizer = tokenizer.tokenizer_cls(pattern)
+            expected = [tokenizer._preprocess(doc) for doc in corpus.documents]
+            tokenizer.tokenizer = None
+            tokens = tokenizer(corpus).tokens
+            self.assertEqual([list(t) for t in tokens], expected, pattern)
+
+    def test_batch_findall(self):
+        strings = ["a b", "", "c", "d e f"]
+        fallback = Mock(side_effect=lambda s: re.findall(r"\w", s))
+        self.assertEqual(batch_findall(r"\w", 0, strings, fallback, batch_size=3),
+                         [["a", "b"], [], ["c"], ["d", "e", "f"]])
+        fallback.assert_not_called()
+        # a match that crosses a separator makes the batch fall back
+        fallback = Mock(side_effect=lambda s: re.findall(r"\w.", s, re.DOTALL))
+        self.assertEqual(batch_findall(r"\w.", re.DOTALL, strings, fallback, batch_size=3),
+                         [["a "], [], [], ["d ", "e "]])
+        self.assertEqual(fallback.call_count, 3)
+
+    def test_batch_sub(self):
+        strings = ["a b", "", "c", "d e f"]
+        fallback = Mock(side_effect=lambda s: re.sub(r"\w", r"<\g<0>>", s))
+        self.assertEqual(batch_sub(r"\w", 0, r"<\g<0>>", strings, fallback, batch_size=3),
+                         ["<a> <b>", "", "<c>", "<d> <e> <f>"])
+        fallback.assert_not_called()
+        # a match that consumes a newline of a separator and puts it back
+        fallback = Mock(side_effect=lambda s: re.sub(r"a\n", "X\n", s))
+        self.assertEqual(batch_sub(r"a\n", 0, "X\n", ["a", "b"], fallback),
+                         ["a", "b"])
+        self.assertEqual(fallback.call_count, 2)
+        # empty matches at ends of strings are within strings
+        fallback = Mock(side_effect=lambda s: re.sub(r"\b", "|", s))
+        self.assertEqual(batch_sub(r"\b", 0, "|", ["ab", "", "x"], fallback),
+                         ["|ab|", "", "|x|"])
+        fallback.assert_not_called()
+
     def test_reset_pos_tags(self):
         corpus = Corpus.from_file('deerwester')
         tagger = tag.AveragedPerceptronTagger()
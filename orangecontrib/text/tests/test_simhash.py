@@ -1,8 +1,13 @@
 import unittest
 from unittest.mock import MagicMock, call
 
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
 from orangecontrib.text.corpus import Corpus
 from orangecontrib.text.vectorization import SimhashVectorizer
+from orangecontrib.text.vectorization.simhash import SimhashIndex, popcount
 
 
 class TestSimhash(unittest.TestCase):
@@ -30,6 +35,107 @@ class TestSimhash(unittest.TestCase):
         self.assertEqual(result.X.shape, (len(self.corpus), 64))
         callback.assert_has_calls([call(i / len(self.corpus)) for i in range(9)])
 
+    def test_fingerprints(self):
+        vect = SimhashVectorizer(shingle_len=10, f=64)
+        fingerprints = vect.fingerprints(self.corpus)
+        self.assertEqual(fingerprints.dtype, np.uint64)
+        bits = vect.transform(self.corpus).X[:, -64:]
+        unpacked = np.unpackbits(
+            fingerprints.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1)
+        np.testing.assert_equal(unpacked, bits)
+
+        vect = SimhashVectorizer(shingle_len=10, f=100)
+        fingerprints = vect.fingerprints(self.corpus)
+        self.assertEqual(fingerprints.shape, (len(self.corpus), 13))
+        bits = vect.transform(self.corpus).X[:, -100:]
+        np.testing.assert_equal(
+            np.unpackbits(fingerprints, axis=1)[:, :100], bits)
+
+    def test_fingerprints_match_simhash(self):
+        for f in (8, 64, 128):
+            vect = SimhashVectorizer(shingle_len=2, f=f)
+            expected = [vect.compute_hash(doc) for doc in self.corpus.tokens]
+            bits = vect.unpack(vect.fingerprints(self.corpus))
+            np.testing.assert_equal(
+                bits, [vect.int2binarray(value) for value in expected])
+
+    def test_fingerprints_hashfunc(self):
+        def hashfunc(value):
+            return len(value) * 0x0101010101010101
+
+        vect = SimhashVectorizer(shingle_len=1, f=64, hashfunc=hashfunc)
+        expected = [vect.compute_hash(doc) for doc in self.corpus.tokens]
+        np.testing.assert_equal(vect.fingerprints(self.corpus), expected)
+
+    def test_fingerprints_chunks(self):
+        vect = SimhashVectorizer(shingle_len=2, f=64)
+        expected = vect.fingerprints(self.corpus)
+        vect.chunk_size = 2
+        np.testing.assert_equal(vect.fingerprints(self.corpus), expected)
+
+    def test_unpack(self):
+        vect = SimhashVectorizer(f=16)
+        fingerprints = np.array([0b1000_0000_0000_0001], dtype=np.uint64)
+        np.testing.assert_equal(vect.unpack(fingerprints),
+                                [[1] + [0] * 14 + [1]])
+
+
+class TestSimhashIndex(unittest.TestCase):
+    def test_popcount(self):
+        x = np.array([0, 1, 3, 2 ** 64 - 1], dtype=np.uint64)
+        np.testing.assert_equal(popcount(x), [0, 1, 2, 64])
+
+    def test_clusters(self):
+        fingerprints = np.array([
+            0b1111_0000_0000_0000,
+            0b1111_0000_0000_0001,  # 1 bit from 0
+            0b0000_0000_1111_1111,
+            0b1111_0000_0000_0000,  # equal to 0
+            0b0000_0000_1111_0111,  # 1 bit from 2
+            0b0000_1111_1111_1111,  # 4 bits from 2, 5 bits from 4
+        ], dtype=np.uint64)
+        index = SimhashIndex(fingerprints, f=16, max_distance=1)
+        np.testing.assert_equal(index.clusters(), [0, 0, 1, 0, 1, 2])
+
+        index = SimhashIndex(fingerprints, f=16, max_distance=4)
+        np.testing.assert_equal(index.clusters(), [0, 0, 1, 0, 1, 1])
+
+        index = SimhashIndex(fingerprints, f=16, max_distance=0)
+        np.testing.assert_equal(index.clusters(), [0, 1, 2, 0, 3, 4])
+
+    def test_clusters_packed(self):
+        fingerprints = np.zeros((3, 16), dtype=np.uint8)
+        fingerprints[1, 5] = 0b100
+        fingerprints[2, :] = 0xff
+        index = SimhashIndex(fingerprints, max_distance=2)
+        self.assertEqual(index.f, 128)
+        np.testing.assert_equal(index.clusters(), [0, 0, 1])
+
+    def test_clusters_match_all_pairs(self):
+        rng = np.random.default_rng(0)
+        # few distinct bits give large groups of fingerprints sharing bands
+        fingerprints = rng.integers(0, 2 ** 10, 300).astype(np.uint64)
+        for max_distance in (0, 1, 3):
+            close = popcount(fingerprints[:, None] ^ fingerprints[None, :]) \
+                <= max_distance
+            _, labels = connected_components(csr_matrix(close), directed=False)
+            _, first = np.unique(labels, return_index=True)
+            renumber = np.empty(len(first), dtype=int)
+            renumber[np.argsort(first)] = np.arange(len(first))
+            index = SimhashIndex(fingerprints, f=16, max_distance=max_distance)
+            np.testing.assert_equal(index.clusters(), renumber[labels])
+
+    def test_pairs(self):
+        fingerprints = np.array([0, 1, 2 ** 64 - 1], dtype=np.uint64)
+        np.testing.assert_equal(SimhashIndex(fingerprints).pairs(), [[0], [1]])
+
+    def test_invalid_arguments(self):
+        fingerprints = np.array([0, 1], dtype=np.uint64)
+        self.assertRaises(ValueError, SimhashIndex, fingerprints,
+                          max_distance=-1)
+        self.assertRaises(ValueError, SimhashIndex, fingerprints,
+                          f=8, n_bands=9)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+import scipy.sparse as sp
+
+from orangecontrib.text import Corpus
+from orangecontrib.text.preprocess import (
+    LowercaseTransformer,
+    PreprocessorList,
+    RegexpTokenizer,
+)
+from orangecontrib.text.snapshot import is_snapshot
+from orangecontrib.text.tokens import CompactTokens
+from orangecontrib.text.vectorization import BowVectorizer
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "corpus.corpus")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def assert_same(self, corpus, opened):
+        # variables are unpickled, so their compute values are not equal
+        self.assertEqual([v.name for v in corpus.domain.variables + corpus.domain.metas],
+                         [v.name for v in opened.domain.variables + opened.domain.metas])
+        self.assertEqual(corpus.name, opened.name)
+        self.assertEqual(corpus.language, opened.language)
+        self.assertEqual(corpus.text_features, opened.text_features)
+        self.assertEqual(corpus.ngram_range, opened.ngram_range)
+        self.assertEqual(corpus.compact_tokens, opened.compact_tokens)
+        self.assertEqual(len(corpus.used_preprocessor.preprocessors),
+                         len(opened.used_preprocessor.preprocessors))
+        self.assertEqual(corpus.documents, opened.documents)
+        self.assertEqual(corpus.pp_documents, opened.pp_documents)
+        assert_array_equal(corpus.titles, opened.titles)
+        assert_array_equal(corpus.ids, opened.ids)
+        assert_array_equal(corpus.metas, opened.metas)
+        x, x_opened = corpus.X, opened.X
+        self.assertEqual(sp.issparse(x), sp.issparse(x_opened))
+        if sp.issparse(x):
+            x, x_opened = x.toarray(), x_opened.toarray()
+        assert_array_equal(x, x_opened)
+        assert_array_equal(corpus.Y, opened.Y)
+        self.assertEqual(corpus.has_tokens(), opened.has_tokens())
+        if corpus.has_tokens():
+            self.assertEqual(list(map(list, corpus.tokens)),
+                             list(map(list, opened.tokens)))
+
+    def test_round_trip(self):
+        corpus = Corpus.from_file("book-excerpts")
+        corpus.save_snapshot(self.path)
+        self.assertTrue(is_snapshot(self.path))
+        self.assert_same(corpus, Corpus.open_snapshot(self.path))
+        self.assert_same(corpus, Corpus.open_snapshot(self.path, mmap=False))
+
+    def test_preprocessed(self):
+        corpus = Corpus.from_file("deerwester")
+        corpus.compact_tokens = True
+        corpus = PreprocessorList([LowercaseTransformer(), RegexpTokenizer()])(corpus)
+        corpus = BowVectorizer().transform(corpus)
+        corpus.set_title_variable(corpus.domain.metas[0])
+        corpus.save_snapshot(self.path)
+
+        opened = Corpus.open_snapshot(self.path)
+        self.assert_same(corpus, opened)
+        self.assertIsInstance(opened.tokens, CompactTokens)
+        self.assertIsInstance(opened.tokens.ids, np.memmap)
+
+        corpus.compact_tokens = False
+        corpus.save_snapshot(self.path)
+        opened = Corpus.open_snapshot(self.path)
+        self.assert_same(corpus, opened)
+        self.assertIsInstance(opened.tokens, np.ndarray)
+
+    def test_slice_keeps_titles(self):
+        corpus = Corpus.from_file("book-excerpts")[10:20]
+        corpus.save_snapshot(self.path)
+        opened = Corpus.open_snapshot(self.path)
+        self.assertEqual(opened.titles[0], "Document 11")
+
+    def test_not_snapshot(self):
+        corpus = Corpus.from_file("deerwester")
+        path = os.path.join(self.tmp_dir.name, "corpus.pkl")
+        corpus.save(path)
+        self.assertFalse(is_snapshot(path))
+        self.assertFalse(is_snapshot(os.path.join(self.tmp_dir.name, "missing")))
+        with self.assertRaises(ValueError):
+            Corpus.open_snapshot(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from Orange.data import ContinuousVariable, DiscreteVariable, StringVariable
+
+from orangecontrib.text import Corpus
+from orangecontrib.text.preprocess import LowercaseTransformer, RegexpTokenizer
+from orangecontrib.text.tokens import CompactTokens
+
+
+class TestIterChunks(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rows = [
+            {"text": "First Document", "topic": "a", "score": 1},
+            {"text": "Second one", "topic": "b", "score": 2.5},
+            {"text": "Third", "topic": "a", "score": None},
+            {"text": "Fourth document", "topic": "a", "score": 4},
+            {"text": "Fifth", "topic": "c", "score": 5},
+        ]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def test_jsonl(self):
+        path = self.write("docs.jsonl", map(json.dumps, self.rows))
+        chunks = list(Corpus.iter_chunks(path, chunk_size=3))
+        self.assertEqual([len(c) for c in chunks], [3, 2])
+
+        domain = chunks[0].domain
+        self.assertIs(chunks[1].domain, domain)
+        self.assertIsInstance(domain["text"], StringVariable)
+        self.assertIsInstance(domain["topic"], DiscreteVariable)
+        self.assertIsInstance(domain["score"], ContinuousVariable)
+        # value "c" appears only in the second chunk
+        self.assertEqual(domain["topic"].values, ("a", "b", "c"))
+        self.assertEqual(chunks[1].name, "docs")
+        self.assertEqual(chunks[1].text_features, [domain["text"]])
+
+        corpus = Corpus.concatenate_chunks(chunks)
+        self.assertEqual(corpus.documents, [r["text"] for r in self.rows])
+        self.assertEqual([domain["topic"].str_val(v)
+                          for v in corpus.get_column("topic")],
+                         [r["topic"] for r in self.rows])
+        np.testing.assert_equal(corpus.get_column("score"), [1, 2.5, np.nan, 4, 5])
+
+    def test_csv_tsv(self):
+        for name, sep in (("docs.csv", ","), ("docs.tsv", "\t")):
+            lines = [sep.join(["text", "topic", "score"])] + [
+                sep.join([r["text"], r["topic"], str(r["score"] or "")])
+                for r in self.rows]
+            path = self.write(name, lines)
+            corpus = Corpus.concatenate_chunks(Corpus.iter_chunks(path, chunk_size=3))
+            self.assertEqual(corpus.documents, [r["text"] for r in self.rows])
+            self.assertIsInstance(corpus.domain["score"], ContinuousVariable)
+
+    def test_text_features(self):
+        path = self.write("docs.jsonl", map(json.dumps, self.rows))
+        chunk = next(Corpus.iter_chunks(path, text_features=["text", "topic"]))
+        self.assertEqual(chunk.documents[0], "First Document a")
+
+    def test_preprocessed_chunks(self):
+        path = self.write("docs.jsonl", map(json.dumps, self.rows))
+        pp = [LowercaseTransformer(), RegexpTokenizer()]
+        chunks = []
+        for chunk in Corpus.iter_chunks(path, chunk_size=3):
+            chunk.compact_tokens = True
+            for p in pp:
+                chunk = p(chunk)
+            chunks.append(chunk)
+        corpus = Corpus.concatenate_chunks(chunks)
+        self.assertIsInstance(corpus.tokens, CompactTokens)
+        self.assertEqual(corpus.tokens.tolist(),
+                         [r["text"].lower().split() for r in self.rows])
+        self.assertEqual(corpus.pp_documents,
+                         [r["text"].lower() for r in self.rows])
+        self.assertEqual(len(corpus.used_preprocessor.preprocessors), 2)
+
+    def test_class_variable(self):
+        corpus = Corpus.from_file("book-excerpts")
+        concatenated = Corpus.concatenate_chunks([corpus[:3], corpus[3:6]])
+        np.testing.assert_equal(concatenated.Y, corpus.Y[:6])
+        self.assertEqual(concatenated.documents, corpus.documents[:6])
+
+    def test_errors(self):
+        path = self.write("docs.txt", ["text"])
+        with self.assertRaises(ValueError):
+            next(Corpus.iter_chunks(path))
+        self.assertEqual(list(Corpus.iter_chunks(self.write("empty.jsonl", []))), [])
+        with self.assertRaises(ValueError):
+            Corpus.concatenate_chunks([])
+
+
+class TestConcatenateTokens(unittest.TestCase):
+    def test_concatenate(self):
+        first = CompactTokens.from_lists([["a", "b"], [], ["b"]])
+        second = CompactTokens.from_lists([["c", "a"], ["b", "c"]])
+        tokens = CompactTokens.concatenate([first, second[1:]])
+        self.assertEqual(tokens.tolist(), [["a", "b"], [], ["b"], ["b", "c"]])
+        self.assertEqual(len(tokens.vocabulary), 3)
+
+        tokens = CompactTokens.concatenate([first, second[:0], second])
+        self.assertEqual(tokens.tolist(), first.tolist() + second.tolist())
+        self.assertEqual(CompactTokens.concatenate([]).tolist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
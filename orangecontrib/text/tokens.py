@@ -0,0 +1,271 @@
+from copy import copy
+from numbers import Integral
+from typing import Iterable, List, Optional, Union, Iterator
+
+import numpy as np
+
+__all__ = ["CompactTokens", "DocumentFrequencies"]
+
+
+class CompactTokens:
+    """
+    Lists of tokens (or POS tags) of documents stored in a compact form.
+
+    Tokens are interned into a vocabulary and stored as a flat array of
+    vocabulary indices; document i consists of tokens
+    ids[offsets[i]:offsets[i + 1]]. A token thus takes four bytes instead
+    of a Python string in a Python list.
+
+    Indexing with an integer returns a list of document's tokens, indexing
+    with a slice, list of indices or a boolean mask returns CompactTokens
+    with selected documents; contiguous slices share the underlying arrays.
+
+    Parameters
+    ----------
+    ids
+        Indices of tokens in the vocabulary for all documents.
+    offsets
+        Start of each document in ids with the end of the last document
+        appended; its length is the number of documents + 1.
+    vocabulary
+        Array of strings (object dtype) that ids point to.
+    """
+
+    def __init__(self, ids: np.ndarray, offsets: np.ndarray, vocabulary: np.ndarray):
+        self.ids = ids
+        self.offsets = offsets
+        self.vocabulary = vocabulary
+        self.__document_frequencies = None
+
+    @classmethod
+    def from_lists(
+        cls,
+        tokens: Iterable[Iterable[str]],
+        vocabulary: Optional[Iterable[str]] = None,
+    ) -> "CompactTokens":
+        """
+        Intern lists of tokens.
+
+        Parameters
+        ----------
+        tokens
+            List of documents' tokens.
+        vocabulary
+            Initial vocabulary; tokens that are not in the vocabulary are
+            appended to it.
+        """
+        tokens = list(tokens)
+        index = {} if vocabulary is None else {w: i for i, w in enumerate(vocabulary)}
+        ids = np.fromiter(
+            (index.setdefault(t, len(index)) for doc in tokens for t in doc),
+            dtype=np.int32,
+        )
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens)),
+                  out=offsets[1:])
+        vocab = np.empty(len(index), dtype=object)
+        vocab[:] = list(index)
+        return cls(ids, offsets, vocab)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """ Number of tokens in each document """
+        return np.diff(self.offsets)
+
+    def document_ids(self, i: int) -> np.ndarray:
+        """ Vocabulary indices of i-th document's tokens """
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(
+        self, key: Union[int, slice, range, List[int], np.ndarray]
+    ) -> Union[List[str], "CompactTokens"]:
+        if isinstance(key, Integral):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("Document index out of range")
+            return self.vocabulary[self.document_ids(key)].tolist()
+        if isinstance(key, slice) and key.step in (None, 1):
+            start, stop, _ = key.indices(len(self))
+            stop = max(start, stop)
+            offsets = self.offsets[start:stop + 1]
+            # a view of ids; offsets are shifted to start at 0
+            return CompactTokens(
+                self.ids[offsets[0]:offsets[-1]], offsets - offsets[0], self.vocabulary
+            )
+        indices = np.arange(len(self))[key]
+        lengths = self.lengths[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # index of each selected token in self.ids
+        positions = np.repeat(self.offsets[:-1][indices] - offsets[:-1], lengths)
+        positions += np.arange(offsets[-1], dtype=np.int64)
+        return CompactTokens(self.ids[positions], offsets, self.vocabulary)
+
+    def __iter__(self) -> Iterator[List[str]]:
+        words = self.vocabulary
+        for s, e in zip(self.offsets[:-1], self.offsets[1:]):
+            yield words[self.ids[s:e]].tolist()
+
+    def tolist(self) -> List[List[str]]:
+        """ Documents' tokens as a list of lists """
+        return list(self)
+
+    def map_vocabulary(self, words: List[str]) -> "CompactTokens":
+        """
+        Replace each vocabulary word with the corresponding word from words;
+        words that become equal are merged. Documents' ids are remapped with
+        a single array indexing.
+        """
+        index = {}
+        mapping = np.fromiter((index.setdefault(w, len(index)) for w in words),
+                              dtype=np.int32, count=len(words))
+        vocabulary = np.empty(len(index), dtype=object)
+        vocabulary[:] = list(index)
+        return CompactTokens(mapping[self.ids], self.offsets, vocabulary)
+
+    @classmethod
+    def concatenate(cls, parts: Iterable["CompactTokens"]) -> "CompactTokens":
+        """
+        Documents of all parts, one after another. Vocabularies are merged;
+        ids of each part are remapped with a single array indexing.
+        """
+        index = {}
+        ids = [np.zeros(0, dtype=np.int32)]
+        offsets = [np.zeros(1, dtype=np.int64)]
+        total = 0
+        for part in parts:
+            mapping = np.fromiter(
+                (index.setdefault(w, len(index)) for w in part.vocabulary),
+                dtype=np.int32, count=len(part.vocabulary))
+            start, end = int(part.offsets[0]), int(part.offsets[-1])
+            ids.append(mapping[part.ids[start:end]])
+            offsets.append(part.offsets[1:] - start + total)
+            total += end - start
+        vocabulary = np.empty(len(index), dtype=object)
+        vocabulary[:] = list(index)
+        return cls(np.concatenate(ids), np.concatenate(offsets), vocabulary)
+
+    def compress(self, keep: np.ndarray,
+                 words: Optional[np.ndarray] = None) -> "CompactTokens":
+        """
+        Keep tokens where keep (a boolean mask over ids of all documents) is
+        True; documents' offsets are shifted accordingly.
+
+        If keep removes entire words, words is the mask over the vocabulary
+        from which keep was computed; document frequencies of the remaining
+        words are then unchanged and need not be recomputed.
+        """
+        kept = np.zeros(len(keep) + 1, dtype=np.int64)
+        np.cumsum(keep, out=kept[1:])
+        compressed = CompactTokens(self.ids[keep], kept[self.offsets], self.vocabulary)
+        if words is not None and self.__document_frequencies is not None:
+            compressed.__document_frequencies = \
+                self.__document_frequencies.restrict(words)
+        return compressed
+
+    def document_frequencies(self) -> "DocumentFrequencies":
+        """ Document frequencies of vocabulary words; computed once """
+        if self.__document_frequencies is None:
+            self.__document_frequencies = DocumentFrequencies(self)
+        return self.__document_frequencies
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # cached frequencies are cheap to recompute
+        state["_CompactTokens__document_frequencies"] = None
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_CompactTokens__document_frequencies", None)
+        self.__dict__.update(state)
+
+    def count_unique(self) -> int:
+        """ Number of distinct tokens used in documents """
+        return int(np.count_nonzero(np.bincount(self.ids, minlength=len(self.vocabulary))))
+
+    def __repr__(self) -> str:
+        return (f"CompactTokens(documents={len(self)}, tokens={len(self.ids)}, "
+                f"vocabulary={len(self.vocabulary)})")
+
+
+class DocumentFrequencies:
+    """
+    Document and collection frequencies of words of CompactTokens, computed
+    with a single vectorized pass over token ids.
+
+    Attributes
+    ----------
+    vocabulary
+        Words (tokens' vocabulary).
+    dfs
+        Number of documents in which each word appears.
+    cfs
+        Number of occurrences of each word.
+    first_doc
+        Index of the first document with the word or the number of
+        documents for words that do not appear.
+    num_docs
+        Number of documents.
+    """
+
+    def __init__(self, tokens: CompactTokens):
+        n_words = len(tokens.vocabulary)
+        self.vocabulary = tokens.vocabulary
+        self.num_docs = len(tokens)
+        self.cfs = np.bincount(tokens.ids, minlength=n_words)
+        self.dfs = np.zeros(n_words, dtype=np.int64)
+        self.first_doc = np.full(n_words, self.num_docs, dtype=np.int64)
+        if len(tokens.ids):
+            docs = np.repeat(np.arange(self.num_docs, dtype=np.int64), tokens.lengths)
+            # distinct (document, word) pairs, sorted by documents
+            pairs = np.unique(docs * n_words + tokens.ids)
+            words = pairs % n_words
+            self.dfs = np.bincount(words, minlength=n_words)
+            present, first = np.unique(words, return_index=True)
+            self.first_doc[present] = pairs[first] // n_words
+
+    def restrict(self, words: np.ndarray) -> "DocumentFrequencies":
+        """ Frequencies after removing all occurrences of words not in mask """
+        restricted = copy(self)
+        restricted.dfs = np.where(words, self.dfs, 0)
+        restricted.cfs = np.where(words, self.cfs, 0)
+        restricted.first_doc = np.where(words, self.first_doc, self.num_docs)
+        return restricted
+
+    @property
+    def term_ids(self) -> np.ndarray:
+        """
+        Ids that gensim's Dictionary built from documents assigns to words:
+        words get consecutive ids in order of documents where they first
+        appear and alphabetically within a document. Words that do not
+        appear in documents get -1.
+        """
+        n_words = len(self.vocabulary)
+        alphabetical = np.empty(n_words, dtype=np.int64)
+        alphabetical[np.argsort(self.vocabulary, kind="stable")] = np.arange(n_words)
+        term_ids = np.empty(n_words, dtype=np.int64)
+        term_ids[np.lexsort((alphabetical, self.first_doc))] = np.arange(n_words)
+        term_ids[self.cfs == 0] = -1
+        return term_ids
+
+    def select(self, no_below: int = 0, no_above: float = 1.,
+               keep_n: Optional[int] = None) -> np.ndarray:
+        """
+        Mask of words that appear in at least no_below and at most in
+        no_above (a fraction) of documents; with keep_n, only the keep_n
+        most frequent of them are kept. This is the same selection as by
+        gensim's Dictionary.filter_extremes.
+        """
+        no_above_abs = int(no_above * self.num_docs)
+        good = (self.cfs > 0) & (self.dfs >= no_below) & (self.dfs <= no_above_abs)
+        if keep_n is not None:
+            candidates = np.flatnonzero(good)
+            # by decreasing frequency; ties in the order of gensim's ids
+            order = np.lexsort((self.term_ids[candidates], -self.dfs[candidates]))
+            good = np.zeros(len(good), dtype=bool)
+            good[candidates[order[:keep_n]]] = True
+        return good
@@ -4,10 +4,11 @@ from typing import Union, List, Callable, Any, Tuple, Optional
 
 import numpy as np
 import scipy.sparse as sp
-from Orange.data import Domain, DiscreteVariable
+from Orange.data import Domain
 from gensim.matutils import Sparse2Corpus
 
 from orangecontrib.text import Corpus
+from orangecontrib.text.corpus import columns_from_documents
 from orangecontrib.text.language import infer_language_from_variable
 
 
@@ -139,26 +140,13 @@ def create_corpus(
     for ind in title_indices:
         domain[ind].attributes["title"] = True
 
-    def to_val(attr, val):
-        if isinstance(attr, DiscreteVariable):
-            attr.val_from_str_add(val)
-        return attr.to_val(val)
-
-    X = [
-        [to_val(a, f(doc)) for a, (_, f) in zip(domain.class_vars, attributes)]
-        for doc in documents
-    ]
-    Y = [
-        [to_val(a, f(doc)) for a, (_, f) in zip(domain.class_vars, class_vars)]
-        for doc in documents
-    ]
-    metas = [
-        [to_val(a, f(doc)) for a, (_, f) in zip(domain.metas, metas)]
-        for doc in documents
-    ]
-    X = np.array(X, dtype=np.float64)
-    Y = np.array(Y, dtype=np.float64)
-    metas = np.array(metas, dtype=object)
+    documents = list(documents)
+    X = columns_from_documents(
+        documents, [(a, f) for a, (_, f) in zip(domain.attributes, attributes)])
+    Y = columns_from_documents(
+        documents, [(a, f) for a, (_, f) in zip(domain.class_vars, class_vars)])
+    metas = columns_from_documents(
+        documents, [(a, f) for a, (_, f) in zip(domain.metas, metas)], dtype=object)
 
     language = None
     if language_attribute is not None:
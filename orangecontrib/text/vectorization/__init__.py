@@ -1,2 +1,3 @@
 from .bagofwords import BowVectorizer
+from .hashing import HashingVectorizer
 from .simhash import SimhashVectorizer
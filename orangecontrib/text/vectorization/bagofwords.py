@@ -23,15 +23,92 @@ Then create :class:`BowVectorizer` object and call transform:
 
 from collections import OrderedDict
 from functools import partial
+from typing import Dict, Optional, Tuple
 
 import numpy as np
+import scipy.sparse as sp
 from Orange.util import dummy_callback
-from gensim import corpora, models, matutils
+from gensim import corpora
 from sklearn.preprocessing import normalize
 
+from orangecontrib.text.tokens import CompactTokens
 from orangecontrib.text.vectorization.base import BaseVectorizer,\
     SharedTransform, VectorizationComputeValue
 
+# weights with smaller absolute value are omitted as in gensim's TfidfModel
+EPS = 1e-12
+
+
+def gensim_term_ids(tokens: CompactTokens) -> np.ndarray:
+    """
+    Ids that gensim's Dictionary built from documents assigns to words of
+    tokens' vocabulary: words get consecutive ids in order of documents
+    where they first appear and alphabetically within a document. Words
+    that do not appear in documents get -1.
+    """
+    return tokens.document_frequencies().term_ids
+
+
+def count_matrix(
+        tokens: CompactTokens, term_ids: np.ndarray, n_terms: int
+) -> sp.csr_matrix:
+    """
+    Documents-terms matrix of counts with sorted indices.
+
+    Parameters
+    ----------
+    tokens
+        Documents' tokens.
+    term_ids
+        Column of each word of tokens' vocabulary; words with negative ids
+        are skipped.
+    n_terms
+        Number of columns.
+    """
+    ids = term_ids[tokens.ids]
+    docs = np.repeat(np.arange(len(tokens)), tokens.lengths)
+    known = ids >= 0
+    X = sp.csr_matrix(
+        (np.ones(np.count_nonzero(known), dtype=np.int64), (docs[known], ids[known])),
+        shape=(len(tokens), n_terms)
+    )
+    X.sum_duplicates()
+    return X
+
+
+def counts_to_dictionary(
+        token2id: Dict[str, int], counts: sp.csr_matrix,
+        frequencies: Optional[Tuple[np.ndarray, np.ndarray]] = None
+) -> corpora.Dictionary:
+    """
+    Gensim's Dictionary with the same mapping and statistics as if it were
+    constructed from documents whose counts are given in the matrix.
+    Document and collection frequencies of terms are computed from counts
+    unless they are already known and given as a tuple (dfs, cfs).
+    """
+    dic = corpora.Dictionary()
+    dic.token2id = token2id
+    if frequencies is None:
+        dfs = np.bincount(counts.indices, minlength=len(token2id))
+        cfs = np.bincount(counts.indices, weights=counts.data,
+                          minlength=len(token2id))
+    else:
+        dfs, cfs = frequencies
+    dic.dfs = dict(enumerate(dfs.tolist()))
+    dic.cfs = dict(enumerate(cfs.astype(np.int64).tolist()))
+    dic.num_docs = counts.shape[0]
+    dic.num_pos = int(counts.data.sum())
+    dic.num_nnz = counts.nnz
+    return dic
+
+
+def _by_term_id(values: np.ndarray, term_ids: np.ndarray) -> np.ndarray:
+    """ Values for words of vocabulary reordered by (non-negative) term ids """
+    used = term_ids >= 0
+    ordered = np.empty(np.count_nonzero(used), dtype=values.dtype)
+    ordered[term_ids[used]] = values[used]
+    return ordered
+
 
 class BowVectorizer(BaseVectorizer):
     name = 'BoW Vectorizer'
@@ -64,30 +141,68 @@ class BowVectorizer(BaseVectorizer):
         (L2, partial(normalize, norm='l2')),
     ))
 
-    def __init__(self, norm=NONE, wlocal=COUNT, wglobal=NONE):
+    def __init__(self, norm=NONE, wlocal=COUNT, wglobal=NONE,
+                 chunk_size: Optional[int] = None):
+        """
+        Parameters
+        ----------
+        norm
+            Normalization of documents' vectors; one of keys of `norms`.
+        wlocal
+            Term frequency weighting; one of keys of `wlocals`.
+        wglobal
+            Document frequency weighting; one of keys of `wglobals`.
+        chunk_size
+            If given, documents are vectorized in chunks of chunk_size
+            documents, so lists of n-grams of only one chunk are kept in
+            memory at a time. This bounds only the memory for n-grams; the
+            corpus is still entirely in memory, and the n-grams stored as its
+            tokens are compact only if :attr:`Corpus.compact_tokens` is set.
+            The result is the same as without chunking.
+        """
         self.norm = norm
         self.wlocal = wlocal
         self.wglobal = wglobal
+        self.chunk_size = chunk_size
+
+    def __setstate__(self, state):
+        # vectorizers pickled before chunking was introduced
+        state.setdefault("chunk_size", None)
+        self.__dict__.update(state)
 
     def _transform(self, corpus, source_dict=None, callback=dummy_callback):
         if len(corpus) == 0:
             return corpus
-        temp_corpus = list(corpus.ngrams_iterator(' ', include_postags=True))
-        if not source_dict:
-            corpus.store_tokens(temp_corpus)
-            dic = corpora.Dictionary(temp_corpus, prune_at=None)
+        if self.chunk_size:
+            counts, dic = self._count_chunks(corpus, source_dict, callback)
+        elif not source_dict:
+            tokens = self._unigram_tokens(corpus)
+            if tokens is None:
+                temp_corpus = list(corpus.ngrams_iterator(' ', include_postags=True))
+                tokens = CompactTokens.from_lists(temp_corpus)
+                corpus.store_tokens(tokens if corpus.compact_tokens else temp_corpus)
+            # frequencies may have already been computed by frequency filters
+            frequencies = tokens.document_frequencies()
+            term_ids = frequencies.term_ids
+            words = _by_term_id(tokens.vocabulary, term_ids)
+            counts = count_matrix(tokens, term_ids, len(words))
+            dic = counts_to_dictionary(
+                dict(zip(words.tolist(), range(len(words)))), counts,
+                (_by_term_id(frequencies.dfs, term_ids),
+                 _by_term_id(frequencies.cfs, term_ids))
+            )
         else:
             dic = source_dict
+            tokens = CompactTokens.from_lists(
+                corpus.ngrams_iterator(' ', include_postags=True))
+            counts = count_matrix(tokens, self._source_ids(tokens, dic), len(dic))
         if len(dic) == 0:
             return corpus
         callback(0.3)
-        temp_corpus = [dic.doc2bow(doc) for doc in temp_corpus]
-        model = models.TfidfModel(dictionary=dic, normalize=False,
-                                  wlocal=self.wlocals[self.wlocal],
-                                  wglobal=self.wglobals[self.wglobal])
+        idfs = self._idfs(dic)
         callback(0.6)
 
-        X = matutils.corpus2csc(model[temp_corpus], dtype=float, num_terms=len(dic)).T
+        X = self._weight(counts, idfs)
         norm = self.norms[self.norm]
         if norm:
             X = norm(X)
@@ -100,3 +215,105 @@ class BowVectorizer(BaseVectorizer):
         corpus = self.add_features(corpus, X, dic, cv, var_attrs={'bow-feature': True})
         callback(1)
         return corpus
+
+    @staticmethod
+    def _unigram_tokens(corpus) -> Optional[CompactTokens]:
+        """
+        Compact tokens of the corpus if they are already the terms, that is,
+        if there are neither n-grams nor POS tags to join with tokens.
+        """
+        if corpus.pos_tags is None and tuple(corpus.ngram_range) == (1, 1) \
+                and isinstance(corpus.tokens, CompactTokens):
+            return corpus.tokens
+        return None
+
+    @staticmethod
+    def _source_ids(tokens: CompactTokens, dic: corpora.Dictionary) -> np.ndarray:
+        """ Ids of tokens' vocabulary in dictionary or -1 for unknown words """
+        token2id = dic.token2id
+        return np.fromiter((token2id.get(w, -1) for w in tokens.vocabulary),
+                           dtype=np.int64, count=len(tokens.vocabulary))
+
+    def _count_chunks(
+            self, corpus, source_dict: Optional[corpora.Dictionary], callback
+    ) -> Tuple[sp.csr_matrix, corpora.Dictionary]:
+        """
+        Count terms in chunks of documents. Without source dictionary, the
+        dictionary is extended with each chunk: new words get ids in the same
+        order as in a dictionary built from all documents at once. Tokens are
+        stored to the corpus, with dictionary's ids when they are compact.
+        """
+        token2id = {} if source_dict is None else source_dict.token2id
+        blocks, ids, lengths = [], [], []
+        for start in range(0, len(corpus), self.chunk_size):
+            chunk = corpus[start:start + self.chunk_size]
+            tokens = CompactTokens.from_lists(
+                chunk.ngrams_iterator(' ', include_postags=True))
+            if source_dict is not None:
+                blocks.append(count_matrix(
+                    tokens, self._source_ids(tokens, source_dict), len(token2id)))
+            else:
+                term_ids = np.fromiter(
+                    (token2id.get(w, -1) for w in tokens.vocabulary),
+                    dtype=np.int64, count=len(tokens.vocabulary)
+                )
+                new = np.flatnonzero(term_ids < 0)
+                new = new[np.argsort(gensim_term_ids(tokens)[new])]
+                term_ids[new] = np.arange(len(token2id), len(token2id) + len(new))
+                token2id.update(zip(tokens.vocabulary[new].tolist(), term_ids[new].tolist()))
+                blocks.append(count_matrix(tokens, term_ids, len(token2id)))
+                ids.append(term_ids[tokens.ids].astype(np.int32))
+                lengths.append(tokens.lengths)
+            callback(0.3 * min(start + self.chunk_size, len(corpus)) / len(corpus))
+
+        for block in blocks:
+            block.resize((block.shape[0], len(token2id)))
+        counts = sp.vstack(blocks, format="csr")
+        if source_dict is not None:
+            return counts, source_dict
+
+        offsets = np.zeros(len(corpus) + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(lengths), out=offsets[1:])
+        vocabulary = np.empty(len(token2id), dtype=object)
+        vocabulary[:] = list(token2id)
+        corpus.store_tokens(CompactTokens(np.concatenate(ids), offsets, vocabulary))
+        return counts, counts_to_dictionary(token2id, counts)
+
+    def _idfs(self, dic: corpora.Dictionary) -> np.ndarray:
+        """
+        Global weights of dictionary's terms; NaN for terms without
+        document frequency. The weighting is computed once per distinct
+        document frequency with the same arguments as in gensim.
+        """
+        idfs = np.full(len(dic), np.nan)
+        if not dic.dfs:
+            return idfs
+        terms = np.fromiter(dic.dfs.keys(), dtype=np.int64, count=len(dic.dfs))
+        dfs = np.fromiter(dic.dfs.values(), dtype=np.int64, count=len(dic.dfs))
+        inside = terms < len(dic)
+        idfs[terms[inside]] = self._global_weights(dfs[inside], dic.num_docs)
+        return idfs
+
+    def _global_weights(self, dfs: np.ndarray, num_docs: int) -> np.ndarray:
+        """ Global weights for document frequencies dfs """
+        unique_dfs, inverse = np.unique(dfs, return_inverse=True)
+        wglobal = self.wglobals[self.wglobal]
+        weights = np.array([wglobal(df, num_docs) for df in unique_dfs.tolist()],
+                           dtype=float)
+        return weights[inverse.reshape(-1)]
+
+    def _weight(self, counts: sp.csr_matrix, idfs: np.ndarray) -> sp.csr_matrix:
+        """
+        Apply local and global weighting to the counts matrix and remove
+        near-zero weights the same way as gensim's TfidfModel does.
+        """
+        idf = idfs[counts.indices]
+        weights = self.wlocals[self.wlocal](counts.data) * idf
+        keep = (np.abs(idf) > EPS) & (np.abs(weights) > EPS)
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        indptr = np.zeros(counts.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[keep], minlength=counts.shape[0]), out=indptr[1:])
+        return sp.csr_matrix(
+            (weights[keep].astype(float), counts.indices[keep], indptr),
+            shape=counts.shape
+        )
@@ -72,10 +72,13 @@ class SharedTransform:
     @staticmethod
     def __hashable_dict(kwargs: Dict) -> Dict:
         """
-        Gensim Dictionary is not hashable. Replace Dictionary with its id when
-        in kwargs
+        Gensim Dictionary and numpy arrays are not hashable. Replace them with
+        their ids when in kwargs
         """
-        return {k: (id(v) if isinstance(v, Dictionary) else v) for k, v in kwargs.items()}
+        return {
+            k: (id(v) if isinstance(v, (Dictionary, np.ndarray)) else v)
+            for k, v in kwargs.items()
+        }
 
     def __eq__(self, other):
         kwargs1 = self.__hashable_dict(self.kwargs)
@@ -0,0 +1,118 @@
+""" This module constructs a new corpus with hashed tokens as features.
+
+Unlike :class:`~orangecontrib.text.vectorization.bagofwords.BowVectorizer`,
+which creates a feature for every term in the corpus, hashing vectorizer
+maps terms into a fixed number of columns with a hash function. It does not
+need to store a dictionary and the size of the domain does not depend on the
+size of the vocabulary:
+
+    >>> from orangecontrib.text import Corpus
+    >>> from orangecontrib.text.vectorization import HashingVectorizer
+    >>> corpus = Corpus.from_file('deerwester')
+    >>> hashed = HashingVectorizer(n_features=256).transform(corpus)
+    >>> len(hashed.domain.attributes)
+    256
+
+"""
+import numpy as np
+from Orange.util import dummy_callback
+from sklearn.feature_extraction import FeatureHasher
+
+from orangecontrib.text.tokens import CompactTokens
+from orangecontrib.text.vectorization.bagofwords import BowVectorizer, count_matrix
+from orangecontrib.text.vectorization.base import SharedTransform, \
+    VectorizationComputeValue
+
+__all__ = ["HashingVectorizer"]
+
+
+class HashingVectorizer(BowVectorizer):
+    name = "Hashing Vectorizer"
+
+    def __init__(self, n_features=2 ** 14, norm=BowVectorizer.NONE,
+                 wlocal=BowVectorizer.COUNT, wglobal=BowVectorizer.NONE):
+        """
+        Parameters
+        ----------
+        n_features
+            Number of columns that terms are hashed to.
+        norm
+            Normalization of documents' vectors; one of keys of `norms`.
+        wlocal
+            Term frequency weighting; one of keys of `wlocals`.
+        wglobal
+            Document frequency weighting; one of keys of `wglobals`.
+            Document frequencies of columns are computed on the corpus
+            that is transformed first and reused for new documents.
+        """
+        super().__init__(norm=norm, wlocal=wlocal, wglobal=wglobal)
+        self.n_features = n_features
+
+    def transform(self, corpus, copy=True, dfs=None, num_docs=None,
+                  callback=dummy_callback):
+        """
+        Transform a corpus to a new one with hashed features.
+
+        Parameters
+        ----------
+        corpus
+            Corpus to transform.
+        copy
+            If False, the corpus's tokens may be changed in place.
+        dfs
+            Document frequencies of columns; if None, they are computed from
+            the corpus.
+        num_docs
+            Number of documents dfs were computed from.
+        callback
+            Progress callback.
+        """
+        if copy:
+            corpus = corpus.copy()
+        return self._transform(corpus, dfs, num_docs, callback)
+
+    def _transform(self, corpus, dfs=None, num_docs=None, callback=dummy_callback):
+        if len(corpus) == 0:
+            return corpus
+        temp_corpus = list(corpus.ngrams_iterator(' ', include_postags=True))
+        tokens = CompactTokens.from_lists(temp_corpus)
+        if dfs is None:
+            corpus.store_tokens(tokens if corpus.compact_tokens else temp_corpus)
+        callback(0.3)
+
+        # each word of the vocabulary is hashed once
+        hasher = FeatureHasher(self.n_features, input_type="string",
+                               alternate_sign=False)
+        columns = hasher.transform([w] for w in tokens.vocabulary).indices
+        counts = count_matrix(tokens, columns.astype(np.int64), self.n_features)
+        if dfs is None:
+            dfs = np.bincount(counts.indices, minlength=self.n_features)
+            num_docs = len(corpus)
+        callback(0.6)
+
+        idfs = np.full(self.n_features, np.nan)
+        present = dfs > 0
+        idfs[present] = self._global_weights(dfs[present], num_docs)
+        X = self._weight(counts, idfs)
+        norm = self.norms[self.norm]
+        if norm:
+            X = norm(X)
+        callback(0.9)
+
+        shared_cv = SharedTransform(self, corpus.used_preprocessor,
+                                    dfs=dfs, num_docs=num_docs)
+        names = [f"hash_{i + 1}" for i in range(self.n_features)]
+        cv = [VectorizationComputeValue(shared_cv, name) for name in names]
+        corpus = corpus.extend_attributes(
+            X, feature_names=names, compute_values=cv,
+            var_attrs={'hidden': True, 'skip-normalization': True},
+            sparse=True, rename_existing=True
+        )
+        callback(1)
+        return corpus
+
+    def report(self):
+        return (('Number of features', self.n_features),
+                ('Term frequency', self.wlocal),
+                ('Document frequency', self.wglobal),
+                ('Regularization', self.norm))
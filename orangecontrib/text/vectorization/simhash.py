@@ -1,14 +1,36 @@
+from hashlib import md5
+from typing import Optional
+
 import nltk
 from Orange.util import dummy_callback
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from simhash import Simhash
 import numpy as np
 
 from orangecontrib.text.vectorization.base import BaseVectorizer
 
+# number of set bits in each byte; used when numpy lacks bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    """ Number of set bits in each element of an unsigned integer array """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    x = np.ascontiguousarray(x)
+    return _POPCOUNT[x.view(np.uint8)].reshape(x.shape + (-1,)).sum(axis=-1)
+
+
+def _md5(value: bytes) -> bytes:
+    # the default hash function of the simhash package
+    return md5(value).digest()
+
 
 class SimhashVectorizer(BaseVectorizer):
     name = "Simhash"
     max_f = 1024
+    chunk_size = 10000  # number of documents whose bit votes are summed at once
 
     def __init__(self, shingle_len=10, f=64, hashfunc=None):
         """
@@ -37,6 +59,87 @@ class SimhashVectorizer(BaseVectorizer):
     def int2binarray(self, num):
         return [int(x) for x in self._bin_format.format(num)]
 
+    def _shingle_counts(self, corpus, callback):
+        """ Count shingles in documents; returns a sparse document-shingle
+        matrix and a list of shingles in the order of columns """
+        vocabulary = {}
+        indices, indptr = [], [0]
+        for i, doc in enumerate(corpus.tokens):
+            for shingle in self.get_shingles(doc, self.ngram_len):
+                indices.append(vocabulary.setdefault(shingle, len(vocabulary)))
+            indptr.append(len(indices))
+            callback(i / len(corpus))
+        counts = csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr),
+            shape=(len(corpus), len(vocabulary)))
+        counts.sum_duplicates()
+        return counts, list(vocabulary)
+
+    def _shingle_bits(self, shingles) -> np.ndarray:
+        """ Hash each shingle once; returns an array of f bits per shingle
+        with the most significant bit first """
+        n_bytes = -(-self.f // 8)
+        mask = (1 << self.f) - 1
+        hashfunc = self.hashfunc or _md5
+
+        def hash_bytes(shingle):
+            # like simhash, accept hash functions returning bytes or integers
+            h = hashfunc(shingle.encode("utf-8"))
+            if isinstance(h, bytes):
+                return h[-n_bytes:].rjust(n_bytes, b"\0")
+            return (h & mask).to_bytes(n_bytes, "big")
+
+        buffer = b"".join(map(hash_bytes, shingles))
+        hashes = np.frombuffer(buffer, dtype=np.uint8).reshape(len(shingles), n_bytes)
+        return np.unpackbits(hashes, axis=1)[:, 8 * n_bytes - self.f:]
+
+    def _pack(self, bits: np.ndarray) -> np.ndarray:
+        if self.f <= 64:
+            padded = np.zeros((len(bits), 64), dtype=np.uint8)
+            padded[:, 64 - self.f:] = bits
+            return np.packbits(padded, axis=1).view(">u8").reshape(-1)\
+                .astype(np.uint64)
+        return np.packbits(bits, axis=1)
+
+    def fingerprints(self, corpus, callback=dummy_callback) -> np.ndarray:
+        """
+        Compute packed fingerprints of documents.
+
+        Shingles are hashed once per corpus. Each bit of a fingerprint is
+        set when the majority of document's shingles have it set, which
+        gives the same fingerprints as the simhash package.
+
+        Returns
+        -------
+        np.ndarray
+            For f <= 64 an array of uint64 fingerprints; otherwise an array
+            of shape (len(corpus), ceil(f / 8)) with fingerprints' bits packed
+            into uint8 as by np.packbits.
+        """
+        counts, shingles = self._shingle_counts(corpus, callback)
+        shingle_bits = self._shingle_bits(shingles)
+        n_shingles = np.asarray(counts.sum(axis=1))
+        chunks = []
+        for start in range(0, len(corpus), self.chunk_size):
+            end = start + self.chunk_size
+            votes = counts[start:end] @ shingle_bits
+            chunks.append(self._pack(2 * votes > n_shingles[start:end]))
+        if not chunks:
+            return self._pack(np.zeros((0, self.f), dtype=np.uint8))
+        return np.concatenate(chunks)
+
+    def unpack(self, fingerprints: np.ndarray) -> np.ndarray:
+        """
+        Unpack fingerprints as returned by :meth:`fingerprints` into an
+        array of shape (len(fingerprints), f) with bits as uint8, the most
+        significant bit first.
+        """
+        if fingerprints.ndim == 1:
+            fingerprints = fingerprints.astype(">u8").view(np.uint8)\
+                .reshape(len(fingerprints), 8)
+            return np.unpackbits(fingerprints, axis=1)[:, 64 - self.f:]
+        return np.unpackbits(fingerprints, axis=1)[:, :self.f]
+
     def _transform(self, corpus, _, callback=dummy_callback):
         """ Computes simhash values from the given corpus
         and creates a new one with a simhash attribute.
@@ -49,11 +152,7 @@ class SimhashVectorizer(BaseVectorizer):
         """
         if not len(corpus):
             return corpus
-        hashes = []
-        for i, doc in enumerate(corpus.tokens):
-            hashes.append(self.int2binarray(self.compute_hash(doc)))
-            callback(i / len(corpus))
-        X = np.array(hashes, dtype=float)
+        X = self.unpack(self.fingerprints(corpus, callback)).astype(float)
         corpus = corpus.extend_attributes(
             X,
             feature_names=[
@@ -66,3 +165,136 @@ class SimhashVectorizer(BaseVectorizer):
     def report(self):
         return (('Hash length', self.f),
                 ('Shingle length', self.ngram_len))
+
+
+class SimhashIndex:
+    """
+    Index of simhash fingerprints for finding near-duplicate documents
+    without computing distances between all pairs of documents.
+
+    Fingerprints are split into bands of bits. Fingerprints that differ in at
+    most max_distance bits agree in at least one of max_distance + 1 bands,
+    so only fingerprints that share a band are compared and their Hamming
+    distance is computed with popcount. With fewer bands some duplicates
+    may be missed.
+
+    Parameters
+    ----------
+    fingerprints
+        Fingerprints as returned by :meth:`SimhashVectorizer.fingerprints`:
+        an array of uint64 or 2-d array of bits packed into uint8.
+    f
+        Number of bits of fingerprints; defaults to 64 for uint64
+        fingerprints and to the number of bits in packed fingerprints.
+    max_distance
+        Maximal Hamming distance between fingerprints of duplicates.
+    n_bands
+        Number of bands; defaults to max_distance + 1.
+    """
+    def __init__(self, fingerprints: np.ndarray, f: Optional[int] = None,
+                 max_distance: int = 3, n_bands: Optional[int] = None):
+        fingerprints = np.asarray(fingerprints)
+        if fingerprints.ndim == 1:
+            # big-endian bytes give bits in the same order as packbits
+            fingerprints = fingerprints.astype(">u8").view(np.uint8)\
+                .reshape(len(fingerprints), 8)
+            f = f or 64
+            fingerprints = np.packbits(
+                np.unpackbits(fingerprints, axis=1)[:, 64 - f:], axis=1)
+        f = f or 8 * fingerprints.shape[1]
+        if max_distance < 0:
+            raise ValueError("Maximal distance must be non-negative.")
+        n_bands = n_bands or max_distance + 1
+        if not 0 < n_bands <= f:
+            raise ValueError(f"Number of bands must be between 1 and {f}.")
+        self.f = f
+        self.max_distance = max_distance
+        self.n_bands = n_bands
+
+        # identical fingerprints are compared only once
+        self.__n_bytes = fingerprints.shape[1]
+        unique, self.__inverse = np.unique(
+            self.__as_void(fingerprints), return_inverse=True)
+        self.__unique = unique.view(np.uint8).reshape(len(unique), -1)
+        self.__inverse = self.__inverse.reshape(-1)
+
+    @staticmethod
+    def __as_void(array: np.ndarray) -> np.ndarray:
+        array = np.ascontiguousarray(array)
+        return array.view(np.dtype((np.void, array.shape[1]))).reshape(-1)
+
+    def __words(self) -> np.ndarray:
+        """ Unique fingerprints as rows of uint64 words for popcount """
+        n_words = -(-self.__n_bytes // 8)
+        words = np.zeros((len(self.__unique), 8 * n_words), dtype=np.uint8)
+        words[:, :self.__n_bytes] = self.__unique
+        return words.view(np.uint64)
+
+    def __candidates(self) -> np.ndarray:
+        """ Pairs of unique fingerprints that share at least one band """
+        bits = np.unpackbits(self.__unique, axis=1)[:, :self.f]
+        bounds = np.linspace(0, self.f, self.n_bands + 1).astype(int)
+        pairs = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            keys = self.__as_void(np.packbits(bits[:, start:end], axis=1))
+            _, groups = np.unique(keys, return_inverse=True)
+            order = np.argsort(groups.reshape(-1), kind="stable")
+            pairs.append(self.__group_pairs(order, groups.reshape(-1)[order]))
+        if not pairs:
+            return np.empty((2, 0), dtype=np.int64)
+        first, second = np.sort(np.hstack(pairs), axis=0)
+        # pairs as single integers are deduplicated much faster than columns
+        n = len(self.__unique)
+        keys = np.unique(first.astype(np.int64) * n + second)
+        return np.vstack((keys // n, keys % n))
+
+    @staticmethod
+    def __group_pairs(order: np.ndarray, groups: np.ndarray) -> np.ndarray:
+        """
+        All pairs of members of each group, where members of a group are
+        consecutive in order and groups are their sorted group indices.
+        The work is proportional to the number of pairs.
+        """
+        n = len(order)
+        if n == 0:
+            return np.empty((2, 0), dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        # number of later members of the same group for each position
+        counts = np.repeat(starts + sizes, sizes) - np.arange(n) - 1
+        first = np.repeat(np.arange(n), counts)
+        within = np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.vstack((order[first], order[first + 1 + within]))
+
+    def pairs(self) -> np.ndarray:
+        """
+        Return pairs of distinct fingerprints within max_distance as a 2 x k
+        array of indices of unique fingerprints (see :meth:`clusters`).
+        """
+        first, second = self.__candidates()
+        words = self.__words()
+        distances = popcount(words[first] ^ words[second]).sum(axis=1)
+        close = distances <= self.max_distance
+        return np.vstack((first[close], second[close]))
+
+    def clusters(self) -> np.ndarray:
+        """
+        Cluster documents into groups of near-duplicates: documents are in
+        the same cluster if they are connected through pairs within
+        max_distance.
+
+        Returns
+        -------
+        np.ndarray
+            Cluster index for each document; clusters are numbered in the
+            order of their first document.
+        """
+        first, second = self.pairs()
+        n = len(self.__unique)
+        graph = csr_matrix((np.ones(len(first)), (first, second)), shape=(n, n))
+        _, labels = connected_components(graph, directed=False)
+        labels = labels[self.__inverse]
+        _, first_doc = np.unique(labels, return_index=True)
+        renumber = np.empty(len(first_doc), dtype=int)
+        renumber[np.argsort(first_doc)] = np.arange(len(first_doc))
+        return renumber[labels]
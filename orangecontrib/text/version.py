@@ -0,0 +1,10 @@
+
+# THIS FILE IS GENERATED FROM ORANGE3-TEXT SETUP.PY
+short_version = '1.16.2'
+version = '1.16.2'
+full_version = '1.16.2'
+git_revision = 'd694ff9fec87d73183df5efb1da48a2056ebdeb8'
+release = True
+if not release:
+    version = full_version
+    short_version += ".dev"
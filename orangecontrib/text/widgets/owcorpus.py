@@ -17,6 +17,7 @@ from orangecanvas.gui.utils import disconnected
 from orangewidget.settings import ContextHandler
 
 from orangecontrib.text.corpus import Corpus, get_sample_corpora_dir
+from orangecontrib.text.snapshot import SNAPSHOT_EXTENSION, is_snapshot
 from orangecontrib.text.language import (
     detect_language,
     LanguageModel,
@@ -100,10 +101,11 @@ class OWCorpus(OWWidget, ConcurrentWidgetMixin):
 
     dlgFormats = (
         "All readable files ({});;".format(
-            '*' + ' *'.join(FileFormat.readers.keys())) +
+            '*' + ' *'.join(list(FileFormat.readers.keys()) + [SNAPSHOT_EXTENSION])) +
         ";;".join("{} (*{})".format(f.DESCRIPTION, ' *'.join(f.EXTENSIONS))
                   for f in sorted(set(FileFormat.readers.values()),
-                                  key=list(FileFormat.readers.values()).index)))
+                                  key=list(FileFormat.readers.values()).index)) +
+        ";;Corpus snapshot (*{})".format(SNAPSHOT_EXTENSION))
 
     settingsHandler = CorpusContextHandler()
     settings_version = 2
@@ -224,7 +226,10 @@ class OWCorpus(OWWidget, ConcurrentWidgetMixin):
         if data:
             corpus = Corpus.from_table(data.domain, data)
         elif path:
-            corpus = Corpus.from_file(path)
+            if is_snapshot(path):
+                corpus = Corpus.open_snapshot(path)
+            else:
+                corpus = Corpus.from_file(path)
             if not hasattr(corpus, "name") or not corpus.name:
                 corpus.name = os.path.splitext(os.path.basename(path))[0]
         return corpus
@@ -9,12 +9,30 @@ from Orange.clustering.hierarchical import dist_matrix_linkage
 from Orange.data import Table, DiscreteVariable, Domain
 from Orange.misc import DistMatrix
 from Orange.widgets import gui, widget, settings
+from Orange.widgets.utils.concurrent import ConcurrentWidgetMixin, TaskState
 from Orange.widgets.utils.itemmodels import PyTableModel
 from Orange.widgets.widget import Msg, OWWidget, Input, Output
 from orangecontrib.text import Corpus
+from orangecontrib.text.vectorization.simhash import SimhashIndex, \
+    SimhashVectorizer
 
 
-class OWDuplicates(widget.OWWidget):
+def run_simhash(corpus: Corpus, shingle_len: int, max_distance: int,
+                state: TaskState) -> np.ndarray:
+    """ Cluster documents with simhash index; runs in a separate thread """
+    def callback(i: float):
+        state.set_progress_value(i * 100)
+        if state.is_interruption_requested():
+            raise Exception
+
+    # simhash index finds near-duplicates without a distance matrix
+    vectorizer = SimhashVectorizer(shingle_len=shingle_len, f=64)
+    fingerprints = vectorizer.fingerprints(corpus, callback)
+    index = SimhashIndex(fingerprints, f=64, max_distance=max_distance)
+    return index.clusters()
+
+
+class OWDuplicates(widget.OWWidget, ConcurrentWidgetMixin):
     name = 'Duplicate Detection'
     description = 'Detect & remove duplicates from a corpus.'
     icon = 'icons/Duplicates.svg'
@@ -23,6 +41,7 @@ class OWDuplicates(widget.OWWidget):
 
     class Inputs:
         distances = Input("Distances", DistMatrix)
+        corpus = Input("Corpus", Corpus)
 
     class Outputs:
         corpus_without_duplicates = Output("Corpus Without Duplicates",
@@ -36,17 +55,27 @@ class OWDuplicates(widget.OWWidget):
         dist_matrix_invalid_shape = Msg('Duplicate detection only supports '
                                         'distances calculated between rows.')
         too_little_documents = Msg('More than one document is required.')
+        no_corpus = Msg('Simhash index requires a corpus on input.')
+
+    METHODS = ['Hierarchical clustering', 'Simhash index']
+    HIERARCHICAL, SIMHASH = range(2)
+    method = settings.Setting(HIERARCHICAL)
 
     LINKAGE = ['Single', 'Average', 'Complete', 'Weighted', 'Ward']
     linkage_method = settings.Setting(1)
 
     threshold = settings.Setting(.0)
 
+    max_distance = settings.Setting(3)
+    shingle_len = settings.Setting(10)
+
     def __init__(self):
         super().__init__()
+        ConcurrentWidgetMixin.__init__(self)
         self.corpus = None  # corpus taken from distances
         self.linkage = None  # hierarchical clustering linkage as returned by Orange
         self.distances = None  # DistMatrix on input
+        self.input_corpus = None  # Corpus on input, used by simhash index
         self.clustering_mask = None  # 1D array of clusters for self.corpus
         self.threshold_spin = None
 
@@ -77,8 +106,11 @@ class OWDuplicates(widget.OWWidget):
         main_area.layout().addWidget(self.table_view)
 
         # Controls
-        gui.comboBox(self.controlArea, self, 'linkage_method', items=self.LINKAGE, box='Linkage',
-                     callback=self.recalculate_linkage, orientation=Qt.Horizontal)
+        gui.comboBox(self.controlArea, self, 'method', items=self.METHODS, box='Method',
+                     callback=self.update_clustering, orientation=Qt.Horizontal)
+        self.linkage_combo = gui.comboBox(
+            self.controlArea, self, 'linkage_method', items=self.LINKAGE, box='Linkage',
+            callback=self.recalculate_linkage, orientation=Qt.Horizontal)
         self.threshold_spin = gui.doubleSpin(self.controlArea, self, 'threshold',
                                              0, float('inf'), 0.01, decimals=2,
                                              label='Distance threshold', box='Distances',
@@ -86,12 +118,21 @@ class OWDuplicates(widget.OWWidget):
                                              keyboardTracking=False, controlWidth=60)
         self.histogram.region.sigRegionChangeFinished.connect(self.threshold_from_histogram_region)
         self.threshold_spin.setEnabled(False)
+        simhash_box = gui.vBox(self.controlArea, 'Simhash')
+        gui.spin(simhash_box, self, 'shingle_len', 1, 100, label='Shingle length',
+                 callback=self.update_clustering, keyboardTracking=False,
+                 controlWidth=60)
+        gui.spin(simhash_box, self, 'max_distance', 0, 64,
+                 label='Maximal Hamming distance', callback=self.update_clustering,
+                 keyboardTracking=False, controlWidth=60)
+        self.simhash_box = simhash_box
         gui.rubber(self.controlArea)
+        self.update_controls()
 
     def reset(self):
+        self.cancel()
         self.corpus = None
         self.linkage = None
-        self.distances = None
         self.clustering_mask = None
         self.n_documents = ''
         self.n_unique = ''
@@ -101,23 +142,57 @@ class OWDuplicates(widget.OWWidget):
         self.table_model.clear()
         self.histogram.setValues([])
 
+    def update_controls(self):
+        simhash = self.method == self.SIMHASH
+        self.linkage_combo.setEnabled(not simhash)
+        # threshold is set for hierarchical clustering only
+        self.histogram.setEnabled(not simhash)
+        if simhash:
+            self.threshold_spin.setEnabled(False)
+        self.simhash_box.setEnabled(simhash)
+
     @Inputs.distances
     def set_distances(self, distances):
-        self.Error.clear()
         self.distances = distances
-        if distances is None:
-            self.reset()
-            return
 
-        self.corpus = self.distances.row_items
+    @Inputs.corpus
+    def set_corpus(self, corpus):
+        self.input_corpus = corpus
+
+    def handleNewSignals(self):
+        self.update_clustering()
+
+    def update_clustering(self):
+        self.Error.clear()
+        self.update_controls()
+        self.reset()
+        if self.method == self.SIMHASH:
+            if self.input_corpus is None:
+                if self.distances is not None:
+                    self.Error.no_corpus()
+                self.send_outputs()
+                return
+            self.corpus = self.input_corpus
+        else:
+            if self.distances is None:
+                self.send_outputs()
+                return
+            self.corpus = self.distances.row_items
+
         self.n_documents = len(self.corpus)
         if self.n_documents < 2:
             self.Error.too_little_documents()
             self.reset()
+            self.send_outputs()
             return
-        if distances.shape != (self.n_documents, self.n_documents):
+        if self.method == self.SIMHASH:
+            self.start(run_simhash, self.corpus, self.shingle_len,
+                       self.max_distance)
+            return
+        if self.distances.shape != (self.n_documents, self.n_documents):
             self.Error.dist_matrix_invalid_shape()
             self.reset()
+            self.send_outputs()
             return
         self.threshold_spin.setEnabled(True)
         self.recalculate_linkage()
@@ -132,7 +207,8 @@ class OWDuplicates(widget.OWWidget):
         self.detect_duplicates()
 
     def recalculate_linkage(self):
-        if self.distances is not None:
+        if self.distances is not None and self.method == self.HIERARCHICAL \
+                and self.corpus is not None:
             self.linkage = dist_matrix_linkage(self.distances,
                                                self.LINKAGE[self.linkage_method].lower())
 
@@ -150,12 +226,17 @@ class OWDuplicates(widget.OWWidget):
             self.detect_duplicates()
 
     def detect_duplicates(self):
-        if self.distances is not None:
+        if self.linkage is not None:
             self.cluster_linkage()
-            self.send_corpus()
-            self.send_corpus_without_duplicates()
+            self.send_outputs()
             self.fill_cluster_view()
 
+    def send_outputs(self):
+        self.send_corpus()
+        self.send_corpus_without_duplicates()
+        if self.clustering_mask is None:
+            self.Outputs.duplicates.send(None)
+
     def cluster_linkage(self):
         # cluster documents
         n = int(self.n_documents)
@@ -175,6 +256,21 @@ class OWDuplicates(widget.OWWidget):
         for i, c in enumerate(clusters.values()):
             self.clustering_mask[c] = i
 
+    def on_done(self, clustering_mask: np.ndarray):
+        self.clustering_mask = clustering_mask
+        n = int(self.n_documents)
+        self.n_unique = int(self.clustering_mask.max()) + 1
+        self.n_duplicates = n - self.n_unique
+        self.send_outputs()
+        self.fill_cluster_view()
+
+    def on_exception(self, ex: Exception):
+        raise ex
+
+    def onDeleteWidget(self):
+        self.shutdown()
+        super().onDeleteWidget()
+
     def fill_cluster_view(self):
         self.table_model.clear()
         c = Counter(self.clustering_mask)
@@ -193,9 +289,10 @@ class OWDuplicates(widget.OWWidget):
             domain = Domain(d.attributes, d.class_vars, d.metas + (cluster_var,))
 
             corpus = self.corpus.transform(domain)
-            # corpus.metas is unlockable since we added new column to metas
+            # corpus.metas is unlockable since we added new column to metas;
+            # get_column returns a copy of object metas, so set the last column
             with corpus.unlocked(corpus.metas):
-                corpus.get_column(cluster_var)[:] = self.clustering_mask
+                corpus.metas[:, -1] = self.clustering_mask
             self.Outputs.corpus.send(corpus)
         else:
             self.Outputs.corpus.send(None)
@@ -203,8 +300,7 @@ class OWDuplicates(widget.OWWidget):
     def send_corpus_without_duplicates(self):
         if self.clustering_mask is not None:
             # TODO make this more general, currently we just take the first document
-            mask = [np.where(self.clustering_mask == i)[0][0]
-                    for i in set(self.clustering_mask)]
+            _, mask = np.unique(self.clustering_mask, return_index=True)
             c = self.corpus[mask]
             c.name = '{} (Without Duplicates)'.format(self.corpus.name)
             self.Outputs.corpus_without_duplicates.send(c)
@@ -222,9 +318,14 @@ class OWDuplicates(widget.OWWidget):
         self.Outputs.duplicates.send(c)
 
     def send_report(self):
-        self.report_items((
-            ('Linkage', self.LINKAGE[self.linkage_method]),
-            ('Distance threshold', '{:.2f}'.format(self.threshold)),
+        if self.method == self.SIMHASH:
+            params = (('Method', self.METHODS[self.method]),
+                      ('Shingle length', self.shingle_len),
+                      ('Maximal Hamming distance', self.max_distance))
+        else:
+            params = (('Linkage', self.LINKAGE[self.linkage_method]),
+                      ('Distance threshold', '{:.2f}'.format(self.threshold)))
+        self.report_items(params + (
             ('Documents', self.n_documents),
             ('Unique', self.n_unique),
             ('Duplicates', self.n_duplicates),
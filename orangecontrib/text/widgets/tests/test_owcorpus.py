@@ -381,6 +381,20 @@ class TestOWCorpus(WidgetTest):
             res = self.get_output(self.widget.Outputs.corpus)
             self.assertTrue(res.has_tokens())
 
+    def test_open_snapshot(self):
+        corpus = Corpus.from_file("andersen")
+        corpus = RegexpTokenizer()(corpus)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file = os.path.join(tmp_dir, "andersen.corpus")
+            corpus.save_snapshot(file)
+            self.widget.file_widget.open_file(file)
+            self.wait_until_finished()
+
+            res = self.get_output(self.widget.Outputs.corpus)
+            self.assertEqual(len(res), len(corpus))
+            self.assertTrue(res.has_tokens())
+            self.assertEqual(res.documents, corpus.documents)
+
     def test_migrate_settings(self):
         corpus = Corpus.from_file("book-excerpts")
         self.send_signal(self.widget.Inputs.data, corpus)
@@ -4,6 +4,7 @@ from Orange.data import Table
 from Orange.distance import Euclidean
 from Orange.widgets.tests.base import WidgetTest
 
+from orangecontrib.text import Corpus
 from orangecontrib.text.widgets.owduplicates import OWDuplicates
 
 
@@ -36,6 +37,48 @@ class TestDuplicatesWidget(WidgetTest):
         out_corpus = self.get_output(self.widget.Outputs.corpus)
         self.assertIn(out_corpus.domain["Duplicates Cluster"], out_corpus.domain.metas)
 
+    def test_simhash(self):
+        corpus = Corpus.from_file('deerwester')
+        corpus = corpus[[0, 1, 2, 0, 3, 1]]
+        self.widget.method = OWDuplicates.SIMHASH
+        self.widget.shingle_len = 1
+        self.widget.max_distance = 0
+        self.send_signal(self.widget.Inputs.corpus, corpus)
+        self.wait_until_finished()
+        out_corpus = self.get_output(self.widget.Outputs.corpus)
+        clusters = out_corpus.get_column("Duplicates Cluster")
+        self.assertEqual(clusters[0], clusters[3])
+        self.assertEqual(clusters[1], clusters[5])
+        out_corpus = self.get_output(self.widget.Outputs.corpus_without_duplicates)
+        self.assertEqual(len(out_corpus), 4)
+        self.assertEqual(self.widget.n_duplicates, 2)
+
+    def test_simhash_controls(self):
+        self.send_signal(self.widget.Inputs.distances, self.distances)
+        self.assertTrue(self.widget.threshold_spin.isEnabled())
+        self.assertTrue(self.widget.histogram.isEnabled())
+
+        self.widget.controls.method.setCurrentIndex(OWDuplicates.SIMHASH)
+        self.widget.controls.method.activated.emit(OWDuplicates.SIMHASH)
+        self.assertFalse(self.widget.threshold_spin.isEnabled())
+        self.assertFalse(self.widget.histogram.isEnabled())
+        self.assertFalse(self.widget.linkage_combo.isEnabled())
+
+        self.widget.controls.method.setCurrentIndex(OWDuplicates.HIERARCHICAL)
+        self.widget.controls.method.activated.emit(OWDuplicates.HIERARCHICAL)
+        self.assertTrue(self.widget.threshold_spin.isEnabled())
+        self.assertTrue(self.widget.histogram.isEnabled())
+
+    def test_simhash_no_corpus(self):
+        self.widget.method = OWDuplicates.SIMHASH
+        self.send_signal(self.widget.Inputs.distances, self.distances)
+        self.assertTrue(self.widget.Error.no_corpus.is_shown())
+        self.assertIsNone(self.get_output(self.widget.Outputs.corpus))
+        self.widget.controls.method.setCurrentIndex(OWDuplicates.HIERARCHICAL)
+        self.widget.controls.method.activated.emit(OWDuplicates.HIERARCHICAL)
+        self.assertFalse(self.widget.Error.no_corpus.is_shown())
+        self.assertIsNotNone(self.get_output(self.widget.Outputs.corpus))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -190,5 +190,6 @@ if __name__ == "__main__":
         extras_require={
             'test': ['coverage'],
             'doc': ['sphinx', 'recommonmark', 'sphinx_rtd_theme', 'docutils'],
+            'arrow': ['pyarrow'],
         },
     )